@@ -14,25 +14,39 @@ Examples
 # -------------------------------------------------------------------------------------------------
 
 import datetime
+import json
+import logging
+import os
+import sqlite3
 import uuid
 from functools import partial
 from pathlib import Path
+from typing import Optional
 import warnings
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from iblutil.io import parquet
 from iblutil.io.hashfile import md5
 
 from one.alf.io import iter_sessions
 from one.alf.files import session_path_parts, get_alf_path
 from one.alf.spec import is_valid
+from one.util import dataset_parts, _set_dataset_parts
+from one.caching import sqlite_connect
 
-__all__ = ['make_parquet_db']
+__all__ = ['make_parquet_db', 'merge_cache_tables', 'compact_table', 'memory_usage',
+           'load_metadata', 'save_arrow', 'load_arrow', 'log_changes', 'read_changes',
+           'apply_changes', 'compact_changes', 'HashIndex']
 
 # -------------------------------------------------------------------------------------------------
 # Global variables
 # -------------------------------------------------------------------------------------------------
 
+_logger = logging.getLogger(__name__)
+
 SESSIONS_COLUMNS = (
     'id',               # int64
     'lab',
@@ -53,6 +67,14 @@ DATASETS_COLUMNS = (
     'exists',           # bool
 )
 
+CATEGORICAL_COLUMNS = {  # The string columns of each table that are stored as categoricals
+    'sessions': ('lab', 'subject', 'task_protocol', 'project'),
+    'datasets': ('session_path', 'rel_path'),
+}
+
+LOG_FIELDS = ('exists', 'hash', 'file_size')  # The datasets fields recorded in the mutation log
+ARROW_PARTS_PREFIX = '_alf_'  # The prefix of the ALF part columns saved in Arrow tables
+
 
 # -------------------------------------------------------------------------------------------------
 # Parsing util functions
@@ -261,6 +283,10 @@ def make_parquet_db(root_dir, out_dir=None, hash_ids=True, hash_files=False, lab
     fn_ses = out_dir / 'sessions.pqt'
     fn_dsets = out_dir / 'datasets.pqt'
 
+    # Store strings as categoricals (dictionary encoded) and numbers as compact dtypes
+    df_ses = compact_table(df_ses.infer_objects(), CATEGORICAL_COLUMNS['sessions'])
+    df_dsets = compact_table(df_dsets.infer_objects(), CATEGORICAL_COLUMNS['datasets'])
+
     # Parquet metadata.
     metadata = _metadata(root_dir)
 
@@ -269,3 +295,610 @@ def make_parquet_db(root_dir, out_dir=None, hash_ids=True, hash_files=False, lab
     parquet.save(fn_dsets, df_dsets, metadata)
 
     return fn_ses, fn_dsets
+
+
+def _table_id_keys(df) -> list:
+    """Return the ID column names of a cache table: either ['id_0', 'id_1'] or ['id']"""
+    int_keys = ['id_0', 'id_1']
+    return int_keys if set(int_keys) <= set(df.columns) and df[int_keys].any(axis=None) else ['id']
+
+
+def compact_table(table, categories=()) -> pd.DataFrame:
+    """
+    Reduce the memory footprint of a cache table, in place.
+
+    The given string columns are converted to categoricals and integer columns are downcast to
+    the smallest dtype that holds their values.  The ID columns are left as is.
+
+    Parameters
+    ----------
+    table : pandas.DataFrame
+        A cache table.
+    categories : tuple of str
+        The names of the columns to store as categoricals, e.g. CATEGORICAL_COLUMNS['sessions'].
+
+    Returns
+    -------
+    pandas.DataFrame
+        The same table
+    """
+    for column in categories:
+        if column in table.columns and not isinstance(table[column].dtype, pd.CategoricalDtype):
+            table[column] = table[column].astype('category')
+    for column in table.select_dtypes('integer').columns:
+        if not column.startswith(('id', 'eid')):
+            table[column] = pd.to_numeric(table[column], downcast='integer')
+    return table
+
+
+def memory_usage(table) -> pd.DataFrame:
+    """
+    Report the memory usage of each column of a cache table, compared with its uncompacted size.
+
+    Parameters
+    ----------
+    table : pandas.DataFrame
+        A cache table.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A table indexed by column name (including 'Index') with the columns 'dtype', 'bytes'
+        (the memory usage in bytes) and 'uncompacted' (the memory usage of the same values
+        stored as Python strings and 64-bit numbers).
+
+    Examples
+    --------
+    >>> report = memory_usage(one._cache['datasets'])
+    >>> print(f'{report.bytes.sum() / 2**20:.0f} MiB ({report.uncompacted.sum() / 2**20:.0f} MiB)')
+    """
+    report = []
+    for name, nbytes in table.memory_usage(deep=True).items():
+        if name == 'Index':
+            report.append((name, str(table.index.dtype), nbytes, nbytes))
+            continue
+        column = table[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            uncompacted = pd.Series(np.asarray(column, dtype=object))
+            uncompacted = uncompacted.memory_usage(deep=True, index=False)
+        elif column.dtype != bool and pd.api.types.is_numeric_dtype(column.dtype):
+            uncompacted = column.size * 8
+        else:
+            uncompacted = nbytes
+        report.append((name, str(column.dtype), nbytes, uncompacted))
+    return pd.DataFrame(report, columns=['column', 'dtype', 'bytes', 'uncompacted']) \
+        .set_index('column')
+
+
+def _merged_dtype(dtype, delta_dtype):
+    """Return a dtype that holds the values of both a cache table column and its delta"""
+    if isinstance(dtype, pd.CategoricalDtype):
+        return 'category'  # Categories are recomputed
+    numeric = pd.api.types.is_numeric_dtype
+    if numeric(dtype) and numeric(delta_dtype) and not pd.api.types.is_bool_dtype(dtype):
+        return np.promote_types(dtype, delta_dtype)
+    return dtype
+
+
+def merge_cache_tables(cache_dir, delta_dir, tables=('sessions', 'datasets')):
+    """
+    Merge cache table deltas into the cache tables of a directory, in place.
+
+    Each delta table contains the rows that were inserted or updated after the local tables were
+    created, and the IDs of deleted rows in the 'deleted' field of its metadata (a list of UUID
+    strings).  The merged table takes the 'date_created' of the delta.
+
+    Parameters
+    ----------
+    cache_dir : str, pathlib.Path
+        The directory containing the local cache tables to update.
+    delta_dir : str, pathlib.Path
+        The directory containing the delta tables.
+    tables : tuple
+        The names of the tables to merge.
+
+    Returns
+    -------
+    list of pathlib.Path
+        The full paths of the merged parquet tables
+
+    Raises
+    ------
+    FileNotFoundError
+        A local cache table or delta table is missing
+    ValueError
+        A delta table's columns do not match those of the local cache table
+
+    Notes
+    -----
+    The tables are written one at a time.  Should the merge be interrupted, the table that
+    wasn't written keeps its original 'date_created', therefore the next delta will include
+    the missing rows; merging the same delta twice has no effect.
+    """
+    cache_dir, delta_dir = Path(cache_dir), Path(delta_dir)
+    # Load and validate all tables before modifying any
+    loaded = {}
+    for table in tables:
+        df, metadata = parquet.load(cache_dir / f'{table}.pqt')
+        delta, delta_metadata = parquet.load(delta_dir / f'{table}.pqt')
+        index_names = None if isinstance(df.index, pd.RangeIndex) else df.index.names
+        if index_names:
+            df = df.reset_index()
+        if not isinstance(delta.index, pd.RangeIndex):
+            delta = delta.reset_index()
+        if set(df.columns) != set(delta.columns):
+            raise ValueError(f'{table} delta table columns do not match those of cache table')
+        loaded[table] = (df, metadata, delta, delta_metadata, index_names)
+
+    files = []
+    for table, (df, metadata, delta, delta_metadata, index_names) in loaded.items():
+        keys = _table_id_keys(df)
+        deleted = delta_metadata.get('deleted') or []
+        if keys == ['id']:
+            deleted = pd.Index(deleted)
+        else:
+            deleted = pd.MultiIndex.from_arrays(parquet.str2np(deleted).T if deleted else [[], []])
+        # Remove updated and deleted rows, then append the updated and inserted ones
+        ids = df.set_index(keys).index
+        drop = ids.isin(delta.set_index(keys).index) | ids.isin(deleted)
+        merged = pd.concat([df[~drop], delta[df.columns]], ignore_index=True)
+        dtypes = {k: _merged_dtype(v, delta[k].dtype) for k, v in df.dtypes.items()}
+        merged = merged.astype(dtypes).sort_values(keys, ignore_index=True)
+        if index_names:
+            merged.set_index(index_names, inplace=True)
+
+        metadata['date_created'] = delta_metadata['date_created']
+        filename = cache_dir / f'{table}.pqt'
+        tmp_file = filename.with_suffix('.pqt.part')
+        parquet.save(tmp_file, merged, metadata)
+        tmp_file.replace(filename)
+        files.append(filename)
+    return files
+
+
+def load_metadata(filename) -> dict:
+    """
+    Load the metadata of a parquet cache table from the file footer, without reading the data.
+
+    Parameters
+    ----------
+    filename : str, pathlib.Path
+        The parquet table file path.
+
+    Returns
+    -------
+    dict
+        The table metadata, e.g. 'date_created' and 'origin'.
+    """
+    schema_metadata = pq.read_schema(filename).metadata or {}
+    return json.loads(schema_metadata.get(b'one_metadata', b'{}'))
+
+
+def _file_stamp(filename) -> list:
+    """Return the modification time (ns) and size of a file, for detecting changes"""
+    stat = Path(filename).stat()
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+_ARROW_TYPES = {pa.string(): pd.StringDtype('pyarrow')}  # Arrow-backed to avoid copying strings
+
+
+def save_arrow(filename, table, metadata=None, source=None):
+    """
+    Save a cache table as an uncompressed Arrow IPC (Feather V2) file that may be memory-mapped.
+
+    The table index and dtypes (including categories) are preserved, so that a table that has
+    been indexed, sorted and compacted is loaded as is.  Categoricals are saved as dictionary
+    encoded columns.  The ALF parts of a categorical 'rel_path' column (see
+    one.util.dataset_parts) are saved too, so that relative paths aren't parsed upon loading.
+    The file is written atomically.
+
+    Parameters
+    ----------
+    filename : str, pathlib.Path
+        The Arrow file path, usually the parquet table path with an '.arrow' extension.
+    table : pandas.DataFrame
+        The cache table to save.
+    metadata : dict
+        The table metadata, i.e. the parquet table metadata.
+    source : str, pathlib.Path
+        The parquet table the Arrow file was made from.  If provided, load_arrow will ignore the
+        file once the parquet table has been modified.
+    """
+    if 'rel_path' in table.columns and isinstance(table['rel_path'].dtype, pd.CategoricalDtype):
+        parts = dataset_parts(table)
+        table = table.assign(**{ARROW_PARTS_PREFIX + k: v.values for k, v in parts.items()})
+    table = pa.Table.from_pandas(table)
+    schema_metadata = {**table.schema.metadata, b'one_metadata': json.dumps(metadata or {})}
+    if source:
+        schema_metadata[b'one_source'] = json.dumps(_file_stamp(source))
+    table = table.replace_schema_metadata(schema_metadata)
+    tmp_file = Path(filename).with_suffix('.arrow.part')
+    with pa.OSFile(str(tmp_file), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    tmp_file.replace(filename)
+
+
+def load_arrow(filename, source=None, writeable=()):
+    """
+    Load a cache table from a memory-mapped Arrow IPC file.
+
+    The file pages are shared between processes and the columns are not copied: numerical
+    columns are read-only unless listed in `writeable`, categoricals keep their saved dictionary
+    and string columns are Arrow-backed (i.e. of dtype 'string[pyarrow]').  Only a string index
+    is converted to Python strings.  The table is returned as saved by save_arrow, i.e. already
+    indexed, sorted and compacted.
+
+    Parameters
+    ----------
+    filename : str, pathlib.Path
+        The Arrow file path.
+    source : str, pathlib.Path
+        The parquet table the Arrow file was made from.  If the parquet table has been modified
+        since the Arrow file was saved, the table is not loaded.
+    writeable : list of str
+        The names of columns that will be modified in place, which are copied if read-only.
+        String columns are instead converted upon modification by make_writeable.
+
+    Returns
+    -------
+    pandas.DataFrame, None
+        The cache table, or None if the parquet source table has been modified.
+    dict
+        The table metadata.
+    """
+    reader = pa.ipc.open_file(pa.memory_map(str(filename)))
+    schema_metadata = reader.schema.metadata or {}
+    metadata = json.loads(schema_metadata.get(b'one_metadata', b'{}'))
+    if source and json.loads(schema_metadata.get(b'one_source', b'null')) != _file_stamp(source):
+        return None, metadata
+    table = reader.read_all()
+    parts = [x for x in table.column_names if x.startswith(ARROW_PARTS_PREFIX)]
+    parts, table = table.select(parts), table.drop(parts)
+    table = table.to_pandas(split_blocks=True, types_mapper=_ARROW_TYPES.get)
+    if isinstance(table.index.dtype, pd.StringDtype):
+        table.index = table.index.astype(object)
+    if parts.num_columns:
+        parts = parts.to_pandas(split_blocks=True, ignore_metadata=True)
+        parts.columns = [x[len(ARROW_PARTS_PREFIX):] for x in parts.columns]
+        _set_dataset_parts(table['rel_path'], parts)
+    for column in set(writeable).intersection(table.columns):
+        if not getattr(table[column].values, 'flags', {'WRITEABLE': True})['WRITEABLE']:
+            table[column] = table[column].copy()
+    return table, metadata
+
+
+def make_writeable(table, columns):
+    """
+    Convert the Arrow-backed string columns of a table loaded by load_arrow to objects, in place.
+
+    Arrow-backed columns aren't reliably modified in place by pandas, therefore they are
+    converted before being modified.  Missing values become None, as in the parquet tables.
+
+    Parameters
+    ----------
+    table : pandas.DataFrame
+        A cache table.
+    columns : list of str
+        The names of the columns to be modified.
+    """
+    for column in columns:
+        if isinstance(table[column].dtype, pd.StringDtype):
+            table[column] = table[column].to_numpy(dtype=object, na_value=None)
+
+
+def log_changes(log_file, date_created, changes):
+    """
+    Append changes to dataset records to a mutation log.
+
+    The log is a JSON lines file where each line holds a dataset ID, the changed fields and the
+    'date_created' of the datasets table that was modified.  All lines are appended with a
+    single write system call to a file descriptor opened in append mode, so that the lines of
+    processes sharing a log on a local filesystem are not interleaved.  Lines partially written,
+    e.g. by a killed process, are terminated before appending and skipped by read_changes.
+
+    Parameters
+    ----------
+    log_file : str, pathlib.Path
+        The mutation log file path, usually next to the datasets table.
+    date_created : str
+        The 'date_created' metadata field of the datasets table that was modified.
+    changes : list of dict
+        Each change has an 'id' key (a UUID string or a pair of ints) and one or more of the keys
+        in LOG_FIELDS.
+    """
+    lines = ''.join(json.dumps({'date_created': date_created, **change}) + '\n'
+                    for change in changes).encode('utf-8')
+    fd = os.open(log_file, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o666)
+    try:
+        if os.lseek(fd, 0, os.SEEK_END) > 0:
+            os.lseek(fd, -1, os.SEEK_END)
+            if os.read(fd, 1) != b'\n':  # Terminate a partially written line
+                lines = b'\n' + lines
+        written = os.write(fd, lines)
+        while written < len(lines):  # Only possible if interrupted, e.g. the disk is full
+            written += os.write(fd, lines[written:])
+    finally:
+        os.close(fd)
+
+
+def read_changes(log_file, date_created=None) -> list:
+    """
+    Read the changes to dataset records from a mutation log.
+
+    Parameters
+    ----------
+    log_file : str, pathlib.Path
+        The mutation log file path.
+    date_created : str
+        If provided, only the changes to the datasets table created at this time are returned;
+        changes to older versions of the table no longer apply.
+
+    Returns
+    -------
+    list of dict
+        The changes in the order they were logged, without the 'date_created' field.
+    """
+    changes = []
+    try:
+        with open(log_file, 'r') as f:
+            for i, line in enumerate(f):
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:  # e.g. a line partially written by a killed process
+                    _logger.warning('Skipping corrupt line %i of %s', i + 1, log_file)
+                    continue
+                created = change.pop('date_created', None)
+                if date_created is None or created == date_created:
+                    changes.append(change)
+    except FileNotFoundError:
+        pass
+    return changes
+
+
+def apply_changes(table, changes):
+    """
+    Apply changes read from a mutation log to a datasets table, in place.
+
+    When a field of a record was changed several times the last change wins.  Changes to
+    datasets that are not in the table are ignored.
+
+    Parameters
+    ----------
+    table : pandas.DataFrame
+        A datasets table indexed by dataset ID, either an 'id' index of strings or an
+        ('id_0', 'id_1') MultiIndex of ints.
+    changes : list of dict
+        The changes returned by read_changes.
+    """
+    if not changes or table.empty:
+        return
+    changes = pd.DataFrame(changes)
+    ids = changes['id'].tolist()
+    if isinstance(table.index, pd.MultiIndex):
+        ids = [tuple(parquet.str2np(i).flat) if isinstance(i, str) else tuple(i) for i in ids]
+        ids = pd.MultiIndex.from_tuples(ids)
+    else:
+        ids = pd.Index([i if isinstance(i, str) else parquet.np2str(np.array(i)) for i in ids])
+    present = ids.isin(table.index)
+    for field in filter(lambda x: x in changes.columns and x in table.columns, LOG_FIELDS):
+        mask = present & changes[field].notna().values
+        values = pd.Series(changes[field].values[mask], index=ids[mask])
+        values = values[~values.index.duplicated(keep='last')]
+        if values.empty:
+            continue
+        values = values.reindex(table.index)  # Table index may contain duplicates
+        changed = values.notna().values
+        # Infer the dtype so that the column is only upcast if the values don't fit
+        values = pd.Series(values.values[changed], dtype=object).infer_objects().values
+        make_writeable(table, [field])
+        table.iloc[changed, table.columns.get_loc(field)] = values
+
+
+def compact_changes(log_file, cache_file) -> bool:
+    """
+    Write the changes in a mutation log to the parquet datasets table and remove the log.
+
+    The log is first renamed so that the changes logged by other processes in the meantime are
+    kept for the next compaction.  Changes to older versions of the table are discarded.  The
+    table is written atomically and keeps its original metadata.
+
+    Parameters
+    ----------
+    log_file : str, pathlib.Path
+        The mutation log file path.
+    cache_file : str, pathlib.Path
+        The parquet datasets table file path.
+
+    Returns
+    -------
+    bool
+        True if the parquet table was modified.
+    """
+    log_file, cache_file = Path(log_file), Path(cache_file)
+    compacting = log_file.with_suffix(log_file.suffix + '.part')
+    if not compacting.exists():  # Otherwise finish an interrupted compaction first
+        if not log_file.exists():
+            return False
+        log_file.replace(compacting)
+    df, metadata = parquet.load(cache_file)
+    changes = read_changes(compacting, metadata.get('date_created'))
+    if changes:
+        columns = df.columns
+        index_names = None if isinstance(df.index, pd.RangeIndex) else df.index.names
+        if not index_names:
+            df.set_index(_table_id_keys(df), inplace=True)
+        apply_changes(df, changes)
+        if not index_names:
+            df = df.reset_index()[columns]
+        tmp_file = cache_file.with_suffix('.pqt.part')
+        parquet.save(tmp_file, df, metadata)
+        tmp_file.replace(cache_file)
+    compacting.unlink()
+    return bool(changes)
+
+
+class HashIndex:
+    """
+    A persistent index of the MD5 hashes of local files.
+
+    Each hash is stored with the file's inode, size and modification time, and is returned only
+    while these are unchanged, so that a file is hashed again only if it was modified or
+    replaced.  The index is a SQLite database, usually next to the cache tables (see
+    one.caching.sqlite_connect).  Paths within the root directory are stored relative to it.
+
+    Examples
+    --------
+    >>> hashes = HashIndex(Path(cache_dir, 'hashes.sqlite'), root=cache_dir)
+    >>> hashes.md5(Path(cache_dir, 'lab/Subjects/subj/2020-01-01/001/alf/spikes.times.npy'))
+    """
+    _schema = """
+        CREATE TABLE IF NOT EXISTS hashes (
+            path TEXT PRIMARY KEY,
+            inode INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            md5 TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, filename, root=None):
+        """
+        Parameters
+        ----------
+        filename : str, pathlib.Path
+            The database file path
+        root : str, pathlib.Path
+            The directory relative to which file paths are stored, e.g. the cache directory
+        """
+        self.filename = Path(filename)
+        self.root = Path(root).absolute() if root else None
+
+    def _key(self, file) -> str:
+        """The indexed path of a file"""
+        file = Path(file).absolute()
+        if self.root and self.root in file.parents:
+            file = file.relative_to(self.root)
+        return file.as_posix()
+
+    def _connect(self):
+        return sqlite_connect(self.filename, self._schema)
+
+    def get(self, file, stat=None) -> Optional[str]:
+        """
+        Return the indexed hash of a file.
+
+        Parameters
+        ----------
+        file : str, pathlib.Path
+            The file path
+        stat : os.stat_result
+            The file status, if already known
+
+        Returns
+        -------
+        str, None
+            The MD5 hash of the file, or None if not indexed or the file changed since indexed
+        """
+        stat = stat or os.stat(file)
+        if not self.filename.exists():
+            return
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT md5 FROM hashes WHERE path = ? AND inode = ? AND size = ? AND '
+                    'mtime_ns = ?', (self._key(file), *_inode_stamp(stat))).fetchone()
+        except sqlite3.Error as ex:
+            _logger.debug('Failed to read hash index %s: %s', self.filename, ex)
+            return
+        return row[0] if row else None
+
+    def modified(self, file, stat=None) -> bool:
+        """
+        Check whether a file was modified or replaced since its hash was indexed.
+
+        Parameters
+        ----------
+        file : str, pathlib.Path
+            The file path
+        stat : os.stat_result
+            The file status, if already known
+
+        Returns
+        -------
+        bool
+            True if the file is indexed with a different inode, size or modification time
+        """
+        stat = stat or os.stat(file)
+        if not self.filename.exists():
+            return False
+        try:
+            with self._connect() as conn:
+                row = conn.execute('SELECT inode, size, mtime_ns FROM hashes WHERE path = ?',
+                                   (self._key(file),)).fetchone()
+        except sqlite3.Error as ex:
+            _logger.debug('Failed to read hash index %s: %s', self.filename, ex)
+            return False
+        return row is not None and tuple(row) != _inode_stamp(stat)
+
+    def put(self, file, md5_hash, stat=None):
+        """
+        Index the hash of a file, e.g. one computed while downloading it.
+
+        Parameters
+        ----------
+        file : str, pathlib.Path
+            The file path
+        md5_hash : str
+            The MD5 hash of the file
+        stat : os.stat_result
+            The file status when hashed, if already known
+        """
+        stat = stat or os.stat(file)
+        try:
+            with self._connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)',
+                             (self._key(file), *_inode_stamp(stat), md5_hash))
+        except sqlite3.Error as ex:  # e.g. a read-only cache directory
+            _logger.debug('Failed to update hash index %s: %s', self.filename, ex)
+
+    def md5(self, file, recompute=False) -> str:
+        """
+        Return the MD5 hash of a file, computing and indexing it only if not already indexed.
+
+        Parameters
+        ----------
+        file : str, pathlib.Path
+            The file path
+        recompute : bool
+            If true, the hash is computed and re-indexed regardless of the indexed hash
+
+        Returns
+        -------
+        str
+            The MD5 hash of the file
+        """
+        stat = os.stat(file)
+        digest = None if recompute else self.get(file, stat)
+        if digest is None:
+            digest = md5(file)
+            if _inode_stamp(os.stat(file)) == _inode_stamp(stat):  # Unmodified while hashed
+                self.put(file, digest, stat)
+        return digest
+
+    def clear(self):
+        """Remove all hashes from the index"""
+        if self.filename.exists():
+            with self._connect() as conn:
+                conn.execute('DELETE FROM hashes')
+
+    def __len__(self):
+        if not self.filename.exists():
+            return 0
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM hashes').fetchone()[0]
+
+
+def _inode_stamp(stat) -> tuple:
+    """The inode, size and modification time of a file status, with which hashes are indexed"""
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
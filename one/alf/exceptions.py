@@ -81,3 +81,9 @@ class ALFMultipleRevisionsFound(ALFError):
     explanation = ('The matching object/file(s) belong to more than one revision.  '
                    'Multiple datasets in different revision folders were found with no default'
                    'specified.')
+
+
+class ALFIntegrityError(ALFError):
+    """'File size or hash mismatch' error"""
+    explanation = ('The size or MD5 hash of the file does not match that of the dataset record.  '
+                   'The file may be corrupt or the dataset record out of date.')
@@ -12,35 +12,63 @@ import concurrent.futures
 import warnings
 import logging
 import os
+import time
 from datetime import datetime, timedelta
-from functools import lru_cache, reduce
+from functools import lru_cache, partial, reduce
 from inspect import unwrap
 from pathlib import Path
 from typing import Any, Union, Optional, List
+from urllib.error import HTTPError
 from uuid import UUID
 
 import pandas as pd
 import numpy as np
 import requests.exceptions
-from iblutil.io import parquet, hashfile
+from tqdm import tqdm
+from iblutil.io import parquet
 from iblutil.util import Bunch
-from iblutil.numerical import ismember2d
 
 import one.params
 import one.webclient as wc
 import one.alf.io as alfio
 import one.alf.exceptions as alferr
-from .alf.cache import make_parquet_db
-from .alf.files import rel_path_parts, get_session_path, get_alf_path
+from .alf.cache import (
+    make_parquet_db, compact_table, save_arrow, load_arrow, load_metadata, log_changes,
+    read_changes, apply_changes, compact_changes, make_writeable, HashIndex, CATEGORICAL_COLUMNS
+)
+from .alf.files import get_session_path, get_alf_path
 from .alf.spec import is_uuid_string
 from one.converters import ConversionMixin
 import one.util as util
+from one.caching import LRUMemo, BackgroundQueue, LazyBunch
+from one.index import SessionIndex, DateIndex, TableStats, DatasetIndex
 
 _logger = logging.getLogger(__name__)
 
 """int: The number of download threads"""
 N_THREADS = 4
 
+"""str: The file name of the datasets cache table mutation log"""
+CACHE_LOG = 'datasets.log'
+
+"""int: The size in bytes above which the mutation log is compacted into the datasets table"""
+CACHE_LOG_MAX_SIZE = 2 ** 20
+
+"""str: The file name of the saved inverted index of dataset paths to sessions"""
+DATASET_INDEX = 'datasets_index.npz'
+
+"""str: The file name of the persistent index of the MD5 hashes of local files"""
+HASH_INDEX = 'hashes.sqlite'
+
+"""tuple of str: The local file integrity verification levels, in order of increasing cost.
+'none' checks only that a file exists; 'size' compares the file size; 'size+mtime' also checks
+that the file wasn't modified since its hash was indexed; 'md5-cached' compares the MD5 hash,
+hashing only files modified since last hashed; and 'md5-full' always hashes the file."""
+VERIFY_LEVELS = ('none', 'size', 'size+mtime', 'md5-cached', 'md5-full')
+
+"""int: The default maximum total size in bytes of memoized search and list results"""
+MEMO_MAX_BYTES = 2 ** 27
+
 
 class One(ConversionMixin):
     """An API for searching and loading data on a local filesystem"""
@@ -48,7 +76,8 @@ class One(ConversionMixin):
         'dataset', 'date_range', 'laboratory', 'number', 'project', 'subject', 'task_protocol'
     )
 
-    def __init__(self, cache_dir=None, mode='auto', wildcards=True):
+    def __init__(self, cache_dir=None, mode='auto', wildcards=True, verify='md5-cached',
+                 verify_background=False):
         """An API for searching and loading data on a local filesystem
 
         Parameters
@@ -61,6 +90,13 @@ class One(ConversionMixin):
             Query mode, options include 'auto' (reload cache daily), 'local' (offline) and
             'refresh' (always reload cache tables).  Most methods have a `query_type` parameter
             that can override the class mode.
+        verify : str
+            The integrity verification level of local files, one of VERIFY_LEVELS.  The load
+            methods have a `verify` parameter that can override this level.
+        verify_background : bool
+            If true, local files not fully verified when loaded are queued to be hashed on a low
+            priority background thread, after their data have been returned.  A warning is
+            logged for any file whose hash doesn't match.
         """
         # get parameters override if inputs provided
         super().__init__()
@@ -69,8 +105,17 @@ class One(ConversionMixin):
         self.cache_expiry = timedelta(hours=24)
         self.mode = mode
         self.wildcards = wildcards  # Flag indicating whether to use regex or wildcards
+        self.verify = verify
+        self.verify_background = verify_background
+        self._background = BackgroundQueue('one-verify')  # Background file verification
+        self._hash_index = None  # Index of local file hashes, opened upon first access
+        self._session_index = None  # Map of session ID -> datasets table rows
+        self._dataset_index = None  # Map of dataset path -> sessions table rows
+        self._date_index = None  # Sorted session dates
+        self._table_stats = None  # Sessions table column statistics
+        self.memo = LRUMemo(MEMO_MAX_BYTES)  # Search and list results
         # init the cache file
-        self._cache = Bunch({'_meta': {
+        self._cache = LazyBunch({'_meta': {
             'expired': False,
             'created_time': None,
             'loaded_time': None,
@@ -86,52 +131,459 @@ class One(ConversionMixin):
         """bool: True if mode is local or no Web client set"""
         return self.mode == 'local' or not getattr(self, '_web_client', False)
 
+    @property
+    def verify(self):
+        """str: The integrity verification level of local files, one of VERIFY_LEVELS"""
+        return self._verify
+
+    @verify.setter
+    def verify(self, level):
+        self._verify = self._check_verify_level(level)
+
+    @staticmethod
+    def _check_verify_level(level) -> str:
+        """Return a verification level, raising a ValueError if not one of VERIFY_LEVELS"""
+        if level not in VERIFY_LEVELS:
+            raise ValueError(f'Unknown verify level "{level}"; options include {VERIFY_LEVELS}')
+        return level
+
+    @property
+    def _hashes(self):
+        """one.alf.cache.HashIndex: The index of the hashes of files in the cache directory"""
+        filename = Path(self.cache_dir, HASH_INDEX)
+        if self._hash_index is None or self._hash_index.filename != filename:
+            self._hash_index = HashIndex(filename, root=self.cache_dir)
+        return self._hash_index
+
     @util.refresh
     def search_terms(self, query_type=None) -> tuple:
         """List the search term keyword args for use in the search method"""
         return self._search_terms
 
-    def _load_cache(self, cache_dir=None, **kwargs):
+    def _load_cache(self, cache_dir=None, arrow=False, **kwargs):
+        """
+        Load the cache tables from the cache directory.
+
+        The table metadata are read from the parquet file footers.  The sessions table is loaded
+        immediately, while the (much larger) datasets table is only loaded upon first access.
+
+        Parameters
+        ----------
+        cache_dir : str, pathlib.Path
+            The directory containing the parquet cache tables.  Defaults to the cache_dir
+            attribute.
+        arrow : bool
+            If true, all tables are loaded and Arrow copies of the tables are saved next to the
+            parquet tables.  Once present, the (already indexed and sorted) Arrow tables are
+            memory-mapped in place of the parquet tables, and re-saved whenever the parquet
+            tables are modified.
+
+        Returns
+        -------
+        datetime.datetime
+            Loaded timestamp
+
+        Notes
+        -----
+        Changes made to the datasets table by this object (see `_update_datasets`) are logged
+        and replayed when the table is loaded.  Once the log is large it is compacted into the
+        parquet table.
+        """
         meta = self._cache['_meta']
-        INDEX_KEY = 'id'
-        for cache_file in Path(cache_dir or self.cache_dir).glob('*.pqt'):
+        meta.update(created_time=None, expired=False)  # Reset in case tables have been updated
+        loaded = []
+        cache_dir = Path(cache_dir or self.cache_dir)
+        log_file = cache_dir / CACHE_LOG
+        if cache_dir.joinpath('datasets.pqt').exists() and (
+            log_file.with_suffix(log_file.suffix + '.part').exists() or
+            log_file.exists() and log_file.stat().st_size > CACHE_LOG_MAX_SIZE
+        ):
+            try:
+                compact_changes(log_file, cache_dir / 'datasets.pqt')
+            except OSError as ex:
+                _logger.warning(f'Failed to compact {log_file}: {ex}')
+        for cache_file in cache_dir.glob('*.pqt'):
             table = cache_file.stem
-            # we need to keep this part fast enough for transient objects
-            cache, meta['raw'][table] = parquet.load(cache_file)
+            meta['raw'][table] = load_metadata(cache_file)
             if 'date_created' not in meta['raw'][table]:
                 _logger.warning(f"{cache_file} does not appear to be a valid table. Skipping")
                 continue
+            loaded.append(table)
             created = datetime.fromisoformat(meta['raw'][table]['date_created'])
             meta['created_time'] = min([meta['created_time'] or datetime.max, created])
             meta['loaded_time'] = datetime.now()
             meta['expired'] |= datetime.now() - created > self.cache_expiry
+            if table == 'datasets' and not arrow:
+                # Only load the datasets table when first accessed
+                self._cache.defer(table, partial(self._load_table, cache_file))
+            else:
+                self._cache[table] = self._load_table(cache_file, arrow=arrow)
 
-            # Set the appropriate index if none already set
-            if isinstance(cache.index, pd.RangeIndex):
-                num_index = [f'{INDEX_KEY}_{n}' for n in range(2)]
-                try:
-                    int_eids = cache[num_index].any(axis=None)
-                except KeyError:
-                    int_eids = False
-                cache.set_index(num_index if int_eids else INDEX_KEY, inplace=True)
-
-            # Check sorted
-            is_sorted = (cache.index.is_monotonic_increasing
-                         if isinstance(cache.index, pd.MultiIndex)
-                         else True)
-            # Sorting makes MultiIndex indexing O(N) -> O(1)
-            if table == 'datasets' and not is_sorted:
-                cache.sort_index(inplace=True)
-
-            self._cache[table] = cache
-
-        if len(self._cache) == 1:
+        if not loaded:
             # No tables present
             meta['expired'] = True
-            self._cache.update({'datasets': pd.DataFrame(), 'sessions': pd.DataFrame()})
+            if len(self._cache) == 1:
+                self._cache.update({'datasets': pd.DataFrame(), 'sessions': pd.DataFrame()})
         self._cache['_meta'] = meta
+        self._session_index = None  # Built upon first per-session datasets lookup
+        self._dataset_index = None  # Loaded or built upon first dataset search
+        self._date_index = None  # Built upon first date range search
+        self._table_stats = None  # Computed upon first search
+        self.memo.clear()
         return self._cache['_meta']['loaded_time']
 
+    def _load_table(self, cache_file, arrow=False) -> pd.DataFrame:
+        """
+        Load a cache table, indexed by ID.
+
+        Parameters
+        ----------
+        cache_file : pathlib.Path
+            The parquet table file path.
+        arrow : bool
+            If true, an Arrow copy of the table is saved next to the parquet table.  The Arrow
+            table is loaded instead when present and up-to-date.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The cache table
+        """
+        meta = self._cache['_meta']
+        table = cache_file.stem
+        arrow_file = cache_file.with_suffix('.arrow')
+        cache = None
+        if arrow_file.exists() and not arrow:
+            cache, meta['raw'][table] = load_arrow(
+                arrow_file, source=cache_file, writeable=('exists', 'file_size', 'hash'))
+        # Arrow tables are saved already indexed, sorted and compacted, with the parsed ALF parts
+        if cache is None:
+            # we need to keep this part fast enough for transient objects
+            cache, meta['raw'][table] = parquet.load(cache_file)
+            self._prepare_table(cache, table)
+            if arrow or arrow_file.exists():
+                try:
+                    save_arrow(arrow_file, cache, meta['raw'][table], source=cache_file)
+                except OSError as ex:
+                    _logger.warning(f'Failed to save {arrow_file}: {ex}')
+
+        # Replay the changes made to this version of the table
+        if table == 'datasets':
+            log_file = cache_file.with_name(CACHE_LOG)
+            apply_changes(cache, read_changes(log_file, meta['raw'][table].get('date_created')))
+        return cache
+
+    @staticmethod
+    def _prepare_table(cache, table):
+        """
+        Index, sort and compact a cache table loaded from parquet, in place.
+
+        Parameters
+        ----------
+        cache : pandas.DataFrame
+            The cache table.
+        table : str
+            The table name, i.e. 'sessions' or 'datasets'.
+        """
+        # Set the appropriate index if none already set
+        INDEX_KEY = 'id'
+        if isinstance(cache.index, pd.RangeIndex):
+            num_index = [f'{INDEX_KEY}_{n}' for n in range(2)]
+            try:
+                int_eids = cache[num_index].any(axis=None)
+            except KeyError:
+                int_eids = False
+            cache.set_index(num_index if int_eids else INDEX_KEY, inplace=True)
+
+        # Check sorted
+        is_sorted = (cache.index.is_monotonic_increasing
+                     if isinstance(cache.index, pd.MultiIndex)
+                     else True)
+        # Sorting makes MultiIndex indexing O(N) -> O(1)
+        if table == 'datasets' and not is_sorted:
+            cache.sort_index(inplace=True)
+
+        # Store strings as categoricals and numbers as compact dtypes
+        compact_table(cache, CATEGORICAL_COLUMNS.get(table, ()))
+        # Parse each unique relative path once so that datasets are filtered by ALF part
+        if table == 'datasets' and 'rel_path' in cache.columns:
+            util.dataset_parts(cache)
+
+    def _update_datasets(self, ids, **values):
+        """
+        Update fields of dataset records in the cache and log the changes.
+
+        The changes are appended to a mutation log next to the cache tables, which is replayed
+        when the tables are next loaded, so that they persist between sessions.
+
+        Parameters
+        ----------
+        ids : str, tuple, numpy.array, list
+            One or more dataset IDs, of the same type as the datasets table index.
+        **values
+            The new field values, e.g. exists=False.  Only the fields in
+            one.alf.cache.LOG_FIELDS are logged.
+        """
+        if self._index_type('datasets') is int:
+            ids = map(tuple, np.array(ids, dtype=np.int64).reshape(-1, 2).tolist())
+        else:
+            ids = np.atleast_1d(ids).tolist()
+        self._update_dataset_records([{'id': i, **values} for i in ids])
+
+    def _update_dataset_records(self, changes):
+        """
+        Update fields of several dataset records in the cache and log the changes at once.
+
+        Parameters
+        ----------
+        changes : list of dict
+            Each change has an 'id' key (a dataset ID of the same type as the datasets table
+            index, i.e. a string or a tuple of ints) and the new field values.  Changes to
+            datasets not in the table are ignored.  Only the fields in one.alf.cache.LOG_FIELDS
+            are logged.
+        """
+        datasets = self._cache['datasets']
+        if not changes or datasets.empty:
+            return
+        multi_index = isinstance(datasets.index, pd.MultiIndex)
+        index = pd.MultiIndex.from_tuples if multi_index else pd.Index
+        present = index([x['id'] for x in changes]).isin(datasets.index)
+        changes = [x for x, p in zip(changes, present) if p]
+        fields = dict.fromkeys(k for x in changes for k in x if k != 'id')
+        for field in fields:
+            updates = [(x['id'], x[field]) for x in changes if field in x]
+            ids, values = zip(*updates)
+            make_writeable(datasets, [field])
+            datasets.loc[index(list(ids)), field] = list(values)
+        self.memo.clear()
+        date_created = self._cache['_meta']['raw'].get('datasets', {}).get('date_created')
+        if not date_created or not changes:
+            return  # The table was not loaded from disk
+        records = []
+        for change in changes:
+            record = {k: v.item() if isinstance(v, np.generic) else v for k, v in change.items()}
+            record['id'] = list(map(int, change['id'])) if multi_index else change['id']
+            records.append(record)
+        try:
+            log_changes(Path(self.cache_dir, CACHE_LOG), date_created, records)
+        except OSError as ex:
+            _logger.debug('Failed to log datasets cache changes: %s', ex)
+
+    def _get_dataset_index(self) -> DatasetIndex:
+        """
+        Return the inverted index of dataset paths to sessions.
+
+        The index is saved in the cache directory.  It is loaded if it was built from the same
+        cache tables, otherwise it is rebuilt, e.g. after the tables have been updated or
+        modified.
+
+        Returns
+        -------
+        one.index.DatasetIndex
+            The index for the current cache tables
+        """
+        datasets, sessions = self._cache['datasets'], self._cache['sessions']
+        if self._dataset_index is None or not self._dataset_index.is_current(datasets, sessions):
+            filename = Path(self.cache_dir, DATASET_INDEX)
+            raw = self._cache['_meta']['raw']
+            metadata = {x: raw.get(x, {}).get('date_created') for x in ('sessions', 'datasets')}
+            index = DatasetIndex.load(filename, datasets, sessions, metadata)
+            if index is None:
+                index = DatasetIndex(datasets, sessions)
+                if all(metadata.values()):
+                    try:
+                        index.save(filename, metadata)
+                    except OSError as ex:
+                        _logger.debug('Failed to save dataset index: %s', ex)
+            self._dataset_index = index
+        return self._dataset_index
+
+    def _get_date_index(self) -> DateIndex:
+        """
+        Return the sorted index of session dates, which is rebuilt if the sessions table has
+        been replaced.
+
+        Returns
+        -------
+        one.index.DateIndex
+            The index for the current sessions table
+        """
+        sessions = self._cache['sessions']
+        if self._date_index is None or not self._date_index.is_current(sessions):
+            self._date_index = DateIndex(sessions)
+        return self._date_index
+
+    def _get_table_stats(self) -> TableStats:
+        """
+        Return the sessions table column statistics, which are recomputed if the sessions table
+        has been replaced.
+
+        Returns
+        -------
+        one.index.TableStats
+            The statistics for the current sessions table
+        """
+        sessions = self._cache['sessions']
+        if self._table_stats is None or not self._table_stats.is_current(sessions):
+            self._table_stats = TableStats(sessions)
+        return self._table_stats
+
+    def _plan_search(self, queries) -> list:
+        """
+        Order the search predicates by their estimated cost and selectivity.
+
+        Each predicate's selectivity is estimated from the sessions table statistics and
+        indices.  The predicates are then greedily ordered such that the one with the lowest
+        cost per fraction of sessions removed is applied first.  The cost of the dataset
+        predicate depends on the number of sessions remaining, therefore it is usually applied
+        last unless it is very selective.
+
+        Parameters
+        ----------
+        queries : dict
+            A map of full search term names to query values
+
+        Returns
+        -------
+        list of dict
+            The plan steps in order, each with the keys 'predicate', 'value', 'selectivity',
+            'cost' and 'evaluate', a function that takes the boolean mask of sessions
+            remaining and returns the boolean mask of sessions matching the predicate
+        """
+        sessions = self._cache['sessions']
+        stats = self._get_table_stats()
+        n = len(sessions)
+        # Costs are in units of one vectorized operation per row; matching a string is ~100x
+        str_cost = 100
+
+        def string_mask(column, pattern):
+            values = sessions[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Match the categories then look up the match of each row's code
+                categories = values.cat.categories.astype(str)
+                match = categories.str.contains(pattern, regex=self.wildcards)
+                match = np.append(match, False)  # Missing values (code -1) don't match
+                return match[values.cat.codes.values]
+            match = values.str.contains(pattern, regex=self.wildcards)
+            return match.fillna(False).values.astype(bool)
+
+        steps = []
+        search_order = ('date_range', 'number', 'dataset')  # Breaks ties in the plan
+        for key, value in sorted(queries.items(), key=lambda x: search_order.index(x[0])
+                                 if x[0] in search_order else -1):
+            step = Bunch(predicate=key, value=value)
+            if key in ('subject', 'task_protocol', 'laboratory', 'project'):
+                column = 'lab' if key == 'laboratory' else key
+                pattern = '|'.join(util.ensure_list(value))
+                step.selectivity = stats.selectivity(column, pattern=pattern,
+                                                     regex=self.wildcards)
+                step.cost = lambda x, c=column: n + str_cost * stats.n_distinct(c)
+                step.evaluate = lambda mask, c=column, q=pattern: string_mask(c, q)
+            elif key == 'date_range':
+                start, end = util.validate_date_range(value)
+                index = self._get_date_index()
+                step.selectivity = index.count(start, end) / max(n, 1)
+                step.cost = lambda x, k=step.selectivity * n: np.log2(max(n, 2)) + k
+                step.evaluate = lambda mask, a=start, b=end, i=index: i.mask(a, b)
+            elif key == 'number':
+                query = list(map(int, util.ensure_list(value)))
+                step.selectivity = stats.selectivity(key, values=query)
+                step.cost = lambda x: n
+                step.evaluate = lambda mask, q=query: sessions['number'].isin(q).values
+            elif key == 'dataset':
+                query = util.ensure_list(value)
+                # Narrow down the sessions to those with datasets matching all queries
+                rows = self._get_dataset_index().sessions(query, regex=self.wildcards)
+                step.selectivity = len(rows) / max(n, 1)
+                n_datasets = len(self._cache['datasets'])
+                # The existence of each dataset of the remaining sessions is then checked
+                step.cost = lambda x, k=n_datasets: x * k * str_cost
+
+                def evaluate(mask, step=step, rows=rows, query=query):
+                    # Keep the matching sessions in dataset order for the results
+                    step.order = self._search_datasets(mask, rows=rows, query=query)
+                    return sessions.index.isin(step.order)
+                step.evaluate = evaluate
+            steps.append(step)
+
+        # Greedily apply the predicate with the lowest cost per fraction of sessions removed
+        plan, remaining = [], 1.
+        while steps:
+            step = min(steps, key=lambda x: x.cost(remaining) / max(1 - x.selectivity, 1e-9))
+            steps.remove(step)
+            step.cost = float(step.cost(remaining))
+            remaining *= step.selectivity
+            plan.append(step)
+        return plan
+
+    def _search_datasets(self, mask, rows=None, query=None) -> pd.Index:
+        """
+        Return the sessions that have existing datasets matching all dataset queries.
+
+        Parameters
+        ----------
+        mask : numpy.array
+            A boolean mask of the sessions table rows to consider
+        rows : numpy.array
+            The sessions table row positions of sessions with datasets that match all queries,
+            as returned by one.index.DatasetIndex.sessions
+        query : list of str
+            A list of dataset name patterns
+
+        Returns
+        -------
+        pandas.Index
+            The session IDs matching all queries, in the order of their datasets
+        """
+        sessions = self._cache['sessions']
+        matches = np.zeros(len(sessions), dtype=bool)
+        matches[rows] = True
+        matches &= mask
+        if not matches.any():
+            return sessions.index[:0]
+        index = ['eid_0', 'eid_1'] if self._index_type('datasets') is int else ['eid']
+        datasets = self._cache['datasets']
+        if not matches.all():
+            # Only consider the datasets of the remaining sessions
+            eids = sessions.index[matches].values.tolist()
+            if self._index_type() is int:
+                eids = parquet.np2str(np.array(eids))
+            datasets = self._session_datasets(eids)
+        # One column per query: whether each dataset both contains query and exists
+        exists = datasets['exists'].fillna(False).values.astype(bool)
+        present = pd.DataFrame({
+            i: datasets['rel_path'].str.contains(x, regex=self.wildcards)
+                                   .fillna(False).values.astype(bool) & exists
+            for i, x in enumerate(query)
+        })
+        # For each session check all queries match at least one dataset
+        keys = [datasets[x].values for x in index]
+        found = present.groupby(keys, sort=False).any().all(axis=1)
+        # eids of matching dataset records
+        return found.index[found.values]
+
+    def _session_datasets(self, eid) -> pd.DataFrame:
+        """
+        Return the datasets cache table rows for one or more sessions.
+
+        The rows are looked up in the session index, which is rebuilt if the datasets table has
+        been modified or replaced since the index was built.
+
+        Parameters
+        ----------
+        eid : str, list
+            One or more experiment UUID strings
+
+        Returns
+        -------
+        pandas.DataFrame
+            A slice of the datasets table, in table order
+        """
+        datasets = self._cache['datasets']
+        if self._session_index is None or not self._session_index.is_current(datasets):
+            self._session_index = SessionIndex(datasets)
+        return datasets.iloc[self._session_index.rows(eid)]
+
     def refresh_cache(self, mode='auto'):
         """Check and reload cache tables
 
@@ -159,6 +611,33 @@ class One(ConversionMixin):
             raise ValueError(f'Unknown refresh type "{mode}"')
         return self._cache['_meta']['loaded_time']
 
+    def save_arrow_tables(self):
+        """
+        Save memory-mappable Arrow copies of the cache tables next to the parquet tables.
+
+        Once saved, the Arrow tables are loaded in place of the parquet tables.  They are already
+        indexed, sorted and compacted, with the dataset relative paths parsed, and their pages
+        are shared between processes without copying, which makes loading the cache
+        near-instant.  The string columns, e.g. 'hash', are then of dtype 'string[pyarrow]'.
+        The Arrow tables are re-saved whenever the parquet tables are modified; to stop using
+        them, simply delete the '.arrow' files.
+
+        NB: The cache tables are reloaded from disk.
+
+        Returns
+        -------
+        list of pathlib.Path
+            The saved Arrow table file paths
+
+        Examples
+        --------
+        >>> one = One(cache_dir='path/to/data')
+        >>> one.save_arrow_tables()
+        >>> one = One(cache_dir='path/to/data')  # Subsequently loads the Arrow tables
+        """
+        One._load_cache(self, self.cache_dir, arrow=True)
+        return sorted(Path(self.cache_dir).glob('*.arrow'))
+
     def _download_datasets(self, dsets, **kwargs) -> List[Path]:
         """
         Download several datasets given a set of datasets
@@ -205,7 +684,8 @@ class One(ConversionMixin):
         """
         pass  # pragma: no cover
 
-    def search(self, details=False, query_type=None, **kwargs):
+    @util.memoize
+    def search(self, details=False, query_type=None, explain=False, **kwargs):
         """
         Searches sessions matching the given criteria and returns a list of matching eids
 
@@ -219,6 +699,9 @@ class One(ConversionMixin):
         however if wildcards property is False, regular expressions may be used for all but
         number and date_range.
 
+        The filters are applied in order of their estimated cost and selectivity, and combined
+        as boolean masks over the sessions table.
+
         Parameters
         ----------
         dataset : str, list
@@ -244,6 +727,10 @@ class One(ConversionMixin):
             If true also returns a dict of dataset details
         query_type : str, None
             Query cache ('local') or Alyx database ('remote')
+        explain : bool
+            If true also returns the search plan: a table of the filters in the order applied,
+            with their estimated selectivity and cost, the number of sessions remaining and the
+            time taken in seconds.  Explained searches are not memoized.
 
         Returns
         -------
@@ -252,77 +739,118 @@ class One(ConversionMixin):
         (list)
             (If details is True) a list of dictionaries, each entry corresponding to a matching
             session
-        """
-
-        def all_present(x, dsets, exists=True):
-            """Returns true if all datasets present in Series"""
-            return all(any(x.str.contains(y, regex=self.wildcards) & exists) for y in dsets)
+        (pandas.DataFrame)
+            (If explain is True) the search plan
 
-        # Iterate over search filters, reducing the sessions table
+        Examples
+        --------
+        >>> eids, plan = one.search(subject='SWC_043', dataset='spikes.times', explain=True)
+        """
         sessions = self._cache['sessions']
 
-        # Ensure sessions filtered in a particular order, with datasets last
-        search_order = ('date_range', 'number', 'dataset')
-
-        def sort_fcn(itm):
-            return -1 if itm[0] not in search_order else search_order.index(itm[0])
-
         # Validate and get full name for queries
         search_terms = self.search_terms(query_type='local')
         queries = {util.autocomplete(k, search_terms): v for k, v in kwargs.items()}
-        for key, value in sorted(queries.items(), key=sort_fcn):
-            # key = util.autocomplete(key)  # Validate and get full name
-            # No matches; short circuit
-            if sessions.size == 0:
-                return ([], None) if details else []
-            # String fields
-            elif key in ('subject', 'task_protocol', 'laboratory', 'project'):
-                query = '|'.join(util.ensure_list(value))
-                key = 'lab' if key == 'laboratory' else key
-                mask = sessions[key].str.contains(query, regex=self.wildcards)
-                sessions = sessions[mask.astype(bool, copy=False)]
-            elif key == 'date_range':
-                start, end = util.validate_date_range(value)
-                session_date = pd.to_datetime(sessions['date'])
-                sessions = sessions[(session_date >= start) & (session_date <= end)]
-            elif key == 'number':
-                query = util.ensure_list(value)
-                sessions = sessions[sessions[key].isin(map(int, query))]
-            # Dataset check is biggest so this should be done last
-            elif key == 'dataset':
-                index = ['eid_0', 'eid_1'] if self._index_type('datasets') is int else 'eid'
-                query = util.ensure_list(value)
-                datasets = self._cache['datasets']
-                if self._index_type() is int:
-                    isin, _ = ismember2d(datasets[['eid_0', 'eid_1']].values,
-                                         np.array(sessions.index.values.tolist()))
-                else:
-                    isin = datasets['eid'].isin(sessions.index.values)
-                # For each session check any dataset both contains query and exists
-                mask = (
-                    (datasets[isin]
-                        .groupby(index, sort=False)
-                        .apply(lambda x: all_present(x['rel_path'], query, x['exists'])))
-                )
-                # eids of matching dataset records
-                idx = mask[mask].index
-
-                # Reduce sessions table by datasets mask
-                sessions = sessions.loc[idx]
+        plan = self._plan_search(queries) if sessions.size else []
+
+        # Combine the filter masks over the sessions table in order of the plan
+        mask = np.ones(len(sessions), dtype=bool)
+        for step in plan:
+            t0 = time.perf_counter()
+            if mask.any():  # Otherwise no matches; short circuit
+                mask &= step.evaluate(mask)
+                step.rows = np.count_nonzero(mask)
+            step.time = time.perf_counter() - t0
+        order = next((step.order for step in plan if 'order' in step), None)
+        if order is None:
+            sessions = sessions[mask]
+        else:  # Sessions in order of their matching datasets
+            sessions = sessions.loc[order[order.isin(sessions.index[mask])]]
 
         # Return results
         if sessions.size == 0:
-            return ([], None) if details else []
-        eids = sessions.index.to_list()
-        if self._index_type() is int:
-            eids = parquet.np2str(np.array(eids))
-
-        if details:
-            return eids, sessions.reset_index().iloc[:, 2:].to_dict('records', Bunch)
+            results = [[], None]
         else:
-            return eids
+            eids = sessions.index.to_list()
+            if self._index_type() is int:
+                eids = parquet.np2str(np.array(eids))
+            results = [eids, sessions.reset_index().iloc[:, 2:].to_dict('records', Bunch)
+                       if details else None]
+        if not details:
+            results.pop()
+        if explain:
+            columns = ('predicate', 'value', 'selectivity', 'cost', 'rows', 'time')
+            results.append(pd.DataFrame([[step.get(k) for k in columns] for step in plan],
+                                        columns=columns))
+        return tuple(results) if len(results) > 1 else results[0]
+
+    def _verify_file(self, file, file_size=None, hash=None, verify=None) -> bool:
+        """
+        Check whether a local file matches its expected size and hash.
+
+        Only the 'md5-cached' and 'md5-full' levels read the file contents; the 'size+mtime'
+        level compares the expected hash with the indexed hash, if the file is unmodified since
+        indexed.
+
+        Parameters
+        ----------
+        file : str, pathlib.Path
+            The local file path
+        file_size : int
+            The expected file size, if known
+        hash : str
+            The expected MD5 hash, if known
+        verify : str
+            The verification level, one of VERIFY_LEVELS.  Defaults to the verify attribute.
+
+        Returns
+        -------
+        bool
+            False if the file size or hash is known not to match
+        """
+        level = self._check_verify_level(verify or self.verify)
+        if level == 'none':
+            return True
+        stat = os.stat(file)
+        if file_size and stat.st_size != file_size:
+            return False
+        if not hash or level == 'size':
+            return True
+        if level == 'size+mtime':
+            indexed = self._hashes.get(file, stat)
+            return indexed == hash if indexed else not self._hashes.modified(file, stat)
+        return self._hashes.md5(file, recompute=level == 'md5-full') == hash
+
+    def _verify_in_background(self, file, hash=None) -> concurrent.futures.Future:
+        """
+        Queue a local file to be hashed on the low priority background thread.
 
-    def _check_filesystem(self, datasets, offline=None, update_exists=True, clobber=False):
+        The hash is indexed, and a warning logged if it doesn't match the expected hash.
+
+        Parameters
+        ----------
+        file : str, pathlib.Path
+            The local file path
+        hash : str
+            The expected MD5 hash, if known
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future result of the verification: True if the hash matches, False if not, or
+            None if the hash is unknown or the file was removed
+        """
+        def verify():
+            if not os.path.exists(file):
+                return
+            md5 = self._hashes.md5(file, recompute=True)
+            if hash and md5 != hash:
+                _logger.warning(f'background verification failed, local md5 mismatch: {file}')
+            return md5 == hash if hash else None
+        return self._background.submit(verify)
+
+    def _check_filesystem(self, datasets, offline=None, update_exists=True, clobber=False,
+                          verify=None):
         """Update the local filesystem for the given datasets.
 
         Given a set of datasets, check whether records correctly reflect the filesystem.
@@ -343,13 +871,18 @@ class One(ConversionMixin):
             If true, the cache is updated to reflect the filesystem
         clobber : bool
             If true and not offline, datasets are re-downloaded regardless of local filesystem
+        verify : str
+            The integrity verification level of local files, one of VERIFY_LEVELS.  Defaults to
+            the verify attribute.
 
         Returns
         -------
         A list of file paths for the datasets (None elements for non-existent datasets)
         """
+        verify = self._check_verify_level(verify or self.verify)
         if offline or self.offline:
             files = []
+            changes = []  # Changes to the dataset records, applied once all files are checked
             if isinstance(datasets, pd.Series):
                 datasets = pd.DataFrame([datasets])
             elif not isinstance(datasets, pd.DataFrame):
@@ -361,26 +894,26 @@ class One(ConversionMixin):
                     # TODO Factor out; hash & file size also checked in _download_file;
                     #  see _update_cache - we need to save changed cache
                     files.append(file)
-                    new_hash = hashfile.md5(file)
-                    new_size = file.stat().st_size
-                    hash_mismatch = rec['hash'] and new_hash != rec['hash']
-                    size_mismatch = rec['file_size'] and new_size != rec['file_size']
+                    # Missing values in the cache tables are NaN
+                    file_size, hash = (None if pd.isna(x) or not x else x
+                                       for x in rec[['file_size', 'hash']])
                     # TODO clobber and tag mismatched
-                    if hash_mismatch or size_mismatch:
+                    if not self._verify_file(file, file_size, hash, verify):
                         # the local file hash doesn't match the dataset table cached hash
-                        # datasets.at[i, ['hash', 'file_size']] = new_hash, new_size
-                        # Raise warning if size changed or hash changed and wasn't empty
-                        if size_mismatch or (hash_mismatch and rec['hash']):
-                            _logger.warning('local md5 or size mismatch')
+                        _logger.warning('local md5 or size mismatch')
+                    elif self.verify_background and verify != 'md5-full':
+                        self._verify_in_background(file, hash)
                 else:
                     files.append(None)
                 if rec['exists'] != file.exists():
                     datasets.at[i, 'exists'] = not rec['exists']
                     if update_exists:
-                        self._cache['datasets'].loc[i, 'exists'] = rec['exists']
+                        changes.append({'id': i, 'exists': file.exists()})
+            self._update_dataset_records(changes)
         else:
             # TODO deal with clobber and exists here?
-            files = self._download_datasets(datasets, update_cache=update_exists, clobber=clobber)
+            files = self._download_datasets(datasets, update_cache=update_exists, clobber=clobber,
+                                            verify=verify)
         return files
 
     def _index_type(self, table='sessions'):
@@ -402,8 +935,8 @@ class One(ConversionMixin):
             Unable to determine the index type of the cache table
         """
         table = self._cache[table] if isinstance(table, str) else table
-        idx_0 = table.index.values[0]
-        if len(table.index.names) == 2 and all(isinstance(x, int) for x in idx_0):
+        idx_0 = table.index[0]
+        if len(table.index.names) == 2 and all(isinstance(x, (int, np.integer)) for x in idx_0):
             return int
         elif len(table.index.names) == 1 and isinstance(idx_0, str):
             return str
@@ -443,7 +976,7 @@ class One(ConversionMixin):
         # to_drop = 'eid' if int_ids else ['eid_0', 'eid_1']
         # det = det.drop(to_drop, axis=1)
         column = ['eid_0', 'eid_1'] if int_ids else 'eid'
-        return self._cache['datasets'].join(det, on=column, how='right')
+        return self._session_datasets(eid).join(det, on=column, how='right')
 
     @util.refresh
     def list_subjects(self) -> List[str]:
@@ -458,6 +991,7 @@ class One(ConversionMixin):
         return self._cache['sessions']['subject'].sort_values().unique().tolist()
 
     @util.refresh
+    @util.memoize
     def list_datasets(self, eid=None, filename=None, collection=None, revision=None,
                       details=False, query_type=None) -> Union[np.ndarray, pd.DataFrame]:
         """
@@ -522,20 +1056,12 @@ class One(ConversionMixin):
         eid = self.to_eid(eid)  # Ensure we have a UUID str list
         if not eid:
             return datasets.iloc[0:0]  # Return empty
-        if self._index_type() is int:
-            eid_num = parquet.str2np(eid)
-            index = ['eid_0', 'eid_1']
-            isin, _ = ismember2d(datasets[index].to_numpy(), eid_num)
-            datasets = datasets[isin]
-        else:
-            session_match = datasets['eid'] == eid
-            datasets = datasets[session_match]
-
-        datasets = util.filter_datasets(datasets, **filter_args)
+        datasets = util.filter_datasets(self._session_datasets(eid), **filter_args)
         # Return only the relative path
         return datasets if details else datasets['rel_path'].sort_values().values.tolist()
 
     @util.refresh
+    @util.memoize
     def list_collections(self, eid=None, filename=None, collection=None, revision=None,
                          details=False, query_type=None) -> Union[np.ndarray, dict]:
         """
@@ -596,16 +1122,15 @@ class One(ConversionMixin):
                              revision=revision, query_type=query_type)
         datasets = self.list_datasets(details=True, **filter_kwargs).copy()
 
-        datasets['collection'] = datasets.rel_path.apply(
-            lambda x: rel_path_parts(x, assert_valid=False)[0] or ''
-        )
+        datasets['collection'] = util.dataset_parts(datasets)['collection'].fillna('')
         if details:
             return {k: table.drop('collection', axis=1)
-                    for k, table in datasets.groupby('collection')}
+                    for k, table in datasets.groupby('collection', observed=True)}
         else:
             return datasets['collection'].unique().tolist()
 
     @util.refresh
+    @util.memoize
     def list_revisions(self, eid=None, filename=None, collection=None, revision=None,
                        details=False, query_type=None):
         """
@@ -660,12 +1185,10 @@ class One(ConversionMixin):
         kwargs = dict(collection=collection, filename=filename, revision=revision,
                       revision_last_before=False, wildcards=self.wildcards, assert_unique=False)
         datasets = util.filter_datasets(datasets, **kwargs)
-        datasets['revision'] = datasets.rel_path.apply(
-            lambda x: (rel_path_parts(x, assert_valid=False)[1] or '').strip('#')
-        )
+        datasets['revision'] = util.dataset_parts(datasets)['revision'].fillna('')
         if details:
             return {k: table.drop('revision', axis=1)
-                    for k, table in datasets.groupby('revision')}
+                    for k, table in datasets.groupby('revision', observed=True)}
         else:
             return datasets['revision'].unique().tolist()
 
@@ -678,6 +1201,7 @@ class One(ConversionMixin):
                     revision: Optional[str] = None,
                     query_type: Optional[str] = None,
                     download_only: bool = False,
+                    verify: Optional[str] = None,
                     **kwargs) -> Union[alfio.AlfBunch, List[Path]]:
         """
         Load all attributes of an ALF object from a Session ID and an object name.  Any datasets
@@ -703,6 +1227,9 @@ class One(ConversionMixin):
             Query cache ('local') or Alyx database ('remote')
         download_only : bool
             When true the data are downloaded and the file path is returned.
+        verify : str
+            The integrity verification level of local files, one of VERIFY_LEVELS.  Defaults to
+            the verify attribute.
         kwargs : dict
             Additional filters for datasets, including namespace and timescale. For full list
             see the one.alf.spec.describe function.
@@ -738,9 +1265,9 @@ class One(ConversionMixin):
         # Validate result before loading
         if len(datasets) == 0:
             raise alferr.ALFObjectNotFound(obj)
-        parts = [rel_path_parts(x) for x in datasets.rel_path]
-        unique_objects = set(x[3] or '' for x in parts)
-        unique_collections = set(x[0] or '' for x in parts)
+        parts = util.dataset_parts(datasets)
+        unique_objects = set(parts['object'].fillna(''))
+        unique_collections = set(parts['collection'].fillna(''))
         if len(unique_objects) > 1:
             raise alferr.ALFMultipleObjectsFound(*unique_objects)
         if len(unique_collections) > 1:
@@ -748,7 +1275,7 @@ class One(ConversionMixin):
 
         # For those that don't exist, download them
         offline = None if query_type == 'auto' else self.mode == 'local'
-        files = self._check_filesystem(datasets, offline=offline)
+        files = self._check_filesystem(datasets, offline=offline, verify=verify)
         files = [x for x in files if x]
         if not files:
             raise alferr.ALFObjectNotFound(f'ALF object "{obj}" not found on disk')
@@ -767,6 +1294,7 @@ class One(ConversionMixin):
                      revision: Optional[str] = None,
                      query_type: Optional[str] = None,
                      download_only: bool = False,
+                     verify: Optional[str] = None,
                      **kwargs) -> Any:
         """
         Load a single dataset for a given session id and dataset name
@@ -792,6 +1320,9 @@ class One(ConversionMixin):
             Query cache ('local') or Alyx database ('remote')
         download_only : bool
             When true the data are downloaded and the file path is returned.
+        verify : str
+            The integrity verification level of local files, one of VERIFY_LEVELS.  Defaults to
+            the verify attribute.
 
         Returns
         -------
@@ -823,7 +1354,7 @@ class One(ConversionMixin):
             raise alferr.ALFObjectNotFound(f'Dataset "{dataset}" not found')
 
         # Check files exist / download remote files
-        file, = self._check_filesystem(datasets, **kwargs)
+        file, = self._check_filesystem(datasets, verify=verify, **kwargs)
 
         if not file:
             raise alferr.ALFObjectNotFound('Dataset not found')
@@ -841,6 +1372,7 @@ class One(ConversionMixin):
                       query_type: Optional[str] = None,
                       assert_present=True,
                       download_only: bool = False,
+                      verify: Optional[str] = None,
                       **kwargs) -> Any:
         """
         Load datasets for a given session id.  Returns two lists the length of datasets.  The
@@ -870,6 +1402,9 @@ class One(ConversionMixin):
             If true, missing datasets raises and error, otherwise None is returned
         download_only : bool
             When true the data are downloaded and the file path is returned.
+        verify : str
+            The integrity verification level of local files, one of VERIFY_LEVELS.  Defaults to
+            the verify attribute.
 
         Returns
         -------
@@ -878,24 +1413,10 @@ class One(ConversionMixin):
         list
             A list of meta data Bunches. If assert_present is False, missing data will be None
         """
-
-        def _verify_specifiers(specifiers):
-            """Ensure specifiers lists matching datasets length"""
-            out = []
-            for spec in specifiers:
-                if not spec or isinstance(spec, str):
-                    out.append([spec] * len(datasets))
-                elif len(spec) != len(datasets):
-                    raise ValueError(
-                        'Collection and revision specifiers must match number of datasets')
-                else:
-                    out.append(spec)
-            return out
-
         if isinstance(datasets, str):
             raise TypeError('`datasets` must be a non-string iterable')
         # Check input args
-        collections, revisions = _verify_specifiers([collections, revisions])
+        collections, revisions = util._verify_specifiers([collections, revisions], len(datasets))
 
         # Short circuit
         query_type = query_type or self.mode
@@ -928,7 +1449,7 @@ class One(ConversionMixin):
                 _logger.warning(message)
 
         # Check files exist / download remote files
-        files = self._check_filesystem(present_datasets, **kwargs)
+        files = self._check_filesystem(present_datasets, verify=verify, **kwargs)
 
         if any(x is None for x in files):
             missing_list = ', '.join(x for x, y in zip(present_datasets.rel_path, files) if not y)
@@ -951,6 +1472,155 @@ class One(ConversionMixin):
             return files, records
         return [alfio.load_file_content(x) for x in files], records
 
+    @util.refresh
+    def load_datasets_batch(self,
+                            eids: List[Union[str, Path, UUID]],
+                            datasets: List[str],
+                            collections: Optional[str] = None,
+                            revisions: Optional[str] = None,
+                            query_type: Optional[str] = None,
+                            assert_present=True,
+                            download_only: bool = False,
+                            verify: Optional[str] = None,
+                            **kwargs) -> pd.DataFrame:
+        """
+        Load the same datasets for several sessions.  Unlike calling load_datasets for each
+        session, the datasets table is filtered once for all sessions and all missing files are
+        downloaded in a single batch.  In remote mode the datasets of the sessions are queried
+        in batches.
+
+        Parameters
+        ----------
+        eids : list of str, UUID, pathlib.Path, dict
+            A list of experiment session identifiers; may be UUIDs, URLs, experiment reference
+            strings, details dicts or Paths.
+        datasets : list of strings
+            The ALF datasets to load.  May be a string or dict of ALF parts.  Supports asterisks
+            as wildcards.
+        collections : str, list
+            The collection(s) to which the object(s) belong, e.g. 'alf/probe01'.
+            This is the relative path of the file from the session root.
+            Supports asterisks as wildcards.
+        revisions : str, list
+            The dataset revision (typically an ISO date).  If no exact match, the previous
+            revision (ordered lexicographically) is returned.  If None, the default revision is
+            returned (usually the most recent revision).  Regular expressions/wildcards not
+            permitted.
+        query_type : str
+            Query cache ('local') or Alyx database ('remote')
+        assert_present : bool
+            If true, missing datasets raises and error, otherwise they are omitted from the
+            returned table
+        download_only : bool
+            When true the data are downloaded and only the file paths are returned.
+        verify : str
+            The integrity verification level of local files, one of VERIFY_LEVELS.  Defaults to
+            the verify attribute.
+
+        Returns
+        -------
+        pandas.DataFrame
+            A table of the datasets records, indexed by session ID and the position of the
+            dataset in the datasets list, in the order of the input sessions and datasets, with
+            the additional columns 'file' (the local file path) and 'data' (the loaded data,
+            unless download_only is true)
+
+        Examples
+        --------
+        >>> eids = one.search(dataset=['trials.intervals', 'trials.choice'])
+        >>> trials = one.load_datasets_batch(eids, ['trials.intervals', 'trials.choice'])
+        >>> choices = trials.xs(1, level='dataset')['data']  # The choices of each session
+        >>> intervals = trials.loc[eids[0], 0]['data']  # The intervals of the first session
+        """
+        if isinstance(datasets, str):
+            raise TypeError('`datasets` must be a non-string iterable')
+        # Check input args
+        collections, revisions = util._verify_specifiers([collections, revisions], len(datasets))
+        query_type = query_type or self.mode
+
+        # Resolve the session IDs once
+        eids = util.ensure_list(self.to_eid(util.ensure_list(eids)))
+        if None in eids:
+            message = 'Some sessions are not in the cache'
+            if assert_present:
+                raise alferr.ALFObjectNotFound(message)
+            _logger.warning(message)
+        eids = list(dict.fromkeys(x for x in eids if x is not None))
+
+        # Fetch the datasets of all sessions at once
+        if query_type == 'remote':
+            # Batched 'session__in' queries of the datasets endpoint
+            records = self.alyx.list_in('datasets', 'session', eids) if eids else []
+            all_datasets = util.datasets2records(records) if records else None
+        else:
+            all_datasets = self._session_datasets(eids) if eids else None
+        if all_datasets is None:
+            all_datasets = self._cache['datasets'].iloc[0:0]
+
+        # Filter and find missing
+        if self.wildcards:  # Append extension wildcard if 'object.attribute' string
+            datasets = [x + ('.*' if isinstance(x, str) and len(x.split('.')) == 2 else '')
+                        for x in datasets]
+        slices = []
+        for i, (x, y, z) in enumerate(zip(datasets, collections, revisions)):
+            # Match the dataset names in all sessions in one pass
+            match = util.filter_datasets(all_datasets, x, y, wildcards=self.wildcards,
+                                         revision_last_before=False, assert_unique=False)
+            match_eids = util.datasets_eids(match)
+            # Sessions with a single match without revision need no further filtering,
+            # otherwise the default or last before revision is found for each session
+            unique = ~pd.Series(match_eids).duplicated(keep=False).values
+            revision = util.dataset_parts(match)['revision'].fillna('').astype(str).values
+            if z is not None:
+                unique[:] = False
+            elif len(match) > 0:
+                unique &= revision == ''  # Parsed as an empty string if no revision
+                if 'default_revision' in match.columns:
+                    unique &= match['default_revision'].fillna(False).values.astype(bool)
+            # As with filter_datasets, the revision column is added to the matching rows
+            match = [match[unique].assign(revision=revision[unique]), *(
+                util.filter_datasets(group, x, y, z, wildcards=self.wildcards)
+                for _, group in match[~unique].groupby(match_eids[~unique], sort=False)
+            )]
+            match = pd.concat(match)
+            slices.append(match.assign(eid=util.datasets_eids(match), dataset=i))
+        present_datasets = pd.concat(slices)
+
+        present = pd.MultiIndex.from_arrays([present_datasets['eid'].values,
+                                             present_datasets['dataset'].values])
+        expected = pd.MultiIndex.from_product([eids, range(len(datasets))])
+        missing = expected[~expected.isin(present)]
+        if len(missing) > 0:
+            missing_list = ', '.join(f'{datasets[i]} ({eid})' for eid, i in missing)
+            message = f'The following datasets are not in the cache: {missing_list}'
+            if assert_present:
+                raise alferr.ALFObjectNotFound(message)
+            else:
+                _logger.warning(message)
+
+        # Check files exist / download remote files in one batch
+        unique = present_datasets[~present_datasets.index.duplicated()]
+        files = self._check_filesystem(unique, verify=verify, **kwargs) if len(unique) else []
+        files = pd.Series(files, index=unique.index, dtype=object)
+        present_datasets['file'] = files.loc[present_datasets.index].values
+        if present_datasets['file'].isna().any():
+            missing_list = ', '.join(present_datasets['rel_path'][present_datasets['file'].isna()])
+            message = f'The following datasets were not downloaded: {missing_list}'
+            if assert_present:
+                raise alferr.ALFObjectNotFound(message)
+            else:
+                _logger.warning(message)
+        if not download_only:
+            present_datasets['data'] = [alfio.load_file_content(x)
+                                        for x in present_datasets['file']]
+
+        # One row per session and dataset, in the order of the input sessions
+        to_drop = [x for x in ('eid_0', 'eid_1') if x in present_datasets.columns]
+        present_datasets = present_datasets.drop(to_drop, axis=1).reset_index()
+        order = np.lexsort((present_datasets['dataset'].values,
+                            pd.Index(eids).get_indexer(present_datasets['eid'])))
+        return present_datasets.iloc[order].set_index(['eid', 'dataset'])
+
     @util.refresh
     def load_dataset_from_id(self,
                              dset_id: Union[str, UUID],
@@ -1007,6 +1677,7 @@ class One(ConversionMixin):
                         revision: Optional[str] = None,
                         query_type: Optional[str] = None,
                         download_only: bool = False,
+                        verify: Optional[str] = None,
                         **kwargs) -> Union[Bunch, List[Path]]:
         """
         Load all objects in an ALF collection from a Session ID.  Any datasets with matching object
@@ -1032,6 +1703,9 @@ class One(ConversionMixin):
             Query cache ('local') or Alyx database ('remote')
         download_only : bool
             When true the data are downloaded and the file path is returned.
+        verify : str
+            The integrity verification level of local files, one of VERIFY_LEVELS.  Defaults to
+            the verify attribute.
         kwargs : dict
             Additional filters for datasets, including namespace and timescale. For full list
             see the one.alf.spec.describe function.
@@ -1068,12 +1742,12 @@ class One(ConversionMixin):
         # Validate result before loading
         if len(datasets) == 0:
             raise alferr.ALFObjectNotFound(object or '')
-        parts = [rel_path_parts(x) for x in datasets.rel_path]
-        unique_objects = set(x[3] or '' for x in parts)
+        objects = util.dataset_parts(datasets)['object'].fillna('').tolist()
+        unique_objects = set(objects)
 
         # For those that don't exist, download them
         offline = None if query_type == 'auto' else self.mode == 'local'
-        files = self._check_filesystem(datasets, offline=offline)
+        files = self._check_filesystem(datasets, offline=offline, verify=verify)
         files = [x for x in files if x]
         if not files:
             raise alferr.ALFObjectNotFound(f'ALF collection "{collection}" not found on disk')
@@ -1083,7 +1757,7 @@ class One(ConversionMixin):
 
         kwargs.update(wildcards=self.wildcards)
         collection = {
-            obj: alfio.load_object([x for x, y in zip(files, parts) if y[3] == obj], **kwargs)
+            obj: alfio.load_object([x for x, y in zip(files, objects) if y == obj], **kwargs)
             for obj in unique_objects
         }
         return Bunch(collection)
@@ -1151,6 +1825,10 @@ def ONE(*, mode='auto', wildcards=True, **kwargs):
     cache_rest : str
         If not in 'local' mode, this determines which http request types to cache.  Default is
         'GET'.  Use None to deactivate cache (not recommended).
+    verify : str
+        The integrity verification level of local files, one of VERIFY_LEVELS.
+    verify_background : bool
+        If true, local files not fully verified when loaded are hashed in the background.
 
     Returns
     -------
@@ -1179,7 +1857,8 @@ def ONE(*, mode='auto', wildcards=True, **kwargs):
 class OneAlyx(One):
     """An API for searching and loading data through the Alyx database"""
     def __init__(self, username=None, password=None, base_url=None, cache_dir=None,
-                 mode='auto', wildcards=True, **kwargs):
+                 mode='auto', wildcards=True, verify='md5-cached', verify_background=False,
+                 **kwargs):
         """An API for searching and loading data through the Alyx database
 
         Parameters
@@ -1203,6 +1882,12 @@ class OneAlyx(One):
         cache_rest : str
             If not in 'local' mode, this determines which http request types to cache.  Default is
             'GET'.  Use None to deactivate cache (not recommended).
+        verify : str
+            The integrity verification level of local files, one of VERIFY_LEVELS.  The load
+            methods have a `verify` parameter that can override this level.
+        verify_background : bool
+            If true, local files not fully verified when loaded are queued to be hashed on a low
+            priority background thread, after their data have been returned.
         """
 
         # Load Alyx Web client
@@ -1213,7 +1898,8 @@ class OneAlyx(One):
                                          **kwargs)
         self._search_endpoint = 'sessions'
         # get parameters override if inputs provided
-        super(OneAlyx, self).__init__(mode=mode, wildcards=wildcards, cache_dir=cache_dir)
+        super(OneAlyx, self).__init__(mode=mode, wildcards=wildcards, cache_dir=cache_dir,
+                                      verify=verify, verify_background=verify_background)
 
     def __repr__(self):
         return f'One ({"off" if self.offline else "on"}line, {self.alyx.base_url})'
@@ -1246,9 +1932,18 @@ class OneAlyx(One):
                 _logger.info('No newer cache available')
                 return
 
-            # Download the remote cache files
-            _logger.info('Downloading remote caches...')
-            files = self.alyx.download_cache_tables()
+            files = None
+            if local_created and not clobber:
+                # Download and merge only the rows that changed since the local tables were made
+                try:
+                    _logger.info('Updating local caches...')
+                    files = self.alyx.download_cache_tables(since=local_created)
+                except (HTTPError, FileNotFoundError, ValueError) as ex:
+                    _logger.debug('Failed to update cache tables incrementally: %s', ex)
+            if not files:
+                # Download the remote cache files
+                _logger.info('Downloading remote caches...')
+                files = self.alyx.download_cache_tables()
             assert any(files)
             super(OneAlyx, self)._load_cache(self.cache_dir)  # Reload cache after download
         except requests.exceptions.HTTPError:
@@ -1332,7 +2027,9 @@ class OneAlyx(One):
         eid = self.to_eid(eid)  # Ensure we have a UUID str list
         if not eid:
             return self._cache['datasets'].iloc[0:0]  # Return empty
-        _, datasets = util.ses2records(self.alyx.rest('sessions', 'read', id=eid))
+        # The datasets are decoded as the response is received, without holding the full response
+        ses = self.alyx.stream(f'/sessions/{eid}', key='data_dataset_session_related')
+        _, datasets = util.ses2records(ses)
         datasets = util.filter_datasets(
             datasets, assert_unique=False, wildcards=self.wildcards, **filters)
         # Return only the relative path
@@ -1419,6 +2116,8 @@ class OneAlyx(One):
             Query cache ('local') or Alyx database ('remote')
         limit : int
             The number of results to fetch in one go (if pagination enabled on server)
+        explain : bool
+            If true also returns the search plan (local queries only, see One.search)
 
         Returns
         -------
@@ -1455,6 +2154,31 @@ class OneAlyx(One):
         eids = util.LazyId(ses)
         return (eids, ses) if details else eids
 
+    def _download_datasets(self, dsets, **kwargs) -> List[Path]:
+        """
+        Download several datasets given a set of datasets
+
+        The datasets are downloaded concurrently, with the progress of all downloads shown in a
+        single progress bar.
+
+        Parameters
+        ----------
+        dsets : list
+            List of dataset dictionaries from an Alyx REST query OR URL strings
+
+        Returns
+        -------
+        list of pathlib.Path
+            A local file path list
+        """
+        if hasattr(dsets, 'iterrows'):
+            dsets = list(map(lambda x: x[1], dsets.iterrows()))
+        sizes = [None if isinstance(d, str) else d.get('file_size') for d in dsets]
+        # The total is unknown if any file size is missing
+        total = None if any(x is None or np.isnan(x) for x in sizes) else sum(sizes)
+        with tqdm(total=total, unit='B', unit_scale=True, disable=self.alyx.silent) as pbar:
+            return super()._download_datasets(dsets, pbar=pbar, **kwargs)
+
     def _download_dataset(self, dset, cache_dir=None, update_cache=True, **kwargs):
         """
         Download a dataset from an Alyx REST dictionary
@@ -1504,7 +2228,7 @@ class OneAlyx(One):
                     did = parquet.str2np(did)
                 elif self._index_type('datasets') is str and not isinstance(did, str):
                     did = parquet.np2str(did)
-                self._cache['datasets'].loc[did, 'exists'] = False
+                self._update_datasets(did, exists=False)
             return
         target_dir = Path(cache_dir or self.cache_dir, get_alf_path(url)).parent
         return self._download_file(url=url, target_dir=target_dir, **kwargs)
@@ -1523,8 +2247,8 @@ class OneAlyx(One):
             self.alyx.rest('files', 'partial_update',
                            id=fr[0]['url'][-36:], data={'json': json_field})
 
-    def _download_file(self, url, target_dir,
-                       clobber=False, offline=None, keep_uuid=False, file_size=None, hash=None):
+    def _download_file(self, url, target_dir, clobber=False, offline=None, keep_uuid=False,
+                       file_size=None, hash=None, pbar=None, verify=None):
         """
         Downloads a single file from an HTTP webserver.  The webserver in question is set by the
         AlyxClient object.
@@ -1546,44 +2270,62 @@ class OneAlyx(One):
             The expected file size to compare with downloaded file
         hash : str
             The expected file hash to compare with downloaded file
+        pbar : tqdm.tqdm
+            A progress bar shared by concurrent downloads, updated with the number of bytes
+            downloaded, or the size of the file if already downloaded
+        verify : str
+            The integrity verification level of an existing local file, one of VERIFY_LEVELS.
+            Defaults to the verify attribute.  Downloaded files are always hashed as they are
+            written.
 
         Returns
         -------
         pathlib.Path
-            The file path of the downloaded file
+            The file path of the downloaded file, or None if the downloaded file size or hash did
+            not match
         """
         if offline is None:
             offline = self.mode == 'local'
+        # Missing values in the cache tables are NaN
+        file_size, hash = (None if pd.isna(x) else x for x in (file_size, hash))
         Path(target_dir).mkdir(parents=True, exist_ok=True)
         local_path = target_dir / os.path.basename(url)
         if not keep_uuid:
             local_path = alfio.remove_uuid_file(local_path, dry=True)
+        md5 = None
         if Path(local_path).exists():
-            # the local file hash doesn't match the dataset table cached hash
-            hash_mismatch = hash and hashfile.md5(Path(local_path)) != hash
-            file_size_mismatch = file_size and Path(local_path).stat().st_size != file_size
-            if (hash_mismatch or file_size_mismatch) and not offline:
-                clobber = True
-                if not self.alyx.silent:
-                    _logger.warning(f'local md5 or size mismatch, re-downloading {local_path}')
+            # the local file size or hash doesn't match the dataset table cached size or hash
+            if not self._verify_file(local_path, file_size, hash, verify):
+                if not offline:
+                    clobber = True
+                    if not self.alyx.silent:
+                        _logger.warning(
+                            f'local md5 or size mismatch, re-downloading {local_path}')
+            elif not clobber and self.verify_background and (verify or self.verify) != 'md5-full':
+                self._verify_in_background(local_path, hash)
         # if there is no cached file, download
         else:
             clobber = True
         if clobber and not offline:
-            local_path, md5 = self.alyx.download_file(
-                url, cache_dir=str(target_dir), clobber=clobber, return_md5=True)
-            # TODO If 404 update JSON on Alyx for data record
-            # post download, if there is a mismatch between Alyx and the newly downloaded file size
-            # or hash flag the offending file record in Alyx for database maintenance
-            hash_mismatch = hash and md5 != hash
-            file_size_mismatch = file_size and Path(local_path).stat().st_size != file_size
-            if hash_mismatch or file_size_mismatch:
+            # The file is moved into place only if its size and hash match
+            try:
+                local_path, md5 = self.alyx.download_file(
+                    url, cache_dir=str(target_dir), clobber=clobber, pbar=pbar,
+                    file_size=file_size, hash=hash, return_md5=True)
+            except alferr.ALFIntegrityError as ex:
+                # TODO If 404 update JSON on Alyx for data record
+                # post download, if there is a mismatch between Alyx and the newly downloaded file
+                # size or hash flag the offending file record in Alyx for database maintenance
+                _logger.error(ex)
                 self._tag_mismatched_file_record(url)
-                # TODO Update cache here
-        if keep_uuid:
-            return local_path
-        else:
-            return alfio.remove_uuid_file(local_path)
+                return  # TODO Update cache here
+        elif pbar is not None and Path(local_path).exists():
+            pbar.update(Path(local_path).stat().st_size)
+        if not keep_uuid:
+            local_path = alfio.remove_uuid_file(local_path)
+        if md5:  # Index the hash computed while downloading
+            self._hashes.put(local_path, md5)
+        return local_path
 
     @staticmethod
     def setup(base_url=None, **kwargs):
@@ -1630,19 +2372,46 @@ class OneAlyx(One):
             if cache_path or mode == 'local':
                 return cache_path
 
-        # If eid is a list recurse through it and return a list
+        # If eid is a list, query Alyx in batches and return a list
         if isinstance(eid, list):
-            unwrapped = unwrap(self.path2eid)
-            return [unwrapped(self, e, query_type='remote') for e in eid]
+            return list(map(self._ses2path, self.alyx.list_by_id('sessions', eid)))
 
         # if it wasn't successful, query Alyx
         ses = self.alyx.rest('sessions', 'list', django=f'pk,{eid}')
-        if len(ses) == 0:
-            return None
-        else:
-            return Path(self.cache_dir).joinpath(
-                ses[0]['lab'], 'Subjects', ses[0]['subject'], ses[0]['start_time'][:10],
-                str(ses[0]['number']).zfill(3))
+        return self._ses2path(ses[0]) if len(ses) else None
+
+    def _ses2path(self, ses):
+        """Return the local session path of an Alyx session record"""
+        return None if ses is None else Path(self.cache_dir).joinpath(
+            ses['lab'], 'Subjects', ses['subject'], ses['start_time'][:10],
+            str(ses['number']).zfill(3))
+
+    def eid2ref(self, eid, as_dict=True, parse=True):
+        """
+        Get human-readable session ref from path
+
+        The details of a list of sessions are queried from Alyx in batches.  See
+        one.converters.ConversionMixin.eid2ref for details.
+
+        Parameters
+        ----------
+        eid : str, uuid.UUID, list
+            The experiment uuid(s) to find reference for
+        as_dict : bool
+            If false a string is returned in the form 'subject_sequence_yyyy-mm-dd'
+        parse : bool
+            If true, the reference date and sequence are parsed from strings to their respective
+            data types
+
+        Returns
+        -------
+        dict, str, list
+            One or more objects with keys ('subject', 'date', 'sequence'), or strings with the
+            form yyyy-mm-dd_n_subject
+        """
+        if isinstance(eid, list) and self.mode != 'local':
+            return [self._details2ref(d, as_dict, parse) for d in self.get_details(eid)]
+        return super().eid2ref(eid, as_dict=as_dict, parse=parse)
 
     @util.refresh
     def path2eid(self, path_obj: Union[str, Path], query_type=None) -> util.Listable(Path):
@@ -1759,25 +2528,35 @@ class OneAlyx(One):
 
         Parameters
         ----------
-        dset : str, np.ndarray, tuple
-            A dataset name, dataset uuid or dataset integer id
+        dset : str, np.ndarray, tuple, list
+            A dataset name, dataset uuid or dataset integer id, or a list thereof
 
         Returns
         -------
-        str
-            The dataset type
+        str, list
+            The dataset type, or a list of dataset types for a list of datasets
         """
         assert self.mode != 'local' and not self.offline, 'Unable to connect to Alyx in local mode'
-        # Ensure dset is a str uuid
-        if isinstance(dset, str) and not is_uuid_string(dset):
-            dset = self._dataset_name2id(dset)
-        if isinstance(dset, np.ndarray):
-            dset = parquet.np2str(dset)[0]
-        if isinstance(dset, tuple) and all(isinstance(x, int) for x in dset):
-            dset = parquet.np2str(np.array(dset))
-        if not is_uuid_string(dset):
-            raise ValueError('Unrecognized name or UUID')
-        return self.alyx.rest('datasets', 'read', id=dset)['dataset_type']
+
+        def to_uuid(dset):
+            """Ensure dset is a str uuid"""
+            if isinstance(dset, str) and not is_uuid_string(dset):
+                dset = self._dataset_name2id(dset)
+            if isinstance(dset, np.ndarray):
+                dset = parquet.np2str(dset)[0]
+            if isinstance(dset, tuple) and all(isinstance(x, int) for x in dset):
+                dset = parquet.np2str(np.array(dset))
+            if not is_uuid_string(dset):
+                raise ValueError('Unrecognized name or UUID')
+            return dset
+
+        if isinstance(dset, list):  # Query Alyx in batches
+            dsets = list(map(to_uuid, dset))
+            records = self.alyx.list_by_id('datasets', dsets)
+            # Datasets not returned are read individually, raising an error if not found
+            return [(r or self.alyx.rest('datasets', 'read', id=d))['dataset_type']
+                    for d, r in zip(dsets, records)]
+        return self.alyx.rest('datasets', 'read', id=to_uuid(dset))['dataset_type']
 
     def describe_revision(self, revision, full=False):
         """Print description of a revision
@@ -1846,23 +2625,37 @@ class OneAlyx(One):
         """
         if (query_type or self.mode) == 'local':
             return super().get_details(eid, full=full)
-        # If eid is a list of eIDs recurse through list and return the results
+
+        def details(dets, local_path):
+            """If not full return the normal output like from a one.search"""
+            det_fields = ['subject', 'start_time', 'number', 'lab', 'project',
+                          'url', 'task_protocol', 'local_path']
+            out = {k: v for k, v in dets.items() if k in det_fields}
+            out.update({'local_path': local_path,
+                        'date': datetime.fromisoformat(out['start_time']).date()})
+            return out
+
+        # If eid is a list of eIDs, query Alyx concurrently and return the results
         if isinstance(eid, list):
-            details_list = []
-            for p in eid:
-                details_list.append(self.get_details(p, full=full))
-            return details_list
-        # load all details
-        dets = self.alyx.rest('sessions', 'read', eid)
-        if full:
-            return dets
-        # If it's not full return the normal output like from a one.search
-        det_fields = ['subject', 'start_time', 'number', 'lab', 'project',
-                      'url', 'task_protocol', 'local_path']
-        out = {k: v for k, v in dets.items() if k in det_fields}
-        out.update({'local_path': self.eid2path(eid),
-                    'date': datetime.fromisoformat(out['start_time']).date()})
-        return out
+            def read(e):
+                return self.alyx.rest('sessions', 'read', e)
+            if full:
+                # The full details, e.g. the session's datasets, are only returned by the read
+                # endpoint, so can't be batched; the sessions are read concurrently instead
+                with concurrent.futures.ThreadPoolExecutor(max_workers=N_THREADS) as executor:
+                    return list(executor.map(read, eid))
+            # Sessions not returned by the batched query are read individually, raising an
+            # error if not found
+            records = self.alyx.list_by_id('sessions', eid)
+            records = [rec or read(e) for e, rec in zip(eid, records)]
+            return [details(rec, self._ses2path(rec)) for rec in records]
+        if full:  # load all details
+            return self.alyx.rest('sessions', 'read', eid)
+        # Only the session fields are returned, so the datasets are decoded and discarded as the
+        # response is received
+        dets = self.alyx.stream(f'/sessions/{eid}', key='data_dataset_session_related')
+        collections.deque(dets.pop('data_dataset_session_related'), maxlen=0)
+        return details(dets, self.eid2path(eid))
 
     # def _update_cache(self, ses, dataset_types):
     #     """
@@ -0,0 +1,386 @@
+"""Memoization, deferred loading, background work and SQLite helpers for the cache tables"""
+import collections
+import concurrent.futures
+import copy
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from collections.abc import Mapping
+
+import pandas as pd
+from iblutil.util import Bunch
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _hashable(obj):
+    """Recursively convert lists, sets and dicts to tuples, raising TypeError if unhashable"""
+    if isinstance(obj, (list, tuple)):
+        return tuple(map(_hashable, obj))
+    elif isinstance(obj, (set, frozenset)):
+        return frozenset(map(_hashable, obj))
+    elif isinstance(obj, Mapping):
+        return tuple(sorted((k, _hashable(v)) for k, v in obj.items()))
+    hash(obj)
+    return obj
+
+
+def _memo_tables(cache) -> tuple:
+    """The loaded cache tables, without loading deferred ones"""
+    return tuple(dict.get(cache, x) for x in ('sessions', 'datasets'))
+
+
+def _copy(value):
+    """Copy a (memoized) method result so that the caller may modify it"""
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return value.copy()
+    elif isinstance(value, (list, tuple, dict)):
+        return copy.deepcopy(value)
+    return value
+
+
+def _nbytes(value) -> int:
+    """The approximate size in bytes of a method result"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(index=True)))
+    elif isinstance(value, np.ndarray):
+        return value.nbytes
+    elif isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(map(_nbytes, value))
+    elif isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_nbytes(k) + _nbytes(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class LRUMemo:
+    """
+    A least-recently-used memo of method results, bounded by their total size in bytes.
+
+    Each result is stored along with weak references to the cache tables (and their indices) it
+    was computed from, and is discarded upon access if the tables have since been replaced.
+    In-place changes to the tables are not detected: the memo should be cleared after modifying
+    them, which increments its generation.  Results computed before the memo was cleared are
+    not stored.  The memo may be shared between threads.
+
+    Attributes
+    ----------
+    max_bytes : int
+        The maximum total size of the stored results.  If 0, results are not memoized.
+    hits : int
+        The number of results returned from the memo.
+    misses : int
+        The number of results that were computed.
+    nbytes : int
+        The approximate total size of the stored results.
+    generation : int
+        The number of times the memo was cleared.
+
+    Examples
+    --------
+    >>> one.search(subject='SWC_043')
+    >>> one.search(subject='SWC_043')
+    >>> one.memo.hits, one.memo.misses
+    (1, 1)
+    >>> one.memo.max_bytes = 0  # Disable memoization
+    """
+    def __init__(self, max_bytes=2 ** 27):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self.generation = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return (f'<LRUMemo: {len(self)} results, {self.nbytes} / {self.max_bytes} bytes, '
+                f'{self.hits} hits, {self.misses} misses>')
+
+    @staticmethod
+    def _refs(tables) -> tuple:
+        return tuple((None, None) if x is None else (weakref.ref(x), x.index) for x in tables)
+
+    def get(self, key, tables):
+        """
+        Return a memoized result.
+
+        Parameters
+        ----------
+        key : tuple
+            The hashable key of the result.
+        tables : tuple of pandas.DataFrame
+            The current cache tables (None for tables not loaded).
+
+        Returns
+        -------
+        bool
+            True if the result was found.
+        any
+            The result, or None if not found.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, nbytes, refs = entry
+                current = all(ref is None or (ref() is table and table.index is index)
+                              for (ref, index), table in zip(refs, tables))
+                if current:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                self._pop(key)
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, tables, generation=None):
+        """
+        Store a result, evicting the least recently used results if above the size limit.
+
+        Parameters
+        ----------
+        key : tuple
+            The hashable key of the result.
+        value : any
+            The result to store.  Results larger than max_bytes are not stored.
+        tables : tuple of pandas.DataFrame
+            The cache tables the result was computed from (None for tables not loaded).
+        generation : int
+            The memo generation when the computation started.  If the memo has since been
+            cleared, the result is not stored.
+        """
+        nbytes = _nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        refs = self._refs(tables)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return  # The tables were modified while computing the result
+            self._pop(key)
+            self._entries[key] = (value, nbytes, refs)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def clear(self):
+        """Remove all results and increment the generation, e.g. after modifying the tables"""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.generation += 1
+
+
+class BackgroundQueue:
+    """
+    A queue of functions called in turn on a low priority background thread.
+
+    The thread is a daemon thread started upon the first call, so pending calls do not prevent
+    the interpreter from exiting.  Where supported (i.e. on Linux), the scheduling priority of
+    the thread is lowered so that it yields to the calling threads.
+
+    Examples
+    --------
+    >>> background = BackgroundQueue('one-verify')
+    >>> future = background.submit(hashfile.md5, file)
+    >>> background.join()  # Wait for all queued calls to complete
+    >>> future.result()
+    """
+    def __init__(self, name='one-background', niceness=10):
+        """
+        Parameters
+        ----------
+        name : str
+            The name of the background thread
+        niceness : int
+            The amount by which the thread's scheduling priority is lowered
+        """
+        self.name = name
+        self.niceness = niceness
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """The number of queued calls, including one in progress"""
+        return self._queue.unfinished_tasks
+
+    def submit(self, fcn, *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Queue a function call.
+
+        Parameters
+        ----------
+        fcn : function
+            The function to call in the background
+        args, kwargs
+            The function arguments
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future result of the call
+        """
+        future = concurrent.futures.Future()
+        self._queue.put((future, fcn, args, kwargs))
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return future
+
+    def join(self):
+        """Block until all queued calls have completed"""
+        self._queue.join()
+
+    def _run(self):
+        try:  # Threads are scheduled as processes on Linux
+            thread_id = threading.get_native_id()
+            os.setpriority(os.PRIO_PROCESS, thread_id,
+                           os.getpriority(os.PRIO_PROCESS, thread_id) + self.niceness)
+        except (AttributeError, OSError):
+            logger.debug('Unable to lower the priority of thread %s', self.name)
+        while True:
+            future, fcn, args, kwargs = self._queue.get()
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fcn(*args, **kwargs))
+                    except Exception as ex:
+                        future.set_exception(ex)
+            finally:
+                self._queue.task_done()
+
+
+_sqlite_schemas = set()  # The (database path, schema) pairs created by this process
+_sqlite_lock = threading.Lock()
+
+
+@contextmanager
+def sqlite_connect(filename, schema):
+    """
+    Open a SQLite database, creating it and its schema if necessary.
+
+    The database is set to write-ahead logging mode, in which readers don't block the writer,
+    and its schema script is run, only upon the first connection of the process to each file.
+    The transaction is committed upon exit, or rolled back if an exception is raised.  Only
+    statements that modify the database start a write transaction.
+
+    Parameters
+    ----------
+    filename : str, pathlib.Path
+        The database file path.  The parent directory is created if necessary.
+    schema : str
+        An idempotent SQL script that creates the database tables, e.g. with CREATE TABLE IF
+        NOT EXISTS statements
+
+    Yields
+    ------
+    sqlite3.Connection
+        The database connection, closed upon exit
+
+    Examples
+    --------
+    >>> with sqlite_connect('hashes.sqlite', 'CREATE TABLE IF NOT EXISTS hashes (...);') as conn:
+    ...     rows = conn.execute('SELECT * FROM hashes').fetchall()
+    """
+    filename = Path(filename)
+    key = (str(filename.absolute()), schema)
+    exists = filename.exists()  # The file may have been removed since created
+    if not exists:
+        filename.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(filename), timeout=30)
+    try:
+        if not exists or key not in _sqlite_schemas:
+            with _sqlite_lock:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(schema)
+                _sqlite_schemas.add(key)
+        with conn:  # Commit or roll back the transaction
+            yield conn
+    finally:
+        conn.close()
+
+
+class LazyBunch(Bunch):
+    """
+    A Bunch whose values may be loaded upon first access.
+
+    A deferred value is not in the Bunch keys until first accessed, either as an item or an
+    attribute, at which point its loader is called and the value stored.  Setting a value
+    cancels any pending loader.
+
+    Examples
+    --------
+    >>> cache = LazyBunch(sessions=sessions)
+    >>> cache.defer('datasets', lambda: parquet.load('datasets.pqt')[0])
+    >>> list(cache.keys())
+    ['sessions']
+    >>> cache.datasets  # Loads the table
+    """
+    __slots__ = ('_loaders',)
+
+    def __init__(self, *args, **kwargs):
+        self._loaders = {}
+        super().__init__(*args, **kwargs)
+
+    def defer(self, key, loader):
+        """
+        Set a function to call for the value of a key upon first access.
+
+        Parameters
+        ----------
+        key : str
+            The key to defer.  Any current value is removed.
+        loader : function
+            A function without arguments that returns the value.
+        """
+        self.pop(key, None)
+        self._loaders[key] = loader
+
+    @property
+    def deferred(self) -> tuple:
+        """tuple: The keys whose values have not been loaded yet"""
+        return tuple(self._loaders)
+
+    def __missing__(self, key):
+        if key not in self._loaders:
+            raise KeyError(key)
+        value = self._loaders[key]()
+        self[key] = value
+        return value
+
+    def __getattr__(self, name):
+        # Only called when the attribute is not in the Bunch
+        if name == '_loaders' or name not in self._loaders:
+            raise AttributeError(f'{self.__class__.__name__} has no attribute {name}')
+        return self[name]
+
+    def __setattr__(self, name, value):
+        if name in ('_loaders', '__dict__'):
+            super().__setattr__(name, value)
+        else:
+            self[name] = value
+
+    def __setitem__(self, key, value):
+        self._loaders.pop(key, None)
+        super().__setitem__(key, value)
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self._loaders
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
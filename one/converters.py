@@ -250,15 +250,13 @@ class ConversionMixin:
             # Remove the UUID from path
             filepath = urlsplit(filepath).path.strip('/')
             filepath = alfio.remove_uuid_file(PurePosixPath(filepath), dry=True)
-            session_path = get_session_path(filepath).as_posix()
+            eid = ConversionMixin.path2eid(self, filepath)  # Look up in cache tables only
         else:
             # No way of knowing root session path parts without cache tables
             eid = self.path2eid(filepath)
-            session_series = self.list_datasets(eid, details=True).session_path
-            if not eid or session_series.empty:
-                return
-            session_path, *_ = session_series
-        rec = rec[rec['session_path'] == session_path]
+        if not eid:
+            return
+        rec = self._session_datasets(eid)
         rec = rec[rec['rel_path'].apply(lambda x: filepath.as_posix().endswith(x))]
         assert len(rec) < 2, 'Multiple records found'
         return None if rec.empty else rec.squeeze()
@@ -369,7 +367,11 @@ class ConversionMixin:
         [{'subject': 'flowers', 'date': datetime.date(2018, 7, 13), 'sequence': 1},
          {'subject': 'KS005', 'date': datetime.date(2019, 4, 11), 'sequence': 1}]
         """
-        d = self.get_details(eid)
+        return self._details2ref(self.get_details(eid), as_dict=as_dict, parse=parse)
+
+    @staticmethod
+    def _details2ref(d, as_dict=True, parse=True) -> Union[str, Mapping]:
+        """Return the session ref of a session details record; see ConversionMixin.eid2ref"""
         if parse:
             ref = {'subject': d['subject'], 'date': d['date'], 'sequence': d['number']}
             format_str = '{date:%Y-%m-%d}_{sequence:d}_{subject:s}'
@@ -0,0 +1,454 @@
+"""Indices and statistics of the cache tables for fast searches"""
+import json
+import weakref
+from pathlib import Path
+
+import pandas as pd
+from iblutil.io import parquet
+import numpy as np
+
+from one.util import ensure_list
+
+
+class SessionIndex:
+    """
+    A compressed sparse row (CSR) index of session ID to datasets cache table rows.
+
+    The datasets table is sorted by dataset ID, so the rows of each session are not necessarily
+    contiguous.  The index stores a permutation of the table rows sorted by session, along with
+    the start of each session's range, so that a session's datasets are found without scanning
+    the table.
+
+    Examples
+    --------
+    >>> index = SessionIndex(one._cache['datasets'])
+    >>> datasets = one._cache['datasets'].iloc[index.rows(eid)]
+    """
+    def __init__(self, datasets):
+        self._table = weakref.ref(datasets)
+        self._table_index = datasets.index
+        self._int_ids = 'eid' not in datasets.columns
+        if len(datasets) == 0:
+            keys, order, indptr = [], np.array([], dtype=int), np.zeros(1, dtype=int)
+        elif self._int_ids:
+            eids = datasets[['eid_0', 'eid_1']].to_numpy()
+            order = np.lexsort((eids[:, 1], eids[:, 0]))  # Stable, so rows remain in table order
+            eids = eids[order]
+            starts = np.flatnonzero(np.any(eids[1:] != eids[:-1], axis=1)) + 1
+            indptr = np.r_[0, starts, len(eids)]
+            keys = map(tuple, eids[indptr[:-1]].tolist())
+        else:
+            codes, keys = pd.factorize(datasets['eid'].values)
+            order = np.argsort(codes, kind='stable')
+            indptr = np.r_[0, np.cumsum(np.bincount(codes, minlength=len(keys)))]
+        self._order = order
+        self._indptr = indptr
+        self._keys = {k: i for i, k in enumerate(keys)}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def is_current(self, datasets) -> bool:
+        """
+        Check whether the index was built from the given table and the table rows are unchanged.
+
+        Parameters
+        ----------
+        datasets : pandas.DataFrame
+            A datasets cache table
+
+        Returns
+        -------
+        bool
+            True if the index may be used to look up the table rows
+        """
+        return (self._table() is datasets
+                and datasets.index is self._table_index
+                and self._int_ids == ('eid' not in datasets.columns)
+                and len(datasets) == len(self._order))
+
+    def rows(self, eid) -> np.ndarray:
+        """
+        Return the integer positions of the datasets for one or more sessions.
+
+        Parameters
+        ----------
+        eid : str, list
+            One or more experiment UUID strings
+
+        Returns
+        -------
+        numpy.array
+            The sorted positional indices of the datasets belonging to the session(s)
+        """
+        eids = ensure_list(eid)
+        if self._int_ids:
+            eids = map(tuple, parquet.str2np(eids).tolist()) if len(eids) else []
+        ranges = (self._keys.get(x) for x in eids)
+        rows = [self._order[self._indptr[i]:self._indptr[i + 1]] for i in ranges if i is not None]
+        if len(rows) == 0:
+            return np.array([], dtype=int)
+        return rows[0] if len(rows) == 1 else np.unique(np.concatenate(rows))
+
+
+class DateIndex:
+    """
+    A sorted index of session dates for date range queries.
+
+    The session dates are parsed once and sorted, so that the sessions within a date range are
+    found with two binary searches.
+
+    Examples
+    --------
+    >>> index = DateIndex(one._cache['sessions'])
+    >>> start, end = validate_date_range(['2020-01-01', '2020-01-31'])
+    >>> sessions = one._cache['sessions'].iloc[index.rows(start, end)]
+    """
+    def __init__(self, sessions):
+        self._table = weakref.ref(sessions)
+        self._table_index = sessions.index
+        dates = sessions['date'] if len(sessions) else pd.Series([], dtype='datetime64[ns]')
+        self.dates = pd.to_datetime(dates).values  # datetime64 in table order
+        self._order = np.argsort(self.dates, kind='stable')  # NaT last
+        self._sorted = self.dates[self._order]
+        self._n_dates = np.count_nonzero(~np.isnat(self.dates))
+
+    def is_current(self, sessions) -> bool:
+        """
+        Check whether the index was built from the given table and the table rows are unchanged.
+
+        Parameters
+        ----------
+        sessions : pandas.DataFrame
+            A sessions cache table
+
+        Returns
+        -------
+        bool
+            True if the index may be used to look up the table rows
+        """
+        return self._table() is sessions and sessions.index is self._table_index
+
+    def _bounds(self, start, end) -> tuple:
+        start, end = (np.datetime64(pd.Timestamp(x).to_datetime64()) for x in (start, end))
+        lo = np.searchsorted(self._sorted[:self._n_dates], start, side='left')
+        hi = np.searchsorted(self._sorted[:self._n_dates], end, side='right')
+        return lo, hi
+
+    def count(self, start, end) -> int:
+        """
+        Return the number of sessions within a date range.
+
+        Parameters
+        ----------
+        start, end : pandas.Timestamp
+            The inclusive date range bounds, e.g. as returned by validate_date_range.
+
+        Returns
+        -------
+        int
+            The number of sessions within the range
+        """
+        lo, hi = self._bounds(start, end)
+        return int(hi - lo)
+
+    def rows(self, start, end) -> np.ndarray:
+        """
+        Return the integer positions of the sessions within a date range.
+
+        Parameters
+        ----------
+        start, end : pandas.Timestamp
+            The inclusive date range bounds, e.g. as returned by validate_date_range.
+
+        Returns
+        -------
+        numpy.array
+            The sorted positional indices of the sessions within the range
+        """
+        lo, hi = self._bounds(start, end)
+        return np.sort(self._order[lo:hi])
+
+    def mask(self, start, end) -> np.ndarray:
+        """
+        Return a boolean mask of the sessions within a date range.
+
+        Parameters
+        ----------
+        start, end : pandas.Timestamp
+            The inclusive date range bounds, e.g. as returned by validate_date_range.
+
+        Returns
+        -------
+        numpy.array
+            A boolean array, True for the table rows within the range
+        """
+        lo, hi = self._bounds(start, end)
+        mask = np.zeros(len(self.dates), dtype=bool)
+        mask[self._order[lo:hi]] = True
+        return mask
+
+
+class TableStats:
+    """
+    Per-column value frequencies of a cache table, computed upon first use.
+
+    These are used to estimate the selectivity of search predicates without evaluating them
+    over the whole table.
+
+    Examples
+    --------
+    >>> stats = TableStats(one._cache['sessions'])
+    >>> stats.selectivity('subject', ['ZM_1085', 'ZM_1087'])
+    0.05
+    """
+    def __init__(self, table):
+        self._table = weakref.ref(table)
+        self._table_index = table.index
+        self.n_rows = len(table)
+        self._counts = {}
+
+    def is_current(self, table) -> bool:
+        """
+        Check whether the statistics were computed from the given table.
+
+        Parameters
+        ----------
+        table : pandas.DataFrame
+            A cache table
+
+        Returns
+        -------
+        bool
+            True if the statistics may be used for the table
+        """
+        return self._table() is table and table.index is self._table_index
+
+    def value_counts(self, column) -> pd.Series:
+        """
+        Return the number of rows of each distinct column value, excluding missing values.
+
+        Parameters
+        ----------
+        column : str
+            A table column name
+
+        Returns
+        -------
+        pandas.Series
+            The row count of each distinct value
+        """
+        if column not in self._counts:
+            counts = self._table()[column].value_counts(sort=False, dropna=True)
+            self._counts[column] = counts[counts > 0]
+        return self._counts[column]
+
+    def n_distinct(self, column) -> int:
+        """
+        Return the number of distinct values in a column.
+
+        Parameters
+        ----------
+        column : str
+            A table column name
+
+        Returns
+        -------
+        int
+            The number of distinct values, excluding missing values
+        """
+        return len(self.value_counts(column))
+
+    def selectivity(self, column, values=None, pattern=None, regex=True) -> float:
+        """
+        Return the fraction of rows whose column value is in values or contains pattern.
+
+        Parameters
+        ----------
+        column : str
+            A table column name
+        values : list
+            A list of values to match exactly
+        pattern : str
+            A pattern that matching values contain
+        regex : bool
+            If true the pattern is a regular expression, otherwise a literal string
+
+        Returns
+        -------
+        float
+            The fraction of table rows matching, between 0 and 1
+        """
+        counts = self.value_counts(column)
+        if pattern is not None:
+            matches = counts.index.astype(str).str.contains(pattern, regex=regex)
+        else:
+            matches = counts.index.isin(values)
+        return float(counts.values[matches].sum()) / max(self.n_rows, 1)
+
+
+class DatasetIndex:
+    """
+    An inverted index of relative dataset paths to the sessions that contain them.
+
+    For each unique relative path the index stores the sorted row positions in the sessions
+    table of the sessions containing such a dataset.  A dataset query is matched once against
+    each unique path, and the sessions of the matching paths are combined with set operations,
+    so that the datasets table is not scanned.  The index ignores the 'exists' field, therefore
+    the sessions returned may contain datasets that don't exist.
+
+    The paths matching each query term are kept, so that repeated queries don't scan the paths
+    again.
+
+    The index may be saved along with the metadata of the tables it was built from, and is only
+    loaded for tables with the same metadata and number of rows and paths.
+
+    Examples
+    --------
+    >>> index = DatasetIndex(one._cache['datasets'], one._cache['sessions'])
+    >>> sessions = one._cache['sessions'].iloc[index.sessions(['spikes.times', 'trials'])]
+    """
+    def __init__(self, datasets, sessions, _postings=None):
+        self._tables = (weakref.ref(datasets), weakref.ref(sessions))
+        self._table_indices = (datasets.index, sessions.index)
+        self.shape = (len(datasets), len(sessions))
+        self._matches = {}  # Map of (query term, regex) -> positions of the matching paths
+        if _postings is not None:
+            self._paths, self._indptr, self._rows = _postings
+            return
+        rel_path = datasets['rel_path'] if len(datasets) else pd.Series([], dtype=object)
+        if not isinstance(rel_path.dtype, pd.CategoricalDtype):
+            rel_path = rel_path.astype('category')
+        self._paths = np.asarray(rel_path.cat.categories, dtype=str)
+        codes = rel_path.cat.codes.values.astype(np.int64)
+        ses_rows = self._session_rows(datasets, sessions)
+        valid = (codes >= 0) & (ses_rows >= 0)
+        # Unique (path, session) pairs, sorted by path then session
+        pairs = np.unique(codes[valid] * max(len(sessions), 1) + ses_rows[valid])
+        path_codes, self._rows = np.divmod(pairs, max(len(sessions), 1))
+        counts = np.bincount(path_codes, minlength=len(self._paths))
+        self._indptr = np.r_[0, np.cumsum(counts)]
+
+    @staticmethod
+    def _session_rows(datasets, sessions) -> np.ndarray:
+        """The row position in the sessions table of each dataset's session, or -1 if absent"""
+        if len(datasets) == 0 or len(sessions) == 0:
+            return np.full(len(datasets), -1, dtype=np.int64)
+        if 'eid' in datasets.columns:
+            keys = pd.Index(datasets['eid'].values)
+        else:
+            keys = pd.MultiIndex.from_arrays([datasets['eid_0'].values, datasets['eid_1'].values])
+        return sessions.index.get_indexer(keys).astype(np.int64)
+
+    def is_current(self, datasets, sessions) -> bool:
+        """
+        Check whether the index was built from the given tables and their rows are unchanged.
+
+        Parameters
+        ----------
+        datasets : pandas.DataFrame
+            A datasets cache table
+        sessions : pandas.DataFrame
+            A sessions cache table
+
+        Returns
+        -------
+        bool
+            True if the index may be used to look up the sessions of the tables
+        """
+        return (self._tables[0]() is datasets and self._tables[1]() is sessions
+                and datasets.index is self._table_indices[0]
+                and sessions.index is self._table_indices[1])
+
+    def sessions(self, query, regex=True) -> np.ndarray:
+        """
+        Return the row positions of the sessions containing datasets that match all queries.
+
+        Parameters
+        ----------
+        query : str, list
+            One or more strings, each contained in the relative path of at least one of the
+            session datasets.
+        regex : bool
+            If true, the queries are regular expressions, otherwise they are literal strings.
+
+        Returns
+        -------
+        numpy.array
+            The sorted positional indices of the matching sessions
+        """
+        rows = None
+        for term in ensure_list(query):
+            matches = self._matches.get((term, regex))
+            if matches is None:
+                paths = pd.Series(self._paths, dtype=object)
+                matches = np.flatnonzero(paths.str.contains(term, regex=regex).values)
+                if len(self._matches) >= 1024:
+                    self._matches.clear()
+                self._matches[(term, regex)] = matches
+            postings = [self._rows[self._indptr[i]:self._indptr[i + 1]] for i in matches]
+            term_rows = np.unique(np.concatenate(postings)) if postings else np.array([], int)
+            rows = term_rows if rows is None else np.intersect1d(rows, term_rows, True)
+            if rows.size == 0:
+                break
+        return np.array([], dtype=int) if rows is None else rows
+
+    def save(self, filename, metadata=None):
+        """
+        Save the index as an uncompressed npz file.  The file is written atomically.
+
+        Parameters
+        ----------
+        filename : str, pathlib.Path
+            The npz file path.
+        metadata : dict
+            The tables' metadata, e.g. their 'date_created' fields.
+        """
+        filename = Path(filename)
+        tmp_file = filename.with_suffix('.npz.part')
+        with open(tmp_file, 'wb') as f:
+            np.savez(f, paths=self._paths, indptr=self._indptr, rows=self._rows,
+                     shape=self.shape, metadata=json.dumps(metadata or {}))
+        tmp_file.replace(filename)
+
+    @classmethod
+    def load(cls, filename, datasets, sessions, metadata=None):
+        """
+        Load a saved index, if it was built from the given tables.
+
+        The tables are identified by their metadata and their number of rows and unique paths,
+        rather than by their contents, so that loading the index doesn't require a pass over
+        the tables.
+
+        Parameters
+        ----------
+        filename : str, pathlib.Path
+            The npz file path.
+        datasets : pandas.DataFrame
+            A datasets cache table
+        sessions : pandas.DataFrame
+            A sessions cache table
+        metadata : dict
+            The tables' metadata, e.g. their 'date_created' fields.  If these differ from those
+            saved with the index, the index is not loaded.
+
+        Returns
+        -------
+        DatasetIndex, None
+            The index, or None if the file is missing or was saved for different tables.
+        """
+        try:
+            with np.load(filename) as data:
+                if json.loads(str(data['metadata'])) != (metadata or {}):
+                    return None
+                if tuple(data['shape']) != (len(datasets), len(sessions)):
+                    return None
+                rel_path = datasets['rel_path'] if len(datasets) else None
+                if (isinstance(getattr(rel_path, 'dtype', None), pd.CategoricalDtype)
+                        and len(rel_path.cat.categories) != len(data['paths'])):
+                    return None
+                index = cls(datasets, sessions,
+                            _postings=(data['paths'], data['indptr'], data['rows']))
+        except (OSError, ValueError, KeyError):
+            return None
+        return index
@@ -4,6 +4,9 @@ import tempfile
 from pathlib import Path
 import shutil
 import datetime
+import hashlib
+import os
+from unittest import mock
 
 import pandas as pd
 from pandas.testing import assert_frame_equal
@@ -137,9 +140,108 @@ class TestsONEParquet(unittest.TestCase):
         self.assertTrue(all(x in y for x in id_fields for y in (ses, dsets)))
         self.assertTrue(all(x in dsets for x in ('eid_0', 'eid_1')))
 
+    def test_compact_table(self):
+        (ses, _), (dsets, _) = map(parquet.load, apt.make_parquet_db(self.tmpdir, hash_ids=True))
+        # Check tables saved with compact dtypes
+        for table, name in ((ses, 'sessions'), (dsets, 'datasets')):
+            for column in apt.CATEGORICAL_COLUMNS[name]:
+                self.assertIsInstance(table[column].dtype, pd.CategoricalDtype)
+        self.assertEqual(ses['number'].dtype, 'int8')
+        self.assertEqual(dsets['id_0'].dtype, 'int64')
+        # Check string methods on categoricals
+        self.assertTrue(dsets['rel_path'].str.contains('spikes').any())
+        # Check memory usage report
+        report = apt.memory_usage(dsets)
+        self.assertCountEqual(['Index', *dsets.columns], report.index)
+        self.assertEqual(['dtype', 'bytes', 'uncompacted'], report.columns.tolist())
+        # Categoricals should reduce the memory footprint of larger tables
+        larger = pd.concat([dsets.astype({'session_path': object})] * 100, ignore_index=True)
+        larger = apt.memory_usage(apt.compact_table(larger, ['session_path']))
+        self.assertLess(larger.loc['session_path', 'bytes'],
+                        larger.loc['session_path', 'uncompacted'] / 10)
+        self.assertEqual(report.loc['id_0', 'bytes'], report.loc['id_0', 'uncompacted'])
+        loose = apt.memory_usage(dsets.astype({'session_path': object}))
+        self.assertEqual('object', loose.loc['session_path', 'dtype'])
+        self.assertEqual(loose.loc['session_path', 'bytes'],
+                         report.loc['session_path', 'uncompacted'])
+
+    def test_merge_cache_tables(self):
+        fn_ses, fn_dsets = apt.make_parquet_db(self.tmpdir, hash_ids=False)
+        (ses, _), (dsets, _) = map(parquet.load, (fn_ses, fn_dsets))
+        # A delta with one updated and one inserted dataset, and one deleted dataset
+        delta = dsets.iloc[:1].copy()
+        delta['file_size'] = 1024
+        delta = pd.concat([delta, delta.assign(id=delta['id'] + '.bak')], ignore_index=True)
+        metadata = {'date_created': '2021-10-18 10:00', 'deleted': [dsets['id'].iloc[1]]}
+        with tempfile.TemporaryDirectory() as tdir:
+            parquet.save(Path(tdir, 'datasets.pqt'), delta, metadata)
+            files = apt.merge_cache_tables(self.tmpdir, tdir, tables=('datasets',))
+            self.assertEqual([fn_dsets], files)
+            merged, merged_metadata = parquet.load(fn_dsets)
+            self.assertEqual(metadata['date_created'], merged_metadata['date_created'])
+            expected = pd.concat([delta, dsets.iloc[2:]]).sort_values('id', ignore_index=True)
+            assert_frame_equal(merged, expected, check_dtype=False)
+            # Sessions table should be unchanged
+            assert_frame_equal(parquet.load(fn_ses)[0], ses)
+            # Check raises when the delta doesn't match the table
+            parquet.save(Path(tdir, 'datasets.pqt'), delta.drop('hash', axis=1), metadata)
+            with self.assertRaises(ValueError):
+                apt.merge_cache_tables(self.tmpdir, tdir, tables=('datasets',))
+
     def tearDown(self) -> None:
         shutil.rmtree(self.tmpdir)
 
 
+class TestHashIndex(unittest.TestCase):
+    """Tests for the one.alf.cache.HashIndex class"""
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.root = Path(tmpdir.name)
+        self.hashes = apt.HashIndex(self.root / 'hashes.sqlite', root=self.root)
+        self.file = self.root.joinpath('subj', '2020-01-01', '001', 'alf', 'obj.attr.npy')
+        self.file.parent.mkdir(parents=True)
+        self.file.write_bytes(b'foo')
+
+    def test_get_put(self):
+        """Test for HashIndex.get and HashIndex.put methods"""
+        self.assertEqual(0, len(self.hashes))
+        self.assertIsNone(self.hashes.get(self.file))
+        self.hashes.put(self.file, 'a' * 32)
+        self.assertEqual(1, len(self.hashes))
+        self.assertEqual('a' * 32, self.hashes.get(self.file))
+        # Paths within the root directory should be stored relative to it
+        with self.hashes._connect() as conn:
+            path, = conn.execute('SELECT path FROM hashes').fetchone()
+        self.assertEqual('subj/2020-01-01/001/alf/obj.attr.npy', path)
+        # A modified file should not match the indexed hash
+        self.assertFalse(self.hashes.modified(self.file))
+        stat = self.file.stat()
+        os.utime(self.file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        self.assertIsNone(self.hashes.get(self.file))
+        self.assertTrue(self.hashes.modified(self.file))
+        self.file.write_bytes(b'foobar')
+        self.assertIsNone(self.hashes.get(self.file))
+        self.hashes.clear()
+        self.assertEqual(0, len(self.hashes))
+
+    def test_md5(self):
+        """Test for HashIndex.md5 method"""
+        with mock.patch('one.alf.cache.md5', wraps=apt.md5) as md5:
+            self.assertEqual(hashlib.md5(b'foo').hexdigest(), self.hashes.md5(self.file))
+            self.assertEqual(hashlib.md5(b'foo').hexdigest(), self.hashes.md5(self.file))
+            md5.assert_called_once()  # The second hash should be read from the index
+            # A modified file should be hashed again
+            self.file.write_bytes(b'foobar')
+            self.assertEqual(hashlib.md5(b'foobar').hexdigest(), self.hashes.md5(self.file))
+            self.assertEqual(2, md5.call_count)
+            # Recomputing should hash the file regardless of the index
+            self.hashes.md5(self.file, recompute=True)
+            self.assertEqual(3, md5.call_count)
+        # The index should be shared between instances
+        hashes = apt.HashIndex(self.hashes.filename, root=self.root)
+        self.assertEqual(hashlib.md5(b'foobar').hexdigest(), hashes.get(self.file))
+
+
 if __name__ == "__main__":
     unittest.main(exit=False)
@@ -0,0 +1,6 @@
+"""Benchmarks for ONE-api.
+
+These are not run by the test suite; run each module as a script, e.g.
+
+    python -m one.tests.benchmarks.search
+"""
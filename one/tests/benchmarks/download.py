@@ -0,0 +1,111 @@
+"""Benchmark concurrent file downloads from a local stand-in file server.
+
+Compares AlyxClient.download_file, which downloads through the client's pooled, keep-alive
+connections, with the previous implementation, which installed a new global urllib opener and
+opened a new connection for each file.  The server is local, so the saving excludes network round
+trips and TLS handshakes, which make up most of the connection overhead for a remote server.
+
+Also compares the throughput of downloading a large file as one stream and as several byte ranges
+concurrently, with the bandwidth of each server response limited to simulate a remote server.
+
+Examples
+--------
+>>> python -m one.tests.benchmarks.download --files 2000 --size 1024 --threads 4
+>>> python -m one.tests.benchmarks.download --files 0 --large 64 --bandwidth 10 --ranges 4
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from unittest import mock
+
+import one.webclient as wc
+from one.tests import util
+
+
+def legacy_download(url, cache_dir):
+    """Download a file through a new global urllib opener, as before"""
+    urllib.request.install_opener(urllib.request.build_opener())
+    u = urllib.request.urlopen(url)
+    md5 = hashlib.md5()
+    with open(Path(cache_dir, os.path.basename(url)), 'wb') as f:
+        while True:
+            buffer = u.read(8192 * 64 * 8)
+            if not buffer:
+                break
+            f.write(buffer)
+            md5.update(buffer)
+    return md5.hexdigest()
+
+
+def time_downloads(fcn, urls, n_threads):
+    """Return the total time in seconds taken to download all files, and their MD5 hashes"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            md5 = list(executor.map(partial(fcn, cache_dir=cache_dir), urls))
+        return time.perf_counter() - t0, md5
+
+
+def time_large_file(ac, url, file_size, n_ranges):
+    """Return the throughput in MB/s of downloading a large file in a number of byte ranges"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        t0 = time.perf_counter()
+        ac.download_file(url, cache_dir=cache_dir, file_size=file_size, n_ranges=n_ranges)
+        return file_size / (time.perf_counter() - t0) / 2 ** 20
+
+
+def main(n_files, size, n_threads, large=0, bandwidth=10, n_ranges=wc.N_DOWNLOAD_RANGES):
+    tempdir = util.set_up_env()
+    with tempdir, util.AlyxStandIn(tempdir.name) as alyx, \
+            mock.patch('one.params.iopar.getfile', new=partial(util.get_file, tempdir.name)):
+        alyx.setup_params(tempdir.name)
+        ac = wc.AlyxClient(base_url=alyx.url, username=alyx.user, cache_rest=None, silent=True)
+        alyx.files = {f'/lab/Subjects/subj/2020-01-01/001/alf/obj.attr_{i}.bin': os.urandom(size)
+                      for i in range(n_files)}
+        urls = [alyx.url + x for x in alyx.files]
+        expected = [hashlib.md5(x).hexdigest() for x in alyx.files.values()]
+
+        def download(url, cache_dir):
+            return ac.download_file(url, cache_dir=cache_dir, return_md5=True)[1]
+
+        if n_files:
+            pooled, md5 = time_downloads(download, urls, n_threads)
+            assert md5 == expected
+            connections, alyx.connections = alyx.connections, 0
+            legacy, md5 = time_downloads(legacy_download, urls, n_threads)
+            assert md5 == expected
+            print(f'{n_files:,} files of {size:,} bytes, {n_threads} thread(s):')
+            print(f'    pooled session: {pooled:.2f} s, {n_files / pooled:.0f} files/s '
+                  f'({connections} connection(s) opened)')
+            print(f'    previous implementation: {legacy:.2f} s, {n_files / legacy:.0f} files/s '
+                  f'({alyx.connections} connection(s) opened)')
+        if large:
+            path = '/lab/Subjects/subj/2020-01-01/001/raw_ephys_data/_spikeglx_ephysData.ap.cbin'
+            alyx.files[path] = os.urandom(large * 2 ** 20)
+            alyx.bandwidth = bandwidth * 2 ** 20
+            ac.parallel_download_size = 0
+            print(f'{large} MB file, {bandwidth} MB/s per response:')
+            for n in sorted({1, n_ranges}):
+                speed = time_large_file(ac, alyx.url + path, large * 2 ** 20, n)
+                print(f'    {n} range(s): {speed:.1f} MB/s')
+        ac.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--files', type=int, default=2000, help='number of files')
+    parser.add_argument('--size', type=int, default=1024, help='file size in bytes')
+    parser.add_argument('--threads', type=int, default=4, help='number of concurrent threads')
+    parser.add_argument('--large', type=int, default=64, help='large file size in MB')
+    parser.add_argument('--bandwidth', type=float, default=10,
+                        help='bandwidth in MB/s of each response for the large file')
+    parser.add_argument('--ranges', type=int, default=wc.N_DOWNLOAD_RANGES,
+                        help='number of byte ranges of the large file to download concurrently')
+    args = parser.parse_args()
+    main(args.files, args.size, args.threads, args.large, args.bandwidth, args.ranges)
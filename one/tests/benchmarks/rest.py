@@ -0,0 +1,87 @@
+"""Benchmark AlyxClient REST request latency against a local stand-in Alyx server.
+
+Compares requests made through the client's pooled HTTP session, which keeps connections alive,
+with the previous implementation, which opened a new connection for each request.  The server
+is local, so the saving excludes network round trips and TLS handshakes, which make up most of
+the connection overhead for a remote database.
+
+Also compares iterating over a paginated response with and without concurrent page prefetching,
+with a simulated server latency per request.
+
+Examples
+--------
+>>> python -m one.tests.benchmarks.rest --requests 1000 --threads 4 --latency 50
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from unittest import mock
+
+import requests
+
+import one.webclient as wc
+from one.tests import util
+
+
+def legacy_get(ac, rest_query):
+    """Make a GET request through a new connection, as before"""
+    rep = requests.get(ac.base_url + rest_query, stream=True, headers=ac._headers)
+    rep.raise_for_status()
+    return rep.json()
+
+
+def time_requests(fcn, n_requests, n_threads=1):
+    """Return the mean time per request in milliseconds"""
+    t0 = time.perf_counter()
+    if n_threads == 1:
+        for _ in range(n_requests):
+            fcn()
+    else:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(lambda _: fcn(), range(n_requests)))
+    return (time.perf_counter() - t0) / n_requests * 1e3
+
+
+def time_pages(ac, prefetch, page_size=2):
+    """Return the time in seconds taken to iterate over all pages of the sessions list"""
+    ac.prefetch_pages = prefetch
+    t0 = time.perf_counter()
+    rep = ac.get(f'/sessions?limit={page_size}')
+    list(rep)
+    return time.perf_counter() - t0, rep.n_pages
+
+
+def main(n_requests, n_threads, latency):
+    tempdir = util.set_up_env()
+    with tempdir, util.AlyxStandIn(tempdir.name) as alyx, \
+            mock.patch('one.params.iopar.getfile', new=partial(util.get_file, tempdir.name)):
+        alyx.setup_params(tempdir.name)
+        ac = wc.AlyxClient(base_url=alyx.url, username=alyx.user, cache_rest=None, silent=True)
+        for threads in sorted({1, n_threads}):
+            pooled = time_requests(partial(ac.get, '/cache/info'), n_requests, threads)
+            connections = alyx.connections
+            legacy = time_requests(partial(legacy_get, ac, '/cache/info'), n_requests, threads)
+            print(f'{n_requests:,} requests, {threads} thread(s):')
+            print(f'    pooled session: {pooled:.2f} ms/request '
+                  f'({connections} connection(s) opened)')
+            print(f'    previous implementation: {legacy:.2f} ms/request '
+                  f'({alyx.connections - connections} connection(s) opened), '
+                  f'{legacy - pooled:.2f} ms/request saved')
+            alyx.connections = 0
+        alyx.delay = latency / 1e3
+        serial, n_pages = time_pages(ac, prefetch=0)
+        prefetched, _ = time_pages(ac, prefetch=wc.PREFETCH_PAGES)
+        print(f'{n_pages} pages, {latency} ms latency:')
+        print(f'    serial: {serial:.2f} s')
+        print(f'    {wc.PREFETCH_PAGES} pages prefetched: {prefetched:.2f} s')
+        ac.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=1000, help='number of requests')
+    parser.add_argument('--threads', type=int, default=4, help='number of concurrent threads')
+    parser.add_argument('--latency', type=float, default=50, help='server latency in ms')
+    args = parser.parse_args()
+    main(args.requests, args.threads, args.latency)
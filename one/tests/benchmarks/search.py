@@ -0,0 +1,120 @@
+"""Benchmark One.search dataset queries on a large synthetic cache.
+
+Compares the vectorized dataset filter with the previous implementation, which called
+`str.contains` for each session and query.
+
+Examples
+--------
+>>> python -m one.tests.benchmarks.search --sessions 100000 --datasets 5000000
+"""
+import argparse
+import tempfile
+import time
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from one.api import One
+
+COLLECTIONS = ('alf', 'alf/probe00', 'alf/probe01', 'raw_behavior_data', 'raw_ephys_data')
+OBJECTS = ('spikes', 'clusters', 'channels', 'trials', 'wheel', 'camera', 'probes', 'licks')
+ATTRIBUTES = ('times', 'intervals', 'amps', 'depths', 'position', 'clusters', 'metrics')
+
+
+def synthetic_cache(n_sessions=100_000, n_datasets=5_000_000, seed=0):
+    """
+    Generate synthetic sessions and datasets cache tables with int IDs.
+
+    Parameters
+    ----------
+    n_sessions : int
+        The number of sessions.
+    n_datasets : int
+        The number of datasets, randomly assigned to sessions.
+    seed : int
+        The random number generator seed.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The sessions table.
+    pandas.DataFrame
+        The datasets table.
+    """
+    rng = np.random.default_rng(seed)
+    int64 = np.iinfo(np.int64)
+    eids = rng.integers(int64.min, int64.max, size=(n_sessions, 2), dtype=np.int64)
+    subjects = [f'subject_{i:04}' for i in range(n_sessions // 100 + 1)]
+    dates = pd.date_range('2018-01-01', periods=1000).date
+    sessions = pd.DataFrame({
+        'lab': pd.Categorical.from_codes(rng.integers(10, size=n_sessions),
+                                         [f'lab_{i}' for i in range(10)]),
+        'subject': pd.Categorical.from_codes(np.arange(n_sessions) // 100, subjects),
+        'date': dates[rng.integers(len(dates), size=n_sessions)],
+        'number': rng.integers(1, 4, size=n_sessions, dtype=np.int8),
+        'task_protocol': '',
+        'project': '',
+    }, index=pd.MultiIndex.from_arrays(eids.T, names=['id_0', 'id_1']))
+
+    rel_paths = [f'{c}/{o}.{a}.npy' for c, o, a in product(COLLECTIONS, OBJECTS, ATTRIBUTES)]
+    session = np.sort(rng.integers(n_sessions, size=n_datasets))
+    ids = rng.integers(int64.min, int64.max, size=(n_datasets, 2), dtype=np.int64)
+    datasets = pd.DataFrame({
+        'file_size': rng.integers(1, 2 ** 30, size=n_datasets).astype(float),
+        'hash': None,
+        'rel_path': pd.Categorical.from_codes(
+            rng.integers(len(rel_paths), size=n_datasets), rel_paths),
+        'session_path': pd.Categorical.from_codes(
+            session, [f'lab/Subjects/subject/2020-01-01/{i:03}' for i in range(n_sessions)]),
+        'exists': rng.random(n_datasets) > .05,
+        'eid_0': eids[session, 0],
+        'eid_1': eids[session, 1],
+    }, index=pd.MultiIndex.from_arrays(ids.T, names=['id_0', 'id_1'])).sort_index()
+    return sessions, datasets
+
+
+def legacy_search(one, query):
+    """The previous One.search dataset filter, applied to all sessions"""
+    def all_present(x, dsets, exists=True):
+        """Returns true if all datasets present in Series"""
+        return all(any(x.str.contains(y, regex=one.wildcards) & exists) for y in dsets)
+
+    datasets = one._cache['datasets']
+    mask = (datasets
+            .groupby(['eid_0', 'eid_1'], sort=False)
+            .apply(lambda x: all_present(x['rel_path'], query, x['exists'])))
+    return mask[mask].index
+
+
+def main(n_sessions, n_datasets, queries, legacy=True):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        one = One(mode='local', cache_dir=cache_dir)
+        t0 = time.perf_counter()
+        one._cache['sessions'], one._cache['datasets'] = synthetic_cache(n_sessions, n_datasets)
+        print(f'Generated {n_sessions:,} sessions and {n_datasets:,} datasets '
+              f'in {time.perf_counter() - t0:.1f}s')
+        for query in queries:
+            t0 = time.perf_counter()
+            eids = one.search(dataset=query)
+            elapsed = time.perf_counter() - t0
+            print(f'dataset={query}: {len(eids):,} sessions in {elapsed:.2f}s')
+            if legacy:
+                t0 = time.perf_counter()
+                expected = legacy_search(one, query)
+                legacy_elapsed = time.perf_counter() - t0
+                assert len(expected) == len(eids)
+                print(f'    previous implementation: {legacy_elapsed:.2f}s '
+                      f'({legacy_elapsed / elapsed:.0f}x slower)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sessions', type=int, default=100_000, help='number of sessions')
+    parser.add_argument('--datasets', type=int, default=5_000_000, help='number of datasets')
+    parser.add_argument('--skip-legacy', action='store_true',
+                        help='do not time the previous implementation')
+    args = parser.parse_args()
+    main(args.sessions, args.datasets,
+         queries=(['spikes.times'], ['spikes.times', 'trials.intervals', 'wheel.position']),
+         legacy=not args.skip_legacy)
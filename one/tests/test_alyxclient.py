@@ -256,14 +256,11 @@ class TestRestCache(unittest.TestCase):
         res = wrapped(ac, requests.get, '/endpoint?id=5')
         self.assertTrue(res == 'called')
 
-        # Check cache file created
-        filename = '64b5b3476c015e04ee7c4753606b5e967325d34a'
-        cache_file = self.cache_dir / filename
-        self.assertTrue(cache_file.exists())
-        with open(cache_file, 'r') as f:
-            q, when = json.load(f)
+        # Check response cached
+        self.assertTrue((self.cache_dir / wc.REST_CACHE_FILE).exists())
+        q, when, _ = ac.rest_cache.get('/endpoint?id=5')
         self.assertEqual('called', q)
-        self.assertEqual(when, '2021-05-13T00:01:00')
+        self.assertEqual(when, datetime(2021, 5, 13, 0, 1))
 
     def test_cache_mode(self):
         """Test for AlyxClient.cache_mode property"""
@@ -306,8 +303,12 @@ class TestRestCache(unittest.TestCase):
     def test_clear_cache(self):
         """Test for AlyxClient.clear_rest_cache"""
         assert any(self.cache_dir.glob('*'))
+        ac.rest_cache.get(self.query)  # Imports legacy cache file into database
+        self.assertEqual(1, len(ac.rest_cache))
         ac.clear_rest_cache()
-        self.assertFalse(any(self.cache_dir.glob('*')))
+        self.assertEqual(0, len(ac.rest_cache))
+        files = self.cache_dir.glob('*')
+        self.assertFalse(any(x for x in files if not x.name.startswith(wc.REST_CACHE_FILE)))
 
     def tearDown(self) -> None:
         ac.cache_mode = self.cache_mode
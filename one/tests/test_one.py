@@ -28,28 +28,38 @@ Note ONE and AlyxClient use caching:
 """
 import datetime
 import logging
+import os
+import hashlib
+import threading
+import urllib.parse
 from pathlib import Path
 from itertools import permutations, combinations_with_replacement
 from functools import partial
 import unittest
 from unittest import mock
 import tempfile
-from uuid import UUID
+from uuid import UUID, uuid4
 import json
 import io
 
 import numpy as np
 import pandas as pd
 from requests.exceptions import HTTPError
-from iblutil.io import parquet
+from iblutil.io import parquet, hashfile
 from iblutil.util import Bunch
 
 from one.api import ONE, One, OneAlyx
 from one.util import (
     ses2records, validate_date_range, index_last_before, filter_datasets, _collection_spec,
-    filter_revision_last_before, parse_id, autocomplete, LazyId, datasets2records
+    filter_revision_last_before, parse_id, autocomplete, LazyId, datasets2records, dataset_parts,
+    ALF_PARTS
 )
+from one.index import SessionIndex, DatasetIndex, DateIndex, TableStats
+from one.caching import BackgroundQueue
+from one.alf.files import rel_path_parts
+from one.alf.cache import compact_table, CATEGORICAL_COLUMNS
 import one.params
+import one.alf.cache as one_cache
 import one.alf.exceptions as alferr
 from . import util
 from . import OFFLINE_ONLY, TEST_DB_1, TEST_DB_2
@@ -70,7 +80,10 @@ class TestONECache(unittest.TestCase):
         util.create_file_tree(cls.one)
 
     def tearDown(self) -> None:
-        # Reload cache table after each test
+        # Discard any logged changes and reload cache table after each test
+        log_file = Path(self.one.cache_dir, 'datasets.log')
+        if log_file.exists():
+            log_file.unlink()
         self.one.refresh_cache('refresh')
 
     @classmethod
@@ -138,7 +151,7 @@ class TestONECache(unittest.TestCase):
         # Set exist for one of the eids to false
         mask = (one._cache['datasets']['rel_path'].str.contains(query))
         i = one._cache['datasets'][mask].index[0]
-        one._cache['datasets'].loc[i, 'exists'] = False
+        one._update_datasets(i, exists=False)  # Clears the memoized results
 
         self.assertTrue(len(eids) == len(one.search(data=query)) + 1)
 
@@ -304,6 +317,256 @@ class TestONECache(unittest.TestCase):
                                      wildcards=True)
         self.assertEqual(2, len(verifiable))
 
+    def test_filter_parts(self):
+        """Test one.util.filter_datasets matches ALF parts of literal filenames"""
+        datasets = self.one._cache.datasets
+        self.assertIsInstance(datasets['rel_path'].dtype, pd.CategoricalDtype)
+        verifiable = filter_datasets(datasets, '_ibl_trials.intervals_bpod.npy', None, None,
+                                     assert_unique=False, revision_last_before=False)
+        self.assertTrue(len(verifiable) > 0)
+        self.assertTrue((verifiable['rel_path'] == 'alf/_ibl_trials.intervals_bpod.npy').all())
+        # Absent parts should only match absent
+        verifiable = filter_datasets(datasets, 'trials.intervals.npy', None, None,
+                                     assert_unique=False, revision_last_before=False)
+        self.assertEqual(0, len(verifiable))
+        # Paths that aren't valid ALF should still match the regular expression
+        paths = pd.Series(['foo/bar.npy', 'alf/spikes.times.npy'], dtype='category')
+        datasets = datasets.iloc[:2].assign(rel_path=paths.values)
+        verifiable = filter_datasets(datasets, 'bar.npy', 'foo', None,
+                                     assert_unique=False, revision_last_before=False)
+        self.assertEqual(['foo/bar.npy'], verifiable['rel_path'].tolist())
+        verifiable = filter_datasets(datasets, 'spikes.times.npy', 'alf', None,
+                                     assert_unique=False, revision_last_before=False)
+        self.assertEqual(['alf/spikes.times.npy'], verifiable['rel_path'].tolist())
+
+    def test_dataset_parts(self):
+        """Test one.util.dataset_parts"""
+        rel_paths = ['alf/probe00/#2020-01-01#/_ibl_spikes.times_ephysClock.extra.npy',
+                     'spikes.amps.npy', 'foo/bar.npy']
+        expected = [
+            ['alf/probe00', '2020-01-01', 'ibl', 'spikes', 'times', 'ephysClock', 'extra', 'npy'],
+            ['', '', '', 'spikes', 'amps', '', '', 'npy'],
+            [np.nan] * 8
+        ]
+        for dtype in (object, 'category'):
+            with self.subTest(dtype=dtype):
+                parts = dataset_parts(pd.Series(rel_paths, index=[3, 4, 5], dtype=dtype))
+                self.assertEqual(list(ALF_PARTS), parts.columns.tolist())
+                self.assertEqual([3, 4, 5], parts.index.tolist())
+                self.assertTrue(all(isinstance(x, pd.CategoricalDtype) for x in parts.dtypes))
+                pd.testing.assert_frame_equal(
+                    parts.astype(object), pd.DataFrame(expected, [3, 4, 5], parts.columns))
+        # Slices of a categorical table should be parsed consistently with the full table
+        datasets = self.one._cache.datasets
+        parts = dataset_parts(datasets.iloc[10:20])
+        expected = [rel_path_parts(x)[0] or '' for x in datasets['rel_path'].iloc[10:20]]
+        self.assertEqual(expected, parts['collection'].tolist())
+
+    def test_session_index(self):
+        """Test one.index.SessionIndex and One._session_datasets"""
+        datasets = self.one._cache['datasets']
+        index = SessionIndex(datasets)
+        self.assertTrue(index.is_current(datasets))
+        eids = parquet.np2str(datasets[['eid_0', 'eid_1']].drop_duplicates().values)
+        self.assertEqual(len(eids), len(index))
+        for eid in eids[:3]:
+            isin = datasets['eid_0'] == parquet.str2np(eid)[0, 0]
+            np.testing.assert_array_equal(np.flatnonzero(isin), index.rows(eid))
+        # Multiple sessions should be returned in table order without duplicates
+        rows = index.rows([eids[1], eids[0], eids[1]])
+        self.assertTrue(np.all(np.diff(rows) > 0))
+        self.assertEqual(len(index.rows(eids[:2])), len(rows))
+        self.assertEqual(0, len(index.rows(str(UUID(int=0)))))
+        # The index should be rebuilt when the table is modified
+        self.one._cache['datasets'] = datasets.iloc[:-1]
+        self.assertFalse(index.is_current(self.one._cache['datasets']))
+        eid = parquet.np2str(datasets[['eid_0', 'eid_1']].values[-1])
+        self.assertEqual(len(self.one._session_datasets(eid)), len(index.rows(eid)) - 1)
+        # Check str IDs
+        util.caches_int2str(self.one._cache)
+        datasets = self.one._session_datasets(eids[0])
+        self.assertTrue(len(datasets) > 0)
+        self.assertTrue((datasets['eid'] == eids[0]).all())
+
+    def test_dataset_index(self):
+        """Test one.index.DatasetIndex and One._get_dataset_index"""
+        datasets, sessions = self.one._cache['datasets'], self.one._cache['sessions']
+        index = DatasetIndex(datasets, sessions)
+        self.assertTrue(index.is_current(datasets, sessions))
+
+        def expected(*queries):
+            """The sessions with datasets containing all queries"""
+            eids = [datasets.loc[datasets['rel_path'].str.contains(x), ['eid_0', 'eid_1']]
+                    for x in queries]
+            eids = set.intersection(*(set(map(tuple, x.values.tolist())) for x in eids))
+            return np.flatnonzero(sessions.index.isin(eids))
+
+        for query in (['spikes.times'], ['spikes.times', 'trials.intervals'], ['gnagna']):
+            with self.subTest(query=query):
+                np.testing.assert_array_equal(expected(*query), index.sessions(query))
+        np.testing.assert_array_equal(
+            expected('spikes.times|wheel'), index.sessions('spikes.times|wheel', regex=True))
+        self.assertEqual(0, len(index.sessions('spikes.times|wheel', regex=False)))
+        # The paths matching a term should be kept
+        with mock.patch('pandas.Series.str') as str_accessor:
+            np.testing.assert_array_equal(expected('spikes.times'), index.sessions('spikes.times'))
+            str_accessor.contains.assert_not_called()
+
+        # Check saving and loading
+        filename = Path(self.tempdir.name, 'index.npz')
+        metadata = {'datasets': '2021-05-13 20:38'}
+        index.save(filename, metadata)
+        loaded = DatasetIndex.load(filename, datasets, sessions, metadata)
+        self.assertIsNotNone(loaded)
+        self.assertTrue(loaded.is_current(datasets, sessions))
+        np.testing.assert_array_equal(index.sessions('spikes'), loaded.sessions('spikes'))
+        self.assertIsNone(DatasetIndex.load(filename, datasets, sessions, {'datasets': 'foo'}))
+        self.assertIsNone(DatasetIndex.load(filename, datasets.iloc[1:], sessions, metadata))
+        self.assertIsNone(DatasetIndex.load(filename.with_name('foo.npz'), datasets, sessions))
+
+        # Check One._get_dataset_index saves the index, and rebuilds it when tables change
+        filename.unlink()
+        index = self.one._get_dataset_index()
+        self.assertIs(index, self.one._get_dataset_index())
+        self.assertTrue(Path(self.tempdir.name, 'datasets_index.npz').exists())
+        self.one._cache['datasets'] = datasets.iloc[:-1]
+        self.assertIsNot(index, self.one._get_dataset_index())
+        self.one.refresh_cache('refresh')
+        self.one._get_dataset_index()  # Saved again for the full tables
+        # Once saved for the loaded tables, the index should be loaded instead of rebuilt
+        self.one.refresh_cache('refresh')
+        with mock.patch('one.index.DatasetIndex.save') as save:
+            loaded = self.one._get_dataset_index()
+            save.assert_not_called()
+        self.assertEqual(index.shape, loaded.shape)
+        np.testing.assert_array_equal(index.sessions('spikes'), loaded.sessions('spikes'))
+
+    def test_date_index(self):
+        """Test one.index.DateIndex and its use in One.search"""
+        sessions = self.one._cache['sessions']
+        self.assertEqual(DateIndex(sessions).dates.size, len(sessions))
+        index = self.one._get_date_index()
+        self.assertTrue(index.is_current(sessions))
+        self.assertIs(index, self.one._get_date_index())
+        date_range = ['2019-04-01', '2019-07-31']
+        start, end = validate_date_range(date_range)
+        session_date = pd.to_datetime(sessions['date'])
+        expected = sessions.index[(session_date >= start) & (session_date <= end)]
+        self.assertTrue(len(expected) > 0)
+        self.assertCountEqual(expected, sessions.index[index.rows(start, end)])
+        np.testing.assert_array_equal(index.mask(start, end), sessions.index.isin(expected))
+        eids = self.one.search(date_range=date_range, query_type='local')
+        self.assertCountEqual(parquet.np2str(np.array(expected.tolist())), eids)
+        # Check combined with a previous filter
+        subject = sessions.loc[expected[0], 'subject']
+        eids = self.one.search(subject=subject, date_range=date_range)
+        expected = expected[sessions.loc[expected, 'subject'] == subject]
+        self.assertCountEqual(parquet.np2str(np.array(expected.tolist())), eids)
+        # Out of range
+        start, end = validate_date_range(['2000-01-01', '2000-01-02'])
+        self.assertEqual(0, len(index.rows(start, end)))
+        # Replacing the table should rebuild the index
+        self.one._cache['sessions'] = sessions.iloc[:-1]
+        self.assertFalse(index.is_current(self.one._cache['sessions']))
+        self.assertIsNot(index, self.one._get_date_index())
+
+    def test_search_plan(self):
+        """Test One._plan_search, one.index.TableStats and the search explain option"""
+        sessions = self.one._cache['sessions']
+        stats = TableStats(sessions)
+        self.assertTrue(stats.is_current(sessions))
+        self.assertEqual(sessions['subject'].nunique(), stats.n_distinct('subject'))
+        expected = (sessions['subject'] == 'KS005').mean()
+        self.assertAlmostEqual(expected, stats.selectivity('subject', values=['KS005']))
+        self.assertAlmostEqual(expected, stats.selectivity('subject', pattern='KS00[5]'))
+        self.assertEqual(0, stats.selectivity('number', values=[100]))
+
+        # The costly dataset filter should be applied last
+        query = {'dataset': 'spikes', 'subject': 'KS005', 'number': 1}
+        hits = self.one.memo.hits
+        eids, plan = self.one.search(explain=True, **query)
+        self.assertEqual(eids, self.one.search(**query))
+        self.assertEqual(hits, self.one.memo.hits, 'explained searches should not be memoized')
+        self.assertIsInstance(plan, pd.DataFrame)
+        expected = ['predicate', 'value', 'selectivity', 'cost', 'rows', 'time']
+        self.assertEqual(expected, plan.columns.tolist())
+        self.assertCountEqual(query.keys(), plan['predicate'])
+        self.assertEqual('dataset', plan['predicate'].iloc[-1])
+        self.assertTrue(plan['selectivity'].between(0, 1).all())
+        self.assertTrue((plan['time'] >= 0).all())
+        self.assertTrue(plan['rows'].is_monotonic_decreasing)
+        self.assertEqual(len(eids), plan['rows'].iloc[-1])
+
+        # With details
+        eids, details, plan = self.one.search(subject='KS005', details=True, explain=True)
+        self.assertEqual(len(eids), len(details))
+        self.assertEqual(1, len(plan))
+
+        # Check short circuit on no matches
+        eids, plan = self.one.search(subject='foobar', dataset='spikes', explain=True)
+        self.assertEqual([], eids)
+        self.assertEqual(0, plan['rows'].iloc[0])
+        self.assertTrue(np.isnan(plan['rows'].iloc[-1]))
+
+    def test_memoize(self):
+        """Test one.util.memoize and one.caching.LRUMemo"""
+        memo = self.one.memo
+        memo.clear()
+
+        def is_memoized(method, *args, **kwargs):
+            """Call method and return True if the result was memoized"""
+            hits = memo.hits
+            method(*args, **kwargs)
+            return memo.hits > hits
+
+        self.assertFalse(is_memoized(self.one.search, subject='ZFM-01935', dataset='spikes'))
+        eids = self.one.search(dataset='spikes', subject='ZFM-01935')
+        self.assertEqual(1, len(memo))
+        self.assertTrue(memo.nbytes > 0)
+        eids.append('foo')  # Results should be safe from modification
+        self.assertNotIn('foo', self.one.search(dataset='spikes', subject='ZFM-01935'))
+        dsets = self.one.list_datasets(eids[0], details=True)
+        dsets['exists'] = False
+        self.assertTrue(self.one.list_datasets(eids[0], details=True)['exists'].all())
+        # Changing the wildcards flag or the arguments should change the key
+        self.one.wildcards = False
+        try:
+            self.assertFalse(is_memoized(self.one.list_datasets, eids[0], details=True))
+        finally:
+            self.one.wildcards = True
+        self.assertFalse(is_memoized(self.one.list_datasets, eids[0], collection='alf'))
+        self.assertTrue(is_memoized(self.one.list_datasets, eids[0], collection='alf'))
+        # Replacing a table, modifying the cache or reloading should invalidate the results
+        self.one._cache['datasets'] = self.one._cache['datasets'].iloc[:-1]
+        self.assertFalse(is_memoized(self.one.list_datasets, eids[0], collection='alf'))
+        self.assertTrue(is_memoized(self.one.list_datasets, eids[0], collection='alf'))
+        generation = memo.generation
+        self.one._update_datasets(self.one._cache['datasets'].index[0], exists=False)
+        self.assertEqual(0, len(memo))
+        self.assertEqual(generation + 1, memo.generation)
+        # Results computed before the memo was cleared should not be stored
+        memo.put(('foo',), [1], (None, None), generation)
+        self.assertEqual(0, len(memo))
+        self.assertFalse(is_memoized(self.one.list_datasets, eids[0], collection='alf'))
+        self.one.refresh_cache('refresh')
+        self.assertEqual(0, len(memo))
+        # Unhashable arguments should not be memoized
+        misses = memo.misses
+        self.one.list_datasets(np.array([eids[0]]))
+        self.assertEqual(misses, memo.misses)
+        # Check the size limit
+        self.one.list_revisions(eids[0])
+        memo.max_bytes = memo.nbytes + 1
+        self.one.list_collections(eids[0])
+        self.assertTrue(memo.nbytes <= memo.max_bytes)
+        self.assertTrue(is_memoized(self.one.list_collections, eids[0]))
+        self.assertFalse(is_memoized(self.one.list_revisions, eids[0]))  # Evicted
+        memo.max_bytes = 0
+        self.one.list_revisions(eids[0])
+        self.assertFalse(is_memoized(self.one.list_revisions, eids[0]))
+        memo.max_bytes = one.api.MEMO_MAX_BYTES
+        self.assertIn('hits', repr(memo))
+
     def test_list_datasets(self):
         """Test One.list_datasets"""
         # test filename
@@ -533,6 +796,71 @@ class TestONECache(unittest.TestCase):
         files, meta = self.one.load_datasets(eid, dsets, download_only=True)
         self.assertTrue(all(isinstance(x, Path) for x in files))
 
+    def test_load_datasets_batch(self):
+        """Test One.load_datasets_batch"""
+        dsets = ['_ibl_wheel.position.npy', '_ibl_wheel.timestamps.npy']
+        eids = self.one.search(dataset=dsets)[:4]
+        self.assertTrue(len(eids) > 1)
+        refs = [self.one.eid2ref(eids[0], as_dict=False), *eids[1:]]  # Any experiment ID
+        # Check download only, comparing with load_datasets
+        with mock.patch.object(self.one, '_check_filesystem',
+                               wraps=self.one._check_filesystem) as check:
+            table = self.one.load_datasets_batch(refs, dsets, download_only=True)
+            check.assert_called_once()  # All files checked in one batch
+        # Sessions with a single matching dataset should not be filtered again
+        eids = self.one.search(dataset=dsets)
+        with mock.patch('one.util.filter_datasets', wraps=filter_datasets) as filter_fcn:
+            self.assertEqual(len(eids) * len(dsets),
+                             len(self.one.load_datasets_batch(eids, dsets, download_only=True)))
+        self.assertEqual(len(dsets), filter_fcn.call_count)
+        eids = eids[:4]
+        self.assertIsInstance(table, pd.DataFrame)
+        self.assertEqual(['eid', 'dataset'], table.index.names)
+        # The rows should be in the order of the input sessions
+        self.assertEqual(self.one.to_eid(refs), table.index.unique('eid').tolist())
+        table_reversed = self.one.load_datasets_batch(refs[::-1], dsets[::-1], download_only=True)
+        self.assertEqual(self.one.to_eid(refs[::-1]), table_reversed.index.unique('eid').tolist())
+        self.assertCountEqual(self.one.to_eid(refs), table.index.unique('eid'))
+        self.assertEqual(len(eids) * len(dsets), len(table))
+        self.assertNotIn('data', table.columns)
+        for eid in table.index.unique('eid'):
+            files, _ = self.one.load_datasets(eid, dsets, download_only=True)
+            self.assertEqual(files, table.loc[eid, 'file'].tolist())
+
+        # Check loading data and missing dataset
+        np.save(str(table['file'].iloc[0]), np.arange(3))  # Make sure we have something to load
+        eid = table.index[0][0]
+        dsets = ['_ibl_wheel.position.npy', '_ibl_wheel.timestamps_bpod.npy']
+        with self.assertLogs(logging.getLogger('one.api'), 'WARNING'):
+            table = self.one.load_datasets_batch(eids, dsets, assert_present=False)
+        self.assertEqual(len(eids), len(table))
+        self.assertTrue(np.all(table.loc[(eid, 0), 'data'] == np.arange(3)))
+        with self.assertRaises(alferr.ALFObjectNotFound):
+            self.one.load_datasets_batch(eids, dsets)
+
+        # Check collection and revision filters
+        dsets = ['_ibl_wheel.position', '_ibl_wheel.timestamps']
+        table = self.one.load_datasets_batch(eids, dsets, collections=['alf', ''],
+                                             download_only=True, assert_present=False)
+        for eid in eids:
+            files, _ = self.one.load_datasets(eid, dsets, collections=['alf', ''],
+                                              download_only=True, assert_present=False)
+            expected = table['file'].reindex([(eid, 0), (eid, 1)]).replace({np.nan: None})
+            self.assertEqual(files, expected.tolist())
+        table = self.one.load_datasets_batch(eids, dsets, revisions='2050-01-01',
+                                             download_only=True)
+        self.assertEqual(len(eids) * len(dsets), len(table))
+
+        # Check validations
+        with self.assertRaises(ValueError):
+            self.one.load_datasets_batch(eids, dsets, collections=['alf', '', 'foo'])
+        with self.assertRaises(TypeError):
+            self.one.load_datasets_batch(eids, 'spikes.times')
+        with self.assertRaises(alferr.ALFObjectNotFound):
+            self.one.load_datasets_batch(['ZM_1085/2019-01-01/001'], dsets)
+        table = self.one.load_datasets_batch([], dsets, assert_present=False)
+        self.assertEqual(0, len(table))
+
     def test_load_dataset_from_id(self):
         """Test One.load_dataset_from_id"""
         id = np.array([[-9204203870374650458, -6411285612086772563]])
@@ -669,8 +997,188 @@ class TestONECache(unittest.TestCase):
             # Save table with missing id columns
             df.drop(['id_0', 'id_1'], axis=1, inplace=True)
             parquet.save(Path(tdir) / 'datasets.pqt', df, info)
+            self.one._load_cache(tdir)
             with self.assertRaises(KeyError):
-                self.one._load_cache(tdir)
+                self.one._cache['datasets']  # The table is loaded upon first access
+
+    def test_lazy_datasets(self):
+        """Test the datasets table is only loaded upon first access"""
+        one = One(mode='local', cache_dir=self.tempdir.name)
+        self.assertEqual(('datasets',), one._cache.deferred)
+        self.assertIn('datasets', one._cache)
+        self.assertIsNotNone(one._cache['_meta']['created_time'])
+        self.assertIn('date_created', one._cache['_meta']['raw']['datasets'])
+        # Session queries should not load the table
+        eids = one.search(subject='ZFM-01935')
+        self.assertTrue(len(eids))
+        self.assertIsInstance(one.eid2path(eids[0]), Path)
+        one.list_subjects()
+        self.assertEqual(('datasets',), one._cache.deferred)
+        # Dataset queries should
+        self.assertTrue(len(one.list_datasets(eids[0])))
+        self.assertFalse(one._cache.deferred)
+        pd.testing.assert_frame_equal(self.one._cache.datasets, one._cache.datasets)
+        # Setting a table should cancel loading
+        one.refresh_cache('refresh')
+        one._cache.datasets = one._cache.datasets.iloc[:0]
+        self.assertFalse(one._cache.deferred)
+        self.assertTrue(one._cache.datasets.empty)
+
+    def test_save_arrow_tables(self):
+        """Test One.save_arrow_tables and loading of Arrow tables"""
+        tables = {k: self.one._cache[k] for k in ('sessions', 'datasets')}
+        try:
+            files = self.one.save_arrow_tables()
+            self.assertEqual(['datasets.arrow', 'sessions.arrow'], [x.name for x in files])
+            # The tables are loaded as saved: not re-sorted, compacted or parsed
+            with mock.patch('one.api.parquet.load') as parquet_load, \
+                    mock.patch('one.api.compact_table') as compact, \
+                    mock.patch('one.util._parse_rel_paths') as parse:
+                self.one._load_cache()
+                parquet_load.assert_not_called()
+                compact.assert_not_called()
+                parts = dataset_parts(self.one._cache.datasets)
+                parse.assert_not_called()
+            pd.testing.assert_frame_equal(parts, dataset_parts(tables['datasets']))
+            # String columns are Arrow-backed, categoricals are kept
+            datasets = self.one._cache.datasets
+            self.assertEqual('string[pyarrow]', datasets['hash'].dtype)
+            self.assertIsInstance(datasets['rel_path'].dtype, pd.CategoricalDtype)
+            for name, table in tables.items():
+                pd.testing.assert_frame_equal(
+                    table, self.one._cache[name].astype(table.dtypes.to_dict()))
+            self.assertEqual(tables['datasets'].index.names, datasets.index.names)
+            # Check modifiable
+            self.one._cache.datasets.iloc[0, [0, 4]] = [1024., False]
+            self.one._update_datasets(datasets.index[0], hash='foo')
+            self.assertEqual('foo', datasets['hash'].iloc[0])
+            self.assertIsNone(datasets['hash'].iloc[-1])
+            # Modifying a parquet table should cause the Arrow table to be re-saved
+            pqt = Path(self.one.cache_dir, 'sessions.pqt')
+            df, info = parquet.load(pqt)
+            parquet.save(pqt, df.assign(project='foo'), info)
+            self.one._load_cache()
+            self.assertTrue(all(self.one._cache.sessions['project'] == 'foo'))
+            with mock.patch('one.api.parquet.load') as parquet_load:
+                self.one._load_cache()
+                parquet_load.assert_not_called()
+            self.assertTrue(all(self.one._cache.sessions['project'] == 'foo'))
+            parquet.save(pqt, df, info)
+        finally:
+            for file in Path(self.one.cache_dir).glob('*.arrow'):
+                file.unlink()
+
+    def test_verify(self):
+        """Test One._check_filesystem local file integrity verification levels"""
+        tempdir = util.set_up_env()
+        self.addCleanup(tempdir.cleanup)
+        one = ONE(mode='local', cache_dir=tempdir.name)
+        util.create_file_tree(one)
+        dset = one._cache.datasets.iloc[0].copy()
+        dset['file_size'], dset['hash'] = 3, hashlib.md5(b'foo').hexdigest()
+        file = Path(tempdir.name, dset['session_path'], dset['rel_path'])
+        file.write_bytes(b'bar')  # Same size, different contents
+        with self.assertRaises(ValueError):
+            one.verify = 'foo'
+        with self.assertRaises(ValueError):
+            one._check_filesystem(dset, verify='foo')
+        with mock.patch('one.alf.cache.md5', wraps=hashfile.md5) as md5:
+            # The fast levels should not read the file contents
+            for level in ('none', 'size', 'size+mtime'):
+                with mock.patch('one.api._logger') as logger:
+                    self.assertEqual([file], one._check_filesystem(dset, verify=level))
+                logger.warning.assert_not_called()
+            md5.assert_not_called()
+            for level in ('md5-cached', 'md5-full', 'md5-cached'):
+                with self.assertLogs('one.api', logging.WARNING):
+                    one._check_filesystem(dset, verify=level)
+            self.assertEqual(2, md5.call_count)  # Hash indexed by first call
+            # Once indexed, the size+mtime level should compare the indexed hash
+            with self.assertLogs('one.api', logging.WARNING):
+                one._check_filesystem(dset, verify='size+mtime')
+            file.write_bytes(b'foo')
+            one._check_filesystem(dset, verify='md5-cached')
+            one.verify = 'size+mtime'
+            with mock.patch('one.api._logger') as logger:
+                one._check_filesystem(dset)
+            logger.warning.assert_not_called()
+            stat = file.stat()
+            os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))  # Modified
+            with self.assertLogs('one.api', logging.WARNING):
+                one._check_filesystem(dset)
+            # The size level should compare only the size
+            file.write_bytes(b'foobar')
+            with self.assertLogs('one.api', logging.WARNING):
+                one._check_filesystem(dset, verify='size')
+            self.assertEqual(3, md5.call_count)
+
+        # In background mode the file should be fully hashed on a background thread
+        one.verify_background = True
+        file.write_bytes(b'bar')
+        with self.assertLogs('one.api', logging.WARNING) as log:
+            self.assertEqual([file], one._check_filesystem(dset, verify='size'))
+            one._background.join()
+        self.assertIn('background verification failed', log.output[-1])
+        self.assertEqual(hashlib.md5(b'bar').hexdigest(), one._hashes.get(file))
+        self.assertEqual(0, len(one._background))
+        # The local hash and size should not be recorded as the expected values
+        datasets = one._cache.datasets
+        unknown = datasets[datasets['hash'].isna() & datasets['file_size'].isna()].iloc[:1]
+        self.assertEqual(1, len(one._check_filesystem(unknown, verify='md5-full')))
+        self.assertTrue(datasets.loc[unknown.index, ['hash', 'file_size']].isna().all(axis=None))
+
+    def test_update_datasets(self):
+        """Test One._update_datasets and replay of the cache mutation log"""
+        tempdir = util.set_up_env()
+        self.addCleanup(tempdir.cleanup)
+        one = ONE(mode='local', cache_dir=tempdir.name)
+        util.create_file_tree(one)
+        log_file = Path(tempdir.name, 'datasets.log')
+        self.assertFalse(log_file.exists())
+        # Remove files; the changes should be recorded by _check_filesystem in one write
+        dsets = one._cache.datasets.iloc[-2:]
+        for _, dset in dsets.iterrows():
+            Path(tempdir.name, dset['session_path'], dset['rel_path']).unlink()
+        with mock.patch('one.api.log_changes', wraps=one_cache.log_changes) as log:
+            self.assertEqual([None, None], one._check_filesystem(dsets))
+        log.assert_called_once()
+        self.assertFalse(one._cache.datasets.loc[dsets.index, 'exists'].any())
+        one._update_datasets(one._cache.datasets.index[0], exists=False, hash='foo')
+        self.assertTrue(log_file.exists())
+
+        # The changes should persist between instances
+        one = ONE(mode='local', cache_dir=tempdir.name)
+        self.assertFalse(one._cache.datasets.loc[dsets.index, 'exists'].any())
+        self.assertFalse(one._cache.datasets['exists'].iloc[0])
+        self.assertEqual('foo', one._cache.datasets['hash'].iloc[0])
+        self.assertEqual(3, (~one._cache.datasets['exists']).sum())
+
+        # A partially written line should be skipped with a warning
+        with open(log_file, 'a') as f:
+            f.write('{"date_created": "2021-')
+        with self.assertLogs('one.alf.cache', logging.WARNING):
+            one = One(mode='local', cache_dir=tempdir.name)
+            self.assertEqual(3, (~one._cache.datasets['exists']).sum())
+        # Changes logged after a partially written line should be read
+        one._update_datasets(one._cache.datasets.index[1], hash='bar')
+        self.assertEqual('bar', one_cache.read_changes(log_file)[-1]['hash'])
+
+        # Changes to a different version of the table should be ignored
+        pqt = Path(tempdir.name, 'datasets.pqt')
+        df, info = parquet.load(pqt)
+        parquet.save(pqt, df, {**info, 'date_created': '2021-10-18 10:00'})
+        one.refresh_cache('refresh')
+        self.assertTrue(one._cache.datasets['exists'].all())
+        parquet.save(pqt, df, info)
+
+        # Check compaction into the parquet table
+        with mock.patch('one.api.CACHE_LOG_MAX_SIZE', 0):
+            one.refresh_cache('refresh')
+        self.assertFalse(log_file.exists())
+        self.assertEqual(3, (~one._cache.datasets['exists']).sum())
+        df, info_ = parquet.load(pqt)
+        self.assertEqual(info, info_)
+        self.assertEqual(3, (~df['exists']).sum())
 
     def test_refresh_cache(self):
         """Test One.refresh_cache"""
@@ -923,6 +1431,304 @@ class TestOneAlyx(unittest.TestCase):
         cls.tempdir.cleanup()
 
 
+class _StandInTestCase(unittest.TestCase):
+    """A test case with a OneAlyx instance connected to a local stand-in Alyx server"""
+    one_kwargs = {}
+    """dict: Keyword arguments for OneAlyx"""
+
+    def setUp(self) -> None:
+        self.tempdir = util.set_up_env()
+        self.addCleanup(self.tempdir.cleanup)
+        patch = mock.patch('one.params.iopar.getfile',
+                           new=partial(util.get_file, self.tempdir.name))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.alyx = util.AlyxStandIn(self.tempdir.name).__enter__()
+        self.addCleanup(self.alyx.__exit__)
+        self.alyx.setup_params(self.tempdir.name)
+        self.one = OneAlyx(base_url=self.alyx.url, username=self.alyx.user,
+                           cache_dir=self.tempdir.name, silent=True, **self.one_kwargs)
+
+
+class TestOneAlyxCacheSync(_StandInTestCase):
+    """Tests for downloading the OneAlyx cache tables from a local stand-in Alyx server"""
+
+    def _assert_tables_equal(self):
+        """Assert that the loaded cache tables match the remote tables"""
+        for name in ('sessions', 'datasets'):
+            local = self.one._cache[name]
+            remote = compact_table(self.alyx.tables[name].sort_index(), CATEGORICAL_COLUMNS[name])
+            pd.testing.assert_frame_equal(local.sort_index(), remote, check_like=True)
+        self.assertEqual(self.alyx.date_created,
+                         self.one._cache['_meta']['raw']['datasets']['date_created'])
+
+    def _update_remote(self, date_created):
+        """Delete, modify and insert some rows in the remote tables"""
+        sessions, datasets = self.alyx.tables['sessions'], self.alyx.tables['datasets']
+        deleted_eid = sessions.index[0]
+        sessions = sessions.drop(deleted_eid)
+        sessions.iloc[0, sessions.columns.get_loc('project')] = 'foo'
+        isin = (datasets[['eid_0', 'eid_1']].apply(tuple, axis=1) == deleted_eid).values
+        datasets = datasets[~isin].copy()
+        datasets.iloc[:3, datasets.columns.get_loc('exists')] = False
+        new = datasets.iloc[:2].copy()
+        new['rel_path'] = ['alf/#2021-10-01#/foo.bar.npy', 'alf/foo.baz.npy']
+        new.index = pd.MultiIndex.from_arrays(
+            parquet.str2np([str(UUID(int=1)), str(UUID(int=2))]).T, names=datasets.index.names)
+        datasets = pd.concat([datasets, new])
+        self.alyx.update(sessions=sessions, datasets=datasets, date_created=date_created)
+
+    def test_delta(self):
+        """Test the local cache tables are updated with only the changed rows"""
+        self.assertEqual([('GET', '/cache/info')], self.alyx.requests)
+        self._update_remote('2021-10-18 10:00')
+        self.one._load_cache()
+        self.assertIn(('GET', '/cache/delta.zip?since=2021-05-13T20%3A38%3A00'),
+                      self.alyx.requests)
+        self.assertNotIn(('GET', '/cache.zip'), self.alyx.requests)
+        self._assert_tables_equal()
+        self.assertIn('alf/foo.baz.npy', self.one.list_datasets())
+        # Merging the same delta again should make no difference
+        self.alyx.update(date_created='2021-10-18 10:00')
+        self.one.alyx.download_cache_tables(since='2021-05-13T20:38')
+        self.one._load_cache()
+        self._assert_tables_equal()
+
+    def test_delta_unsupported(self):
+        """Test the full cache is downloaded when a delta can't be downloaded"""
+        self.alyx.delta = False
+        self._update_remote('2021-10-18 10:00')
+        with self.assertLogs('one.api', logging.DEBUG) as log:
+            self.one._load_cache()
+        self.assertIn('incrementally', log.output[-2])
+        self.assertIn(('GET', '/cache.zip'), self.alyx.requests)
+        self._assert_tables_equal()
+        # Unknown date should also fall back to full download
+        self.alyx.delta = True
+        self.alyx.snapshots.clear()
+        self.alyx.update(date_created='2021-10-19 10:00')
+        with mock.patch.object(self.one.alyx, 'download_cache_tables',
+                               wraps=self.one.alyx.download_cache_tables) as download:
+            self.one._load_cache()
+        download.assert_called_with()
+        self._assert_tables_equal()
+
+
+class TestOneAlyxBatch(_StandInTestCase):
+    """Tests for querying lists of IDs from a local stand-in Alyx server in batches"""
+    one_kwargs = {'cache_rest': None}
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.eids = [x['id'] for x in self.alyx._session_records()]
+
+    def _list_requests(self, endpoint):
+        """Return the number of list requests made to an endpoint"""
+        return sum(path.startswith(f'/{endpoint}?') for _, path in self.alyx.requests)
+
+    def test_list_by_id(self):
+        """Test for AlyxClient.list_by_id method"""
+        eids = self.eids[:25]
+        ids = eids[::-1] + [eids[0], str(uuid4())]  # Reversed with a duplicate and missing ID
+        records = self.one.alyx.list_by_id('sessions', ids, chunk_size=10)
+        self.assertEqual(ids[:-1], [x['id'] for x in records[:-1]])
+        self.assertIsNone(records[-1])
+        # 26 unique IDs in chunks of 10
+        self.assertEqual(3, self._list_requests('sessions'))
+        queries = [urllib.parse.urlsplit(path).query for _, path in self.alyx.requests
+                   if path.startswith('/sessions?')]
+        django = [urllib.parse.parse_qs(x)['django'][0] for x in queries]
+        unique = list(dict.fromkeys(ids))
+        expected = ['id__in,[' + ','.join(unique[i:i + 10]) + ']' for i in range(0, 26, 10)]
+        self.assertCountEqual(expected, django)
+        # The number of IDs per request is limited by the query length
+        with mock.patch('one.webclient.MAX_QUERY_LENGTH', 400):
+            self.alyx.requests.clear()
+            records = self.one.alyx.list_by_id('sessions', ids)
+            self.assertEqual(ids[:-1], [x['id'] for x in records[:-1]])
+            queries = [urllib.parse.urlsplit(path).query for _, path in self.alyx.requests
+                       if path.startswith('/sessions?')]
+            self.assertEqual(3, len(queries))  # 9 IDs of 36 characters fit in 400
+            self.assertTrue(all(len(x) <= len('django=') + 400 for x in queries))
+        self.assertEqual([], self.one.alyx.list_by_id('sessions', []))
+
+    def test_get_details(self):
+        """Test for OneAlyx.get_details with a list of eids"""
+        eids = self.eids[:10]
+        expected = [self.one.get_details(eid, query_type='remote') for eid in eids]
+        self.alyx.requests.clear()
+        with mock.patch.object(self.one, 'eid2path') as eid2path:  # Paths built from records
+            self.assertEqual(expected, self.one.get_details(eids, query_type='remote'))
+            eid2path.assert_not_called()
+        self.assertEqual(1, self._list_requests('sessions'))
+        # Full details should be read for each session
+        details = self.one.get_details(eids, full=True, query_type='remote')
+        self.assertEqual(eids, [x['id'] for x in details])
+        self.assertTrue(all('data_dataset_session_related' in x for x in details))
+        # Unknown sessions should raise
+        with self.assertRaises(HTTPError):
+            self.one.get_details([eids[0], str(uuid4())], query_type='remote')
+        # Session references
+        refs = self.one.eid2ref(eids, as_dict=False)
+        self.assertEqual([self.one.eid2ref(eid, as_dict=False) for eid in eids], refs)
+
+    def test_stream_session(self):
+        """Test that remote session reads that need no full details are streamed"""
+        eid = self.eids[0]
+        expected = ses2records(self.one.alyx.rest('sessions', 'read', eid))[1]
+        with mock.patch.object(self.one.alyx, 'stream', wraps=self.one.alyx.stream) as stream, \
+                mock.patch.object(self.one.alyx, 'rest', wraps=self.one.alyx.rest) as rest:
+            dsets = self.one.list_datasets(eid, details=True, query_type='remote')
+            det = self.one.get_details(eid, query_type='remote')
+            rest.assert_not_called()
+        self.assertEqual(2, stream.call_count)
+        pd.testing.assert_frame_equal(expected, dsets[expected.columns])
+        self.assertEqual(self.one.get_details([eid], query_type='remote')[0], det)
+        self.assertNotIn('data_dataset_session_related', det)
+        self.assertIn('data_dataset_session_related',
+                      self.one.get_details(eid, full=True, query_type='remote'))
+
+    def test_load_datasets_batch(self):
+        """Test that OneAlyx.load_datasets_batch lists the datasets of all sessions at once"""
+        dsets = ['_ibl_wheel.position.npy', '_ibl_wheel.timestamps.npy']
+        eids = self.one.search(dataset=dsets, query_type='local')[:5][::-1]
+        self.assertTrue(len(eids) > 1)
+
+        def check_filesystem(datasets, **_):
+            return [Path(x) for x in datasets['rel_path']]
+        with mock.patch.object(self.one, '_check_filesystem', side_effect=check_filesystem):
+            expected = self.one.load_datasets_batch(
+                eids, dsets, query_type='local', download_only=True)
+            self.alyx.requests.clear()
+            table = self.one.load_datasets_batch(
+                eids, dsets, query_type='remote', download_only=True)
+        queries = [path for _, path in self.alyx.requests if 'offset=' not in path]
+        self.assertEqual(1, sum(x.startswith('/datasets?') for x in queries))  # Plus its pages
+        self.assertFalse(any(path.startswith('/sessions') for _, path in self.alyx.requests))
+        self.assertEqual(eids, table.index.unique('eid').tolist())
+        self.assertEqual(expected['file'].tolist(), table['file'].tolist())
+
+    def test_eid2path(self):
+        """Test for OneAlyx.eid2path with a list of eids"""
+        eids = self.eids[:10] + [str(uuid4())]
+        paths = self.one.eid2path(eids, query_type='remote')
+        self.assertEqual([self.one.eid2path(eid, query_type='remote') for eid in eids], paths)
+        self.assertIsNone(paths[-1])
+
+    def test_dataset2type(self):
+        """Test for OneAlyx.dataset2type with a list of datasets"""
+        records = self.alyx._dataset_records()[:10]
+        ids = [x['url'].split('/')[-1] for x in records]
+        self.alyx.requests.clear()
+        self.assertEqual([x['dataset_type'] for x in records], self.one.dataset2type(ids))
+        self.assertEqual(1, self._list_requests('datasets'))
+        self.assertEqual(records[0]['dataset_type'], self.one.dataset2type(ids[0]))
+
+
+class TestOneAlyxDownload(_StandInTestCase):
+    """Tests for downloading datasets from a local stand-in file server"""
+    one_kwargs = {'cache_rest': None}
+
+    def test_download_datasets(self):
+        """Test for OneAlyx._download_datasets"""
+        datasets = self.one._cache['datasets'].iloc[:20].copy()
+        for i, (_, rec) in enumerate(datasets.iterrows()):
+            data = os.urandom(i + 1)
+            self.alyx.files[urllib.parse.urlsplit(self.one.record2url(rec)).path] = data
+            md5 = hashlib.md5(data).hexdigest()
+            datasets.loc[rec.name, ['file_size', 'hash']] = len(data), md5
+        total = datasets['file_size'].sum()
+        with mock.patch('one.api.tqdm') as tqdm:
+            files = self.one._download_datasets(datasets)
+        for file, data in zip(files, self.alyx.files.values()):
+            self.assertEqual(data, file.read_bytes())
+        # The progress of all downloads should be shown in a single progress bar
+        tqdm.assert_called_once()
+        self.assertEqual(total, tqdm.call_args[1]['total'])
+        pbar = tqdm.return_value.__enter__.return_value
+        self.assertEqual(total, sum(x[0][0] for x in pbar.update.call_args_list))
+        # Files already downloaded should count towards the progress
+        self.alyx.requests.clear()
+        with mock.patch('one.api.tqdm') as tqdm:
+            self.assertEqual(files, self.one._download_datasets(datasets))
+        pbar = tqdm.return_value.__enter__.return_value
+        self.assertEqual(total, sum(x[0][0] for x in pbar.update.call_args_list))
+        self.assertFalse(self.alyx.requests)
+        # With an unknown file size the progress bar total should be unknown
+        datasets.iloc[0, datasets.columns.get_loc('file_size')] = np.nan
+        with mock.patch('one.api.tqdm') as tqdm, mock.patch.object(self.one, '_download_dataset'):
+            self.one._download_datasets(datasets)
+        self.assertIsNone(tqdm.call_args[1]['total'])
+
+    def test_download_mismatch(self):
+        """Test OneAlyx._download_file when the downloaded file doesn't match the record"""
+        rec = self.one._cache['datasets'].iloc[0].copy()
+        url = self.one.record2url(rec)
+        self.alyx.files[urllib.parse.urlsplit(url).path] = data = os.urandom(100)
+        rec['file_size'], rec['hash'] = len(data), hashlib.md5(b'foo').hexdigest()
+        with mock.patch.object(self.one, '_tag_mismatched_file_record') as tag, \
+                self.assertLogs('one.api', logging.ERROR):
+            self.assertIsNone(self.one._download_dataset(rec, hash=rec['hash']))
+        tag.assert_called_once_with(url)
+        # The file should not have been moved into place
+        self.assertFalse(any(self.one.cache_dir.rglob(Path(url).name.split('.')[0] + '.*')))
+        # Missing file sizes and hashes in the cache are NaN
+        file = self.one._download_dataset(rec, file_size=np.nan, hash=np.nan)
+        self.assertEqual(data, file.read_bytes())
+
+    def test_download_hash_index(self):
+        """Test that hashes computed while downloading are indexed and not computed again"""
+        rec = self.one._cache['datasets'].iloc[0].copy()
+        url = self.one.record2url(rec)
+        self.alyx.files[urllib.parse.urlsplit(url).path] = data = os.urandom(100)
+        md5 = hashlib.md5(data).hexdigest()
+        file = self.one._download_dataset(rec, file_size=len(data), hash=md5)
+        self.assertEqual(md5, self.one._hashes.get(file))
+        self.assertIs(self.one._hashes, self.one._hashes)  # A single index is kept
+        self.assertTrue(Path(self.one.cache_dir, one.api.HASH_INDEX).exists())
+        # Checking the file again should neither re-download nor re-hash it
+        self.alyx.requests.clear()
+        with mock.patch('one.alf.cache.md5') as hash_fcn:
+            self.assertEqual(file, self.one._download_dataset(rec, file_size=len(data), hash=md5))
+            hash_fcn.assert_not_called()
+        self.assertFalse(self.alyx.requests)
+        # A file of the wrong size should be re-downloaded without being hashed
+        file.write_bytes(data[:50])
+        with mock.patch('one.alf.cache.md5') as hash_fcn:
+            self.one._download_dataset(rec, file_size=len(data), hash=md5)
+            hash_fcn.assert_not_called()
+        self.assertEqual(data, file.read_bytes())
+
+    def test_download_verify(self):
+        """Test OneAlyx._download_file local file integrity verification levels"""
+        rec = self.one._cache['datasets'].iloc[0].copy()
+        url = self.one.record2url(rec)
+        self.alyx.files[urllib.parse.urlsplit(url).path] = data = os.urandom(100)
+        kwargs = dict(file_size=len(data), hash=hashlib.md5(data).hexdigest())
+        file = self.one._download_dataset(rec, **kwargs)
+        file.write_bytes(os.urandom(100))  # Same size, different contents
+        # The fast levels should neither read nor re-download the file
+        self.alyx.requests.clear()
+        with mock.patch('one.alf.cache.md5') as hash_fcn:
+            for level in ('none', 'size'):
+                self.assertEqual(file, self.one._download_dataset(rec, verify=level, **kwargs))
+            hash_fcn.assert_not_called()
+        self.assertFalse(self.alyx.requests)
+        self.assertNotEqual(data, file.read_bytes())
+        # The file was modified since its hash was indexed upon download
+        self.one._download_dataset(rec, verify='size+mtime', **kwargs)
+        self.assertEqual(data, file.read_bytes())
+        file.write_bytes(os.urandom(100))
+        self.one.verify = 'md5-full'
+        self.one._download_dataset(rec, **kwargs)
+        self.assertEqual(data, file.read_bytes())
+        # In background mode the file is hashed after being returned
+        self.one.verify, self.one.verify_background = 'none', True
+        with mock.patch.object(self.one, '_verify_in_background') as verify:
+            self.one._download_dataset(rec, **kwargs)
+        verify.assert_called_once_with(file, kwargs['hash'])
+
+
 @unittest.skipIf(OFFLINE_ONLY, 'online only test')
 class TestOneRemote(unittest.TestCase):
     """Test remote queries"""
@@ -1414,6 +2220,26 @@ class TestOneMisc(unittest.TestCase):
         with self.assertRaises(ValueError):
             autocomplete('dat', search_terms)
 
+    def test_background_queue(self):
+        """Test one.caching.BackgroundQueue class"""
+        background = BackgroundQueue('test-background')
+        event = threading.Event()
+        futures = [background.submit(event.wait), background.submit(lambda x: x * 2, 2),
+                   background.submit(lambda: 1 / 0)]
+        self.assertEqual(3, len(background))
+        event.set()
+        background.join()
+        self.assertEqual(0, len(background))
+        self.assertTrue(futures[0].result())
+        self.assertEqual(4, futures[1].result())
+        self.assertRaises(ZeroDivisionError, futures[2].result)
+        # Functions should be called in turn on a single daemon thread
+        future = background.submit(threading.current_thread)
+        thread = future.result(timeout=5)
+        self.assertTrue(thread.daemon)
+        self.assertEqual('test-background', thread.name)
+        self.assertIsNot(thread, threading.current_thread())
+
     def test_LazyID(self):
         uuids = [
             'c1a2758d-3ce5-4fa7-8d96-6b960f029fa9',
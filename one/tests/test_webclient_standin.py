@@ -0,0 +1,523 @@
+"""Offline unit tests for the one.webclient module, using a local stand-in Alyx server"""
+import unittest
+from unittest import mock
+from pathlib import Path
+import os
+import gc
+import gzip
+import json
+import hashlib
+import logging
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from uuid import uuid4
+
+import pandas as pd
+import requests
+from iblutil.io.parquet import np2str
+
+import one.webclient as wc
+import one.alf.exceptions as alferr
+from one.util import ses2records
+from . import util
+
+
+class _StandInTestCase(unittest.TestCase):
+    """A test case with an AlyxClient connected to a local stand-in Alyx server"""
+    client_kwargs = {'cache_rest': None}
+    """dict: Keyword arguments for the AlyxClient"""
+
+    def setUp(self):
+        self.tempdir = util.set_up_env()
+        self.addCleanup(self.tempdir.cleanup)
+        patch = mock.patch('one.params.iopar.getfile',
+                           new=partial(util.get_file, self.tempdir.name))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.alyx = util.AlyxStandIn(self.tempdir.name).__enter__()
+        self.addCleanup(self.alyx.__exit__)
+        self.alyx.setup_params(self.tempdir.name)
+        self.ac = wc.AlyxClient(base_url=self.alyx.url, username=self.alyx.user,
+                                silent=True, **self.client_kwargs)
+        self.addCleanup(self.ac.close)
+
+
+class TestRestCacheStore(_StandInTestCase):
+    """Tests for the one.webclient.RestCache SQLite store of REST responses"""
+    client_kwargs = {}
+
+    def test_cache_store(self):
+        """Test for one.webclient.RestCache class"""
+        cache = wc.RestCache(self.tempdir.name, max_bytes=1000)
+        self.assertEqual(0, len(cache))
+        self.assertIsNone(cache.get('/foo'))
+        expires = datetime(2021, 5, 13)
+        response = [{'id': str(i), 'name': 'foo'} for i in range(100)]
+        cache.put('/foo', response, expires)
+        # Values are stored compressed
+        self.assertEqual(1, len(cache))
+        self.assertTrue(0 < cache.nbytes < len(json.dumps(response)))
+        self.assertEqual((response, expires, {}), cache.get('/foo'))
+        # Overwriting a response should not change the count
+        cache.put('/foo', response[:50], expires)
+        self.assertEqual(1, len(cache))
+        self.assertEqual(response[:50], cache.get('/foo')[0])
+        # Responses larger than the cap should not be stored
+        large = [str(uuid4()) for _ in range(100)]
+        cache.put('/large', large, expires)
+        self.assertIsNone(cache.get('/large'))
+        # Least recently used responses should be evicted when the cap is exceeded
+        for i in range(100):
+            cache.put(f'/bar/{i}', large[i], expires)
+            cache.get('/foo')
+        self.assertLessEqual(cache.nbytes, cache.max_bytes)
+        self.assertIsNotNone(cache.get('/foo'))
+        self.assertIsNone(cache.get('/bar/0'))
+        self.assertIsNotNone(cache.get('/bar/99'))
+        # Check the running total of the compressed sizes
+        with cache._connect() as conn:
+            total, = conn.execute('SELECT SUM(size) FROM responses').fetchone()
+        self.assertEqual(total, cache.nbytes)
+
+    def test_cache_store_access(self):
+        """Test that reading from the RestCache store doesn't write to the database"""
+        cache = wc.RestCache(self.tempdir.name)
+        cache.put('/foo', 'foo', datetime(2021, 5, 13))
+
+        def accessed():
+            with cache._connect() as conn:
+                return conn.execute('SELECT accessed FROM responses').fetchone()[0]
+        saved = accessed()
+        with cache._connect() as conn:
+            # The data version changes when another connection commits a change
+            version, = conn.execute('PRAGMA data_version').fetchone()
+            self.assertEqual('foo', cache.get('/foo')[0])
+            self.assertEqual(version, conn.execute('PRAGMA data_version').fetchone()[0])
+        self.assertEqual(saved, accessed())
+        # The access times should be saved in a batch
+        cache.flush()
+        self.assertLess(saved, accessed())
+        saved = accessed()
+        with mock.patch('one.webclient.REST_CACHE_FLUSH_SIZE', 1):
+            cache.get('/foo')
+        self.assertLess(saved, accessed())
+        # The client should keep a single store
+        self.assertIs(self.ac.rest_cache, self.ac.rest_cache)
+
+
+class TestConnectionPool(_StandInTestCase):
+    """Tests for the AlyxClient HTTP session and connection pool, using a local stand-in server"""
+    client_kwargs = {'cache_rest': None, 'pool_size': 4}
+
+    def test_keep_alive(self):
+        """Test that connections are reused by all requests"""
+        for _ in range(5):
+            self.ac.get('/cache/info')
+        self.ac.prefetch_pages = 0  # Request pages serially
+        rep = self.ac.get('/sessions?limit=5')
+        self.assertIsInstance(rep, wc._PaginatedResponse)
+        self.assertEqual(len(self.alyx.tables['sessions']), len(list(rep)))
+        with self.assertRaises(requests.HTTPError):
+            self.ac.get('/foo')
+        self.assertEqual(1, self.alyx.connections)
+
+    def test_threads(self):
+        """Test that each thread has its own session that shares the connection pool"""
+        barrier = threading.Barrier(4)  # Ensure each task is run in a different thread
+
+        def get_session(_):
+            barrier.wait(timeout=5)
+            return self.ac.session
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            sessions = set(executor.map(get_session, range(4)))
+            self.assertEqual(4, len(sessions))
+            self.assertEqual(1, len({x.get_adapter(self.alyx.url) for x in sessions}))
+            results = list(executor.map(lambda _: self.ac.get('/cache/info'), range(40)))
+        self.assertTrue(all(x['origin'] == 'alyx' for x in results))
+        self.assertTrue(self.alyx.connections <= 4)
+
+    def test_retries(self):
+        """Test that requests are retried upon server errors"""
+        self.alyx.errors = [503, 502]
+        self.assertEqual('alyx', self.ac.get('/cache/info')['origin'])
+        self.assertFalse(self.alyx.errors)
+        # After the retries are exhausted the error should be raised
+        self.alyx.errors = [503] * (wc.N_RETRIES + 1)
+        with self.assertRaises(requests.HTTPError) as ex:
+            self.ac.get('/cache/info')
+        self.assertEqual(503, ex.exception.response.status_code)
+
+    def test_coalesce(self):
+        """Test that concurrent identical GET requests share a single request"""
+        self.alyx.delay = .2  # Ensure requests overlap
+        barrier = threading.Barrier(8)
+
+        def get(query):
+            barrier.wait(timeout=5)
+            return self.ac.get(query)
+
+        queries = ['/cache/info'] * 6 + ['/sessions?limit=100'] * 2
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(get, queries))
+        self.assertEqual(2, len(self.alyx.requests))
+        self.assertEqual({'requests': 2, 'coalesced': 6}, self.ac.coalesce_counts)
+        self.assertTrue(all(x == results[0] for x in results[:6]))
+        self.assertIsNot(results[0], results[1])  # Each call returns its own copy
+        self.assertEqual(results[6], results[7])
+        # Errors should be raised in all calls
+        self.alyx.errors = [404]
+        barrier.reset()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(get, '/cache/info') for _ in range(8)]
+        self.assertTrue(all(isinstance(x.exception(), requests.HTTPError) for x in futures))
+        self.assertEqual(3, len(self.alyx.requests))
+        # With coalescing off, each call makes its own request
+        self.ac.coalesce = False
+        barrier.reset()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(get, ['/cache/info'] * 8))
+        self.assertEqual(11, len(self.alyx.requests))
+        self.assertFalse(self.ac._flights)
+
+
+class TestPaginatedResponse(_StandInTestCase):
+    """Tests for one.webclient._PaginatedResponse, using a local stand-in server"""
+    def setUp(self):
+        super().setUp()
+        self.records = self.alyx._session_records()
+
+    def _offsets(self):
+        """Return the offsets of the sessions pages requested"""
+        queries = (urllib.parse.urlsplit(x) for _, x in self.alyx.requests)
+        return [int(urllib.parse.parse_qs(x.query).get('offset', [0])[0])
+                for x in queries if x.path == '/sessions']
+
+    def test_prefetch(self):
+        """Test that the remaining pages are requested concurrently"""
+        self.alyx.delay = .05
+        self.ac.prefetch_pages = 3
+        rep = self.ac.get('/sessions?limit=3')
+        self.assertIsInstance(rep, wc._PaginatedResponse)
+        self.assertEqual(9, rep.n_pages)
+        self.assertEqual(self.records, rep.to_list())
+        self.assertCountEqual(range(0, len(self.records), 3), self._offsets())
+        self.assertTrue(1 < self.alyx.max_active <= 3)
+        self.assertIsNone(rep._executor)
+        # Check the table of results
+        df = rep.to_frame(index='id')
+        self.assertEqual(len(self.records), len(df))
+        self.assertEqual([x['subject'] for x in self.records], df['subject'].tolist())
+
+    def test_prefetch_shutdown(self):
+        """Test that the prefetch threads are stopped when a partly read response is deleted"""
+        self.ac.prefetch_pages = 3
+        rep = self.ac.get('/sessions?limit=3')
+        self.assertEqual(self.records[:6], rep[:6])
+        executor = rep._executor
+        self.assertIsNotNone(executor)
+        for future in list(rep._pending.values()):
+            future.result()  # Prefetched page requests hold a reference to the response
+        del rep
+        gc.collect()
+        self.assertTrue(executor._shutdown)
+        for thread in executor._threads:
+            thread.join(timeout=1)
+            self.assertFalse(thread.is_alive())
+
+    def test_indexing(self):
+        """Test that each page is requested once when indexing and iterating"""
+        rep = self.ac.get('/sessions?limit=3')
+        self.assertEqual(self.records[-1], rep[-1])
+        self.assertEqual(self.records[4:20:5], rep[4:20:5])
+        self.assertEqual(self.records[20:2:-3], rep[20:2:-3])
+        self.assertEqual([], rep[5:5])
+        self.assertEqual(self.records, list(rep))
+        offsets = self._offsets()
+        self.assertEqual(len(set(offsets)), len(offsets))
+
+    def test_no_prefetch(self):
+        """Test that pages are requested one at a time upon access when prefetch is 0"""
+        self.ac.prefetch_pages = 0
+        rep = self.ac.get('/sessions?limit=5')
+        self.assertEqual(self.records[:5], list(rep[:5]))
+        self.assertEqual([0], self._offsets())
+        self.assertEqual(self.records[12], rep[12])
+        self.assertEqual([0, 10], self._offsets())
+        self.assertEqual(self.records, list(rep))
+        self.assertEqual([0, 10, 5, 15, 20, 25], self._offsets())
+        self.assertEqual(1, self.alyx.max_active)
+        self.assertIsNone(rep._executor)
+
+
+class TestConditionalRequests(_StandInTestCase):
+    """Tests for the revalidation of expired cached REST responses, using a stand-in server"""
+    client_kwargs = {'cache_rest': 'GET'}
+
+    def _get(self):
+        """Make a GET request, returning the response and the request headers received"""
+        n_requests = len(self.alyx.requests)
+        rep = self.ac.get('/cache/info', expires=True)  # Expires immediately
+        self.assertEqual(n_requests + 1, len(self.alyx.requests))
+        return rep, self.alyx.last_headers
+
+    def test_etag(self):
+        """Test revalidation with the ETag validator"""
+        rep, headers = self._get()
+        self.assertNotIn('If-None-Match', headers)
+        _, _, validators = self.ac.rest_cache.get('/cache/info')
+        self.assertCountEqual(['ETag', 'Last-Modified'], validators)
+        # Once expired, the request should be conditional and the response not modified
+        with mock.patch.object(wc.RestCache, 'put') as put:
+            cached, headers = self._get()
+            put.assert_not_called()
+        self.assertEqual(validators['ETag'], headers['If-None-Match'])
+        self.assertEqual(rep, cached)
+        # When the response changes it should be downloaded and cached
+        self.alyx.update(date_created='2022-01-01 00:00')
+        rep, headers = self._get()
+        self.assertEqual(validators['ETag'], headers['If-None-Match'])
+        self.assertEqual('2022-01-01 00:00', rep['date_created'])
+        self.assertNotEqual(validators, self.ac.rest_cache.get('/cache/info')[2])
+
+    def test_last_modified(self):
+        """Test revalidation with the Last-Modified validator"""
+        self.alyx.validators = ('Last-Modified',)
+        rep, _ = self._get()
+        *_, validators = self.ac.rest_cache.get('/cache/info')
+        self.assertEqual(['Last-Modified'], list(validators))
+        with mock.patch.object(wc.RestCache, 'put') as put:
+            cached, headers = self._get()
+            put.assert_not_called()
+        self.assertEqual(validators['Last-Modified'], headers['If-Modified-Since'])
+        self.assertEqual(rep, cached)
+        # The expiry should have been renewed
+        _, expires, _ = self.ac.rest_cache.get('/cache/info')
+        self.assertTrue(expires > datetime.now() - timedelta(seconds=5))
+        # Without validators the full response should be requested
+        self.alyx.validators = ()
+        self._get()
+        self.assertFalse(self.ac.rest_cache.get('/cache/info')[2])
+        _, headers = self._get()
+        self.assertNotIn('If-Modified-Since', headers)
+
+
+class TestStreaming(_StandInTestCase):
+    """Tests for AlyxClient.stream, using a local stand-in server"""
+    def test_stream_pages(self):
+        """Test streaming the records of a paginated list"""
+        self.alyx.gzip = True
+        with mock.patch('gzip.compress', wraps=gzip.compress) as compress:
+            rep = self.ac.stream('/sessions?limit=5')
+            self.assertEqual(['results'], list(rep))  # Nothing requested yet
+            self.assertFalse(self.alyx.requests)
+            records = rep['results']
+            self.assertEqual(self.alyx._session_records()[0], next(records))
+            self.assertEqual(26, rep['count'])
+            self.assertEqual(self.alyx._session_records()[1:], list(records))
+            self.assertIsNone(rep['next'])
+            self.assertEqual(6, compress.call_count)
+        self.assertEqual(6, len(self.alyx.requests))
+        # Errors should be raised upon iteration
+        with self.assertRaises(requests.HTTPError) as ex:
+            next(self.ac.stream('/foo')['results'])
+        self.assertEqual(404, ex.exception.response.status_code)
+
+    def test_stream_session(self):
+        """Test streaming the datasets of a session into one.util.ses2records"""
+        datasets = self.alyx.tables['datasets']
+        eid = np2str(datasets[['eid_0', 'eid_1']].values[0])
+        ses = self.ac.stream(f'/sessions/{eid}', key='data_dataset_session_related')
+        session, datasets = ses2records(ses)
+        self.assertEqual(self.ac.base_url + '/sessions/' + eid, ses['url'])
+        expected = ses2records(self.ac.get(f'/sessions/{eid}'))
+        pd.testing.assert_series_equal(expected[0], session)
+        pd.testing.assert_frame_equal(expected[1], datasets)
+        self.assertTrue(len(datasets) > 0)
+
+
+class TestDownloadFile(_StandInTestCase):
+    """Tests for AlyxClient.download_file, using a local stand-in file server"""
+    client_kwargs = {'cache_rest': None, 'pool_size': 4}
+
+    def setUp(self):
+        super().setUp()
+        self.files = {f'/lab/Subjects/subj/2020-01-01/001/alf/obj.attr_{i}.bin': os.urandom(i)
+                      for i in range(1, 101)}
+        self.alyx.files.update(self.files)
+
+    def test_concurrent_download(self):
+        """Test concurrent downloads through the client's pooled connections"""
+        pbar = mock.Mock()  # A progress bar shared by all downloads
+        download = partial(self.ac.download_file, cache_dir=self.tempdir.name,
+                           return_md5=True, pbar=pbar)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(download, (self.alyx.url + x for x in self.files)))
+        for (file, md5), data in zip(results, self.files.values()):
+            self.assertEqual(data, Path(file).read_bytes())
+            self.assertEqual(hashlib.md5(data).hexdigest(), md5)
+        # Progress should be updated with the number of bytes received
+        total = sum(map(len, self.files.values()))
+        self.assertEqual(total, sum(x[0][0] for x in pbar.update.call_args_list))
+        # Connections should be reused
+        self.assertLessEqual(self.alyx.connections, 4)
+        # Credentials should be sent with each request, leaving the shared session unchanged
+        self.ac._par = self.ac._par.set('HTTP_DATA_SERVER_LOGIN', 'foo')
+        self.ac._par = self.ac._par.set('HTTP_DATA_SERVER_PWD', 'bar')
+        file = next(iter(self.files))
+        with mock.patch.object(self.ac.session, 'get', wraps=self.ac.session.get) as get:
+            self.ac.download_file(self.alyx.url + file, cache_dir=self.tempdir.name, clobber=True)
+        self.assertEqual(('foo', 'bar'), get.call_args[1]['auth'])
+        self.assertIsNone(self.ac.session.auth)
+
+    def test_download_errors(self):
+        """Test errors raised by failed downloads"""
+        url = self.alyx.url + '/lab/Subjects/subj/2020-01-01/001/alf/foo.bar.bin'
+        with self.assertLogs(logging.getLogger('one.webclient'), logging.ERROR) as log, \
+                self.assertRaises(urllib.error.HTTPError) as ex:
+            self.ac.download_file(url, cache_dir=self.tempdir.name)
+        self.assertEqual(401, ex.exception.code)
+        self.assertIn('HTTP_DATA_SERVER_PWD', str(ex.exception))
+        self.assertIn(url, log.output[-1])
+
+    def test_resume(self):
+        """Test resuming interrupted downloads from the partial file"""
+        data = os.urandom(10000)
+        file = Path(self.tempdir.name, 'obj.attr.bin')
+        url = self.alyx.url + '/lab/Subjects/subj/2020-01-01/001/alf/' + file.name
+        self.alyx.files[urllib.parse.urlsplit(url).path] = data
+        part, journal = Path(f'{file}.part'), Path(f'{file}.part.json')
+        download = partial(self.ac.download_file, url, cache_dir=self.tempdir.name,
+                           clobber=True, return_md5=True)
+        with mock.patch('one.webclient.DOWNLOAD_CHUNK_SIZE', 1000):
+            # An interrupted download should leave the partial file and journal
+            self.alyx.drops = [3500]
+            with self.assertRaises(requests.exceptions.RequestException):
+                download(retries=0)
+            self.assertFalse(file.exists())
+            self.assertEqual(data[:3000], part.read_bytes())
+            self.assertEqual(3000, json.loads(journal.read_text())['offset'])
+            # The next attempt should request the remaining bytes
+            self.assertEqual((str(file), hashlib.md5(data).hexdigest()), download())
+            self.assertEqual('bytes=3000-', self.alyx.last_headers['Range'])
+            self.assertIn('If-Range', self.alyx.last_headers)
+            self.assertEqual(data, file.read_bytes())
+            self.assertFalse(part.exists() or journal.exists())
+            # Interrupted downloads should be resumed by retries
+            self.alyx.requests.clear()
+            self.alyx.drops = [2500, 5500]
+            with self.assertLogs('one.webclient', logging.WARNING):
+                self.assertEqual(hashlib.md5(data).hexdigest(), download()[1])
+            self.assertEqual(3, len(self.alyx.requests))
+            self.assertEqual('bytes=7000-', self.alyx.last_headers['Range'])  # 2000 + 5500
+            self.assertEqual(data, file.read_bytes())
+            # The download should restart if the partial file doesn't match the journal
+            self.alyx.drops = [3500]
+            self.assertRaises(requests.exceptions.RequestException, download, retries=0)
+            part.write_bytes(b'0' * 3000)
+            self.assertEqual(hashlib.md5(data).hexdigest(), download()[1])
+            self.assertNotIn('Range', self.alyx.last_headers)
+            # The download should restart if the remote file changed
+            self.alyx.drops = [3500]
+            self.assertRaises(requests.exceptions.RequestException, download, retries=0)
+            data = self.alyx.files[urllib.parse.urlsplit(url).path] = os.urandom(10000)
+            self.assertEqual(hashlib.md5(data).hexdigest(), download()[1])
+            self.assertEqual(data, file.read_bytes())
+            # The download should restart if the server ignores the Range header
+            self.alyx.ranges = False
+            self.alyx.drops = [3500]
+            with self.assertLogs('one.webclient', logging.WARNING):
+                self.assertEqual(hashlib.md5(data).hexdigest(), download()[1])
+            self.assertEqual(data, file.read_bytes())
+
+    def test_integrity(self):
+        """Test that files are only moved into place if their size and hash match"""
+        data = os.urandom(1000)
+        url = self.alyx.url + '/lab/Subjects/subj/2020-01-01/001/alf/obj.attr.bin'
+        self.alyx.files[urllib.parse.urlsplit(url).path] = data
+        download = partial(self.ac.download_file, url, cache_dir=self.tempdir.name)
+        with self.assertRaises(alferr.ALFIntegrityError):
+            download(hash=hashlib.md5(b'foo').hexdigest())
+        with self.assertRaises(alferr.ALFIntegrityError):
+            download(file_size=len(data) + 1)
+        self.assertFalse(any(Path(self.tempdir.name).glob('obj.attr*')))  # Nor partial files
+        file = download(file_size=len(data), hash=hashlib.md5(data).hexdigest())
+        self.assertEqual(data, Path(file).read_bytes())
+
+    def test_chunks(self):
+        """Test downloading a byte range of a file"""
+        data = os.urandom(1000)
+        url = self.alyx.url + '/lab/Subjects/subj/2020-01-01/001/alf/obj.attr.bin'
+        self.alyx.files[urllib.parse.urlsplit(url).path] = data
+        for ranges in (True, False):
+            self.alyx.ranges = ranges
+            file = self.ac.download_file(url, chunks=(100, 500), cache_dir=self.tempdir.name,
+                                         clobber=True)
+            self.assertEqual(data[100:600], Path(file).read_bytes())
+            self.assertEqual('bytes=100-599', self.alyx.last_headers['Range'])
+
+    def test_parallel_ranges(self):
+        """Test downloading large files as several byte ranges concurrently"""
+        data = os.urandom(10000)
+        file = Path(self.tempdir.name, 'obj.attr.bin')
+        url = self.alyx.url + '/lab/Subjects/subj/2020-01-01/001/alf/' + file.name
+        self.alyx.files[urllib.parse.urlsplit(url).path] = data
+        self.ac.parallel_download_size = 1000
+        download = partial(self.ac.download_file, url, cache_dir=self.tempdir.name, clobber=True,
+                           file_size=len(data), hash=hashlib.md5(data).hexdigest())
+        self.alyx.delay = 0.05
+        self.assertEqual(str(file), download())
+        self.assertEqual(data, file.read_bytes())
+        self.assertEqual(4, len(self.alyx.requests))
+        self.assertEqual(4, self.alyx.max_active)
+        self.assertFalse(any(Path(self.tempdir.name).glob('*.part*')))
+        self.alyx.delay = 0.
+        # Files smaller than the minimum size, or of unknown size, should be downloaded whole
+        for kwargs in ({'parallel_size': len(data) + 1}, {'file_size': None}):
+            self.alyx.requests.clear()
+            self.assertEqual(str(file), download(**kwargs))
+            self.assertEqual(1, len(self.alyx.requests))
+            self.assertNotIn('Range', self.alyx.last_headers)
+        with mock.patch('one.webclient.DOWNLOAD_CHUNK_SIZE', 500):
+            # An interrupted range should be resumed by the next attempt
+            self.alyx.drops = [1200]
+            self.assertRaises(requests.exceptions.RequestException, download, retries=0)
+            journal = json.loads(Path(f'{file}.part.json').read_text())
+            self.assertEqual(8500, journal['offset'])  # 1500 bytes of one range remain
+            self.alyx.requests.clear()
+            self.assertEqual(str(file), download())
+            self.assertEqual(data, file.read_bytes())
+            self.assertEqual(1, len(self.alyx.requests))
+            self.assertRegex(self.alyx.last_headers['Range'], r'bytes=\d+00-\d+99')
+        # If the server ignores the Range header the file should be downloaded as one stream
+        self.alyx.ranges = False
+        self.alyx.requests.clear()
+        with self.assertLogs('one.webclient', logging.WARNING):
+            self.assertEqual(str(file), download())
+        self.assertEqual(data, file.read_bytes())
+        self.assertEqual(5, len(self.alyx.requests))
+
+
+class TestIterJson(unittest.TestCase):
+    def test_iter_json(self):
+        """Test for one.webclient._iter_json function"""
+        records = [{'id': i, 'x': 1.5e-10 * i, 'name': 'caf\u00e9 "bar"', 'l': [None, True]}
+                   for i in range(20)]
+        text = json.dumps({'count': 20, 'results': records, 'next': None}, indent=1)
+        for size in (1, 7, len(text)):
+            chunks = (text[i:i + size] for i in range(0, len(text), size))
+            members = {}
+            self.assertEqual(records, list(wc._iter_json(chunks, 'results', members)))
+            self.assertEqual({'count': 20, 'next': None}, members)
+        # Check arrays and numbers split between chunks
+        self.assertEqual([1234, 56], list(wc._iter_json(['[12', '34, 5', '6 ]'])))
+        self.assertEqual([], list(wc._iter_json(['{"results": []}'])))
+        with self.assertRaises(json.JSONDecodeError):
+            list(wc._iter_json(['{"results": [1, 2']))
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False, verbosity=2)
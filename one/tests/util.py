@@ -3,13 +3,27 @@ import tempfile
 from pathlib import Path
 import shutil
 import json
+import re
+import sys
+import gzip
+import hashlib
+import email.utils
+import io
+import http.server
+import threading
+import time
+import urllib.parse
+import zipfile
+from datetime import datetime, timezone
 from uuid import uuid4
 
 import pandas as pd
 import numpy as np
-from iblutil.io.parquet import uuid2np, np2str
+from iblutil.io import parquet, params as iopar
+from iblutil.io.parquet import uuid2np, np2str, str2np
 
 import one.params
+from one.util import ensure_list
 
 
 def set_up_env(use_temp_cache=True) -> tempfile.TemporaryDirectory:
@@ -221,3 +235,366 @@ def caches_int2str(caches):
             cache[name] = np2str(cache[int_cols[i:i + 2]])
         cache[int_cols] = np.nan
         caches[table] = cache.set_index('id')
+
+
+class _StandInServer(http.server.ThreadingHTTPServer):
+    """A threading HTTP server that ignores connections dropped by either end"""
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):  # e.g. reset or broken pipe
+            super().handle_error(request, client_address)
+
+
+class AlyxStandIn:
+    """A minimal local stand-in for an Alyx server, for testing ONE without an internet connection.
+
+    The server runs in a background thread and supports token authentication, the cache info
+    endpoint, the download of full and delta cache tables and a paginated sessions list endpoint.
+    JSON responses have ETag and Last-Modified headers and conditional requests are supported.
+    A snapshot of the tables is kept each time they are updated so that deltas may be computed
+    from any previous snapshot date.  Connections are kept alive between requests.
+
+    Examples
+    --------
+    >>> with AlyxStandIn(tempdir) as alyx:
+    ...     alyx.setup_params(cache_dir)
+    ...     one = OneAlyx(base_url=alyx.url, username=alyx.user, silent=True)
+    ...     alyx.update(sessions=new_sessions)
+    """
+    user = 'test_user'
+    token = 'T0k3N'
+
+    def __init__(self, tables_dir):
+        """
+        Parameters
+        ----------
+        tables_dir : str, pathlib.Path
+            A directory containing the initial sessions and datasets parquet tables.
+        """
+        self.tables = {}
+        for table in ('sessions', 'datasets'):
+            self.tables[table], metadata = parquet.load(Path(tables_dir, f'{table}.pqt'))
+        self.date_created = metadata['date_created']
+        self.snapshots = {self._date(self.date_created): dict(self.tables)}
+        self.delta = True  # If false, the delta endpoint returns 404
+        self.requests = []  # A list of (method, path) tuples of requests received
+        self.last_headers = None  # The headers of the last GET request received
+        self.connections = 0  # The number of client connections accepted
+        self.errors = []  # Status codes to respond with to the next GET requests
+        self.page_size = 100  # The default number of paginated results per response
+        self.delay = 0.  # The time in seconds to wait before responding to GET requests
+        self.active = 0  # The number of GET requests currently being handled
+        self.max_active = 0  # The maximum number of GET requests handled concurrently
+        self.validators = ('ETag', 'Last-Modified')  # The validators sent with JSON responses
+        self.gzip = False  # If true, JSON responses are gzip encoded when the client accepts it
+        self.files = {}  # A map of URL paths to the contents of the files served, e.g. '/a/b.npy'
+        self.ranges = True  # If false, the Range headers of file requests are ignored
+        self.drops = []  # Numbers of bytes after which to drop the connection of the next files
+        self.bandwidth = None  # The maximum number of bytes per second sent per file response
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _date(date_str) -> datetime:
+        return datetime.fromisoformat(date_str).replace(second=0, microsecond=0)
+
+    @property
+    def url(self) -> str:
+        """str: The base URL of the server"""
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def update(self, sessions=None, datasets=None, date_created=None):
+        """
+        Update the cache tables served.
+
+        Parameters
+        ----------
+        sessions : pandas.DataFrame
+            The new sessions table, or None to keep the current one
+        datasets : pandas.DataFrame
+            The new datasets table, or None to keep the current one
+        date_created : str
+            The ISO date of the new tables.  Defaults to the current time.
+        """
+        self.tables.update({k: v for k, v in (('sessions', sessions), ('datasets', datasets))
+                            if v is not None})
+        date_created = date_created or datetime.now().isoformat(sep=' ', timespec='minutes')
+        self.date_created = date_created
+        self.snapshots[self._date(date_created)] = dict(self.tables)
+
+    def setup_params(self, cache_dir):
+        """
+        Save the ONE parameters for this server, including an auth token.
+
+        Parameters
+        ----------
+        cache_dir : str, pathlib.Path
+            The cache directory to associate with the server URL
+        """
+        pars = one.params.default().set('ALYX_URL', self.url).set('ALYX_LOGIN', self.user)
+        pars = pars.set('HTTP_DATA_SERVER', self.url)
+        pars = pars.set('TOKEN', {self.user: {'token': self.token}})
+        one.params.save(pars, self.url)
+        map_id = f'{one.params._PAR_ID_STR}/{one.params._CLIENT_ID_STR}'
+        cache_map = iopar.read(map_id, {'CLIENT_MAP': dict()})
+        cache_map.CLIENT_MAP[one.params._key_from_url(self.url)] = str(cache_dir)
+        if 'DEFAULT' not in cache_map.as_dict():
+            cache_map = cache_map.set('DEFAULT', one.params._key_from_url(self.url))
+        iopar.write(map_id, cache_map)
+
+    def _zip_tables(self, tables, metadata) -> bytes:
+        """Return a zip archive of parquet tables, each with their own metadata"""
+        buffer = io.BytesIO()
+        with tempfile.TemporaryDirectory() as tmp, zipfile.ZipFile(buffer, 'w') as zipped:
+            for name, table in tables.items():
+                filename = Path(tmp, f'{name}.pqt')
+                parquet.save(filename, table, metadata[name])
+                zipped.write(filename, filename.name)
+        return buffer.getvalue()
+
+    def _session_records(self) -> list:
+        """Return the sessions table as a list of REST session records"""
+        sessions = self.tables['sessions']
+        eids = np2str(np.array(sessions.index.tolist(), dtype=np.int64))
+        return [{
+            'id': eid, 'url': f'{self.url}/sessions/{eid}', 'subject': rec['subject'],
+            'lab': rec['lab'],
+            'start_time': str(rec['date']), 'number': int(rec['number']),
+            'task_protocol': rec['task_protocol'], 'projects': [rec['project']]
+        } for eid, (_, rec) in zip(eids, sessions.iterrows())]
+
+    def _dataset_records(self) -> list:
+        """Return the datasets table as a list of REST dataset records"""
+        datasets = self.tables['datasets']
+        ids = np2str(np.array(datasets.index.tolist(), dtype=np.int64).reshape(-1, 2))
+        eids = np2str(datasets[['eid_0', 'eid_1']].values.astype(np.int64).reshape(-1, 2))
+        return [{
+            'url': f'{self.url}/datasets/{dataset_id}', 'name': Path(rec['rel_path']).name,
+            'dataset_type': '.'.join(Path(rec['rel_path']).name.split('.')[:2]),
+            'session': f'{self.url}/sessions/{eid}',
+            'file_size': None if pd.isna(rec['file_size']) else rec['file_size'],
+            'hash': rec['hash'], 'default_dataset': True,
+            'file_records': [{
+                'data_url': f'{self.url}/{rec["session_path"]}/{rec["rel_path"]}', 'exists': True
+            }]
+        } for dataset_id, eid, (_, rec) in zip(ensure_list(ids), ensure_list(eids),
+                                               datasets.iterrows())]
+
+    def _records(self, endpoint) -> list:
+        """Return the REST list records of an endpoint"""
+        return self._session_records() if endpoint == 'sessions' else self._dataset_records()
+
+    @staticmethod
+    def _filter(records, django=None) -> list:
+        """Filter REST records by a django query; only ID and session filters are supported"""
+        for field, value in re.findall(r'(\w+),(\[[^]]*]|[^,]*)', django or ''):
+            if field not in ('id', 'pk', 'id__in', 'pk__in', 'session', 'session__in'):
+                raise NotImplementedError(f'django filter "{field}" not supported')
+            ids = set(value.strip('[]').split(',')) if field.endswith('__in') else {value}
+            if field.startswith('session'):
+                records = [r for r in records if r['session'].split('/')[-1] in ids]
+            else:
+                records = [r for r in records if (r.get('id') or r['url'].split('/')[-1]) in ids]
+        return records
+
+    def _session_details(self, eid) -> dict:
+        """Return the REST session details record of a session, including its datasets"""
+        record = next((x for x in self._session_records() if x['id'] == eid), None)
+        if record is None:
+            return
+        datasets = self.tables['datasets']
+        id_0, id_1 = str2np(eid).flatten()
+        datasets = datasets[(datasets['eid_0'] == id_0) & (datasets['eid_1'] == id_1)]
+        ids = np2str(np.array(datasets.index.tolist(), dtype=np.int64).reshape(-1, 2))
+        record['data_dataset_session_related'] = [{
+            'id': dataset_id, 'name': Path(rec['rel_path']).name,
+            'file_size': None if pd.isna(rec['file_size']) else rec['file_size'],
+            'hash': rec['hash'], 'data_url': f'{self.url}/{rec["session_path"]}/{rec["rel_path"]}'
+        } for dataset_id, (_, rec) in zip(ensure_list(ids), datasets.iterrows())]
+        return record
+
+    def _validators(self, body) -> dict:
+        """Return the ETag and Last-Modified headers of a JSON response"""
+        last_modified = datetime.fromisoformat(self.date_created).replace(tzinfo=timezone.utc)
+        validators = {
+            'ETag': '"' + hashlib.md5(body).hexdigest() + '"',
+            'Last-Modified': email.utils.format_datetime(last_modified, usegmt=True)
+        }
+        return {k: v for k, v in validators.items() if k in self.validators}
+
+    @staticmethod
+    def _not_modified(headers, validators) -> bool:
+        """Return true if the conditional request headers match the response validators"""
+        if 'If-None-Match' in headers:
+            return headers['If-None-Match'] == validators.get('ETag')
+        if 'If-Modified-Since' in headers and 'Last-Modified' in validators:
+            since = email.utils.parsedate_to_datetime(headers['If-Modified-Since'])
+            return email.utils.parsedate_to_datetime(validators['Last-Modified']) <= since
+        return False
+
+    def _delta(self, since):
+        """Return the rows inserted or updated since a given date, and the deleted row IDs"""
+        old_tables = self.snapshots.get(self._date(since))
+        if old_tables is None:
+            return None
+        tables, metadata = {}, {}
+        for name, new in self.tables.items():
+            old = old_tables[name][new.columns]
+            old_rows = pd.util.hash_pandas_object(old, index=True)
+            tables[name] = new[~pd.util.hash_pandas_object(new, index=True).isin(old_rows)]
+            deleted = old.index[~old.index.isin(new.index)].tolist()
+            if isinstance(old.index, pd.MultiIndex):
+                deleted = [np2str(np.array(x, dtype=np.int64)) for x in deleted]
+            metadata[name] = {
+                'date_created': self.date_created, 'origin': 'alyx', 'since': since,
+                'deleted': deleted
+            }
+        return self._zip_tables(tables, metadata)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep connections alive
+            wbufsize = -1  # Send each response in one write, flushed after each request
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                server.connections += 1
+                super().setup()
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body, content_type='application/json', status=200):
+                validators = {}
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                    if status == 200 and self.command == 'GET':
+                        validators = server._validators(body)
+                        if server._not_modified(self.headers, validators):
+                            status, body = 304, b''
+                accepted = self.headers.get('Accept-Encoding', '')
+                if server.gzip and body and 'gzip' in accepted and content_type.endswith('json'):
+                    body = gzip.compress(body)
+                    validators['Content-Encoding'] = 'gzip'
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for header, value in validators.items():
+                    self.send_header(header, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_file(self, data):
+                """Send a file, or the byte range requested"""
+                etag = '"' + hashlib.md5(data).hexdigest() + '"'
+                status, start, stop = 200, 0, len(data)
+                match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+                if match and server.ranges and self.headers.get('If-Range', etag) == etag:
+                    start, stop = int(match[1]), min(int(match[2] or len(data)) + 1, len(data))
+                    if start >= len(data):
+                        return self._send({'detail': 'Range not satisfiable.'}, status=416)
+                    status = 206
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(stop - start))
+                self.send_header('ETag', etag)
+                if status == 206:
+                    self.send_header('Content-Range', f'bytes {start}-{stop - 1}/{len(data)}')
+                self.end_headers()
+                if server.drops:  # Send some bytes before closing the connection
+                    stop = min(stop, start + server.drops.pop(0))
+                    self.close_connection = True
+                chunk_size = 2 ** 16 if server.bandwidth else max(stop - start, 1)
+                for i in range(start, stop, chunk_size):
+                    self.wfile.write(data[i:min(i + chunk_size, stop)])
+                    if server.bandwidth:
+                        self.wfile.flush()
+                        time.sleep(chunk_size / server.bandwidth)
+
+            def do_POST(self):
+                server.requests.append(('POST', self.path))
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path.rstrip('/') == '/auth-token':
+                    return self._send({'token': server.token})
+                self._send({'detail': 'Not found.'}, status=404)
+
+            def do_GET(self):
+                with server._lock:
+                    server.active += 1
+                    server.max_active = max(server.active, server.max_active)
+                try:
+                    time.sleep(server.delay)
+                    self._get()
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+            def _get(self):
+                server.requests.append(('GET', self.path))
+                server.last_headers = dict(self.headers)
+                url = urllib.parse.urlsplit(self.path)
+                path = url.path.rstrip('/')
+                if urllib.parse.unquote(path) in server.files:  # The file server needs no token
+                    return self._send_file(server.files[urllib.parse.unquote(path)])
+                if self.headers.get('Authorization') != f'Token {server.token}':
+                    return self._send({'detail': 'Invalid token.'}, status=401)
+                if server.errors:
+                    return self._send({'detail': 'Error.'}, status=server.errors.pop(0))
+                if path == '/cache/info':
+                    return self._send({'date_created': server.date_created, 'origin': 'alyx'})
+                if path == '/cache.zip':
+                    metadata = {'date_created': server.date_created, 'origin': 'alyx'}
+                    metadata = dict.fromkeys(server.tables, metadata)
+                    body = server._zip_tables(server.tables, metadata)
+                    return self._send(body, 'application/zip')
+                if path == '/cache/delta.zip' and server.delta:
+                    since, = urllib.parse.parse_qs(url.query).get('since', [None])
+                    body = server._delta(since) if since else None
+                    if body is not None:
+                        return self._send(body, 'application/zip')
+                if path == '/docs':
+                    actions = ('list', '/{endpoint}'), ('read', '/{endpoint}/{{id}}')
+                    return self._send({endpoint: {
+                        action: {'action': 'get', 'url': url.format(endpoint=endpoint)}
+                        for action, url in actions} for endpoint in ('sessions', 'datasets')})
+                endpoint, *record_id = path.strip('/').split('/')
+                if endpoint in ('sessions', 'datasets') and not record_id:
+                    query = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+                    limit = int(query.get('limit', server.page_size))
+                    offset = int(query.get('offset', 0))
+                    records = server._filter(server._records(endpoint), query.get('django'))
+                    query.update(limit=limit, offset=offset + limit)
+                    more = offset + limit < len(records)
+                    return self._send({
+                        'count': len(records),
+                        'next': f'{server.url}/{endpoint}?{urllib.parse.urlencode(query)}'
+                        if more else None,
+                        'previous': None,
+                        'results': records[offset:offset + limit]
+                    })
+                if endpoint == 'sessions' and len(record_id) == 1:
+                    record = server._session_details(record_id[0])
+                    if record is not None:
+                        return self._send(record)
+                if endpoint == 'datasets' and len(record_id) == 1:
+                    records = server._filter(server._records(endpoint), f'pk,{record_id[0]}')
+                    if records:
+                        return self._send(records[0])
+                self._send({'detail': 'Not found.'}, status=404)
+
+        return Handler
+
+    def __enter__(self):
+        self._server = _StandInServer(('127.0.0.1', 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
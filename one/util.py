@@ -1,6 +1,8 @@
 """Decorators and small standalone functions for api module"""
 import logging
+import re
 import urllib.parse
+import weakref
 from functools import wraps
 from typing import Sequence, Union, Iterable, Optional, List
 from collections.abc import Mapping
@@ -11,18 +13,56 @@ from iblutil.io import parquet
 import numpy as np
 
 import one.alf.exceptions as alferr
-from one.alf.files import rel_path_parts, get_session_path
-from one.alf.spec import FILE_SPEC, regex as alf_regex
+from one.alf.files import filename_parts, get_session_path
+from one.alf.spec import FILE_SPEC, REL_PATH_SPEC, regex as alf_regex
 import one.alf.io as alfio
+from one.caching import _hashable, _memo_tables, _copy
 
 logger = logging.getLogger(__name__)
 
+ALF_PARTS = ('collection', 'revision', 'namespace', 'object',
+             'attribute', 'timescale', 'extra', 'extension')
+"""tuple: The relative path parts of a dataset, in the order returned by rel_path_parts"""
+
+_FILE_PARTS = ALF_PARTS[2:]
+_parsed_parts = {}  # Map of id(rel_path categories) -> (weak ref to categories, parts table)
+
 
 def Listable(t):
     """Return a typing.Union if the input and sequence of input"""
     return Union[t, Sequence[t]]
 
 
+def _records2frame(records) -> pd.DataFrame:
+    """Build a DataFrame column by column from an iterable of flat record dicts.
+
+    Unlike pandas.DataFrame(list(records)), the records are not all held in memory at once, so
+    they may be consumed directly from a generator, e.g. one.webclient.AlyxClient.stream.
+
+    Parameters
+    ----------
+    records : iterable of dict
+        The records, one per row.  Missing keys are filled with NaN.
+
+    Returns
+    -------
+    pd.DataFrame
+        A frame with a column for each record key, in the order in which they first appear
+    """
+    columns = {}
+    n_rows = 0
+    for rec in records:
+        for key, value in rec.items():
+            if key not in columns:
+                columns[key] = [np.nan] * n_rows
+            columns[key].append(value)
+        n_rows += 1
+        for column in columns.values():
+            if len(column) < n_rows:
+                column.append(np.nan)
+    return pd.DataFrame(columns)
+
+
 def ses2records(ses: dict) -> [pd.Series, pd.DataFrame]:
     """Extract session cache record and datasets cache from a remote session data record.
 
@@ -31,7 +71,8 @@ def ses2records(ses: dict) -> [pd.Series, pd.DataFrame]:
     Parameters
     ----------
     ses : dict
-        Session dictionary from Alyx REST endpoint
+        Session dictionary from Alyx REST endpoint.  The 'data_dataset_session_related' value
+        may be a generator, e.g. from one.webclient.AlyxClient.stream.
 
     Returns
     -------
@@ -40,22 +81,10 @@ def ses2records(ses: dict) -> [pd.Series, pd.DataFrame]:
     pd.DataFrame
         Datasets frame
     """
-    # Extract session record
-    eid = parquet.str2np(ses['url'][-36:])
-    session_keys = ('subject', 'start_time', 'lab', 'number', 'task_protocol', 'project')
-    session_data = {k: v for k, v in ses.items() if k in session_keys}
-    # session_data['id_0'], session_data['id_1'] = eid.flatten().tolist()
-    session = (
-        (pd.Series(data=session_data, name=tuple(eid.flatten()))
-            .rename({'start_time': 'date'}, axis=1))
-    )
-    session['date'] = session['date'][:10]
-
     # Extract datasets table
     def _to_record(d):
         rec = dict(file_size=d['file_size'], hash=d['hash'], exists=True)
         rec['id_0'], rec['id_1'] = parquet.str2np(d['id']).flatten().tolist()
-        rec['eid_0'], rec['eid_1'] = session.name
         file_path = urllib.parse.urlsplit(d['data_url'], allow_fragments=False).path.strip('/')
         file_path = alfio.remove_uuid_file(file_path, dry=True).as_posix()
         rec['session_path'] = get_session_path(file_path).as_posix()
@@ -64,8 +93,25 @@ def ses2records(ses: dict) -> [pd.Series, pd.DataFrame]:
             rec['default_revision'] = d['default_revision'] == 'True'
         return rec
 
-    records = map(_to_record, ses['data_dataset_session_related'])
-    datasets = pd.DataFrame(records).set_index(['id_0', 'id_1']).sort_index()
+    # The datasets are read first as the other session fields of a streamed response are only
+    # available once the datasets have been decoded
+    datasets = _records2frame(map(_to_record, ses['data_dataset_session_related']))
+
+    # Extract session record
+    eid = parquet.str2np(ses['url'][-36:])
+    session_keys = ('subject', 'start_time', 'lab', 'number', 'task_protocol', 'project')
+    session_data = {k: v for k, v in ses.items() if k in session_keys}
+    # session_data['id_0'], session_data['id_1'] = eid.flatten().tolist()
+    session = (
+        (pd.Series(data=session_data, name=tuple(eid.flatten()))
+            .rename({'start_time': 'date'}))
+    )
+    session['date'] = session['date'][:10]
+
+    loc = datasets.columns.get_loc('session_path')
+    for i, (name, value) in enumerate(zip(('eid_0', 'eid_1'), session.name)):
+        datasets.insert(loc + i, name, value)
+    datasets = datasets.set_index(['id_0', 'id_1']).sort_index()
     return session, datasets
 
 
@@ -74,8 +120,9 @@ def datasets2records(datasets) -> pd.DataFrame:
 
     Parameters
     ----------
-    datasets : dict, list
-        One or more records from the Alyx 'datasets' endpoint
+    datasets : dict, iterable
+        One or more records from the Alyx 'datasets' endpoint, e.g. a list, a paginated response
+        or the records generator of a streamed response (see one.webclient.AlyxClient.stream)
 
     Returns
     -------
@@ -86,13 +133,16 @@ def datasets2records(datasets) -> pd.DataFrame:
     --------
     >>> datasets = ONE().alyx.rest('datasets', 'list', subject='foobar')
     >>> df = datasets2records(datasets)
-    """
-    records = []
 
-    for d in ensure_list(datasets):
+    Build the frame as the records are received
+
+    >>> datasets = ONE().alyx.stream('/datasets?subject=foobar')
+    >>> df = datasets2records(datasets['results'])
+    """
+    def _to_record(d):
         file_record = next((x for x in d['file_records'] if x['data_url'] and x['exists']), None)
         if not file_record:
-            continue  # Ignore files that are not accessible
+            return  # Ignore files that are not accessible
         rec = dict(file_size=d['file_size'], hash=d['hash'], exists=True)
         rec['id_0'], rec['id_1'] = parquet.str2np(d['url'][-36:]).flatten().tolist()
         rec['eid_0'], rec['eid_1'] = parquet.str2np(d['session'][-36:]).flatten().tolist()
@@ -102,13 +152,15 @@ def datasets2records(datasets) -> pd.DataFrame:
         rec['session_path'] = get_session_path(file_path).as_posix()
         rec['rel_path'] = file_path[len(rec['session_path']):].strip('/')
         rec['default_revision'] = d['default_dataset']
-        records.append(rec)
+        return rec
 
-    if not records:
+    records = filter(None, map(_to_record, ensure_list(datasets)))
+    datasets = _records2frame(records)
+    if datasets.empty:
         keys = ('id_0', 'id_1', 'eid_0', 'eid_1', 'file_size', 'hash', 'session_path',
                 'rel_path', 'default_revision')
         return pd.DataFrame(columns=keys).set_index(['id_0', 'id_1'])
-    return pd.DataFrame(records).set_index(['id_0', 'id_1']).sort_index()
+    return datasets.set_index(['id_0', 'id_1']).sort_index()
 
 
 def parse_id(method):
@@ -157,6 +209,49 @@ def refresh(method):
     return wrapper
 
 
+def memoize(method):
+    """
+    Memoize the results of a One method in the instance's LRU memo.
+
+    The results are keyed on the method name and arguments, the wildcards flag and the cache
+    table timestamps, so that they are invalidated when the cache is reloaded.  Calls with
+    unhashable arguments, remote queries and explained queries are not memoized.  A copy of the
+    result is returned so that callers may modify it.
+
+    Parameters
+    ----------
+    method : function
+        An ONE method that depends only on its arguments and the cache tables
+
+    Returns
+    -------
+    function
+        A wrapper function that returns memoized results
+    """
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        memo = getattr(self, 'memo', None)
+        remote = (kwargs.get('query_type') or self.mode) == 'remote'
+        if memo is None or not memo.max_bytes or remote or kwargs.get('explain'):
+            return method(self, *args, **kwargs)
+        meta = self._cache['_meta']
+        try:
+            key = (method.__name__, self.wildcards, _hashable(args), _hashable(kwargs),
+                   meta['loaded_time'], _hashable(meta['raw']))
+            hash(key)
+        except TypeError:
+            return method(self, *args, **kwargs)
+        hit, value = memo.get(key, _memo_tables(self._cache))
+        if not hit:
+            generation = memo.generation
+            value = method(self, *args, **kwargs)
+            memo.put(key, value, _memo_tables(self._cache), generation)
+        return _copy(value)
+
+    return wrapper
+
+
 def validate_date_range(date_range) -> (pd.Timestamp, pd.Timestamp):
     """
     Validates and arrange date range in a 2 elements list
@@ -277,6 +372,164 @@ def _file_spec(**kwargs):
     return filespec
 
 
+def _parse_rel_paths(rel_paths) -> pd.DataFrame:
+    """
+    Parse an array of relative dataset paths into a table of categorical ALF parts.
+
+    Absent optional parts are empty strings and all parts of an invalid ALF path are null.
+
+    Parameters
+    ----------
+    rel_paths : numpy.array, pandas.Index
+        An array of unique relative dataset paths
+
+    Returns
+    -------
+    pandas.DataFrame
+        A table of categorical ALF parts, one row per path and one column per part in ALF_PARTS
+    """
+    pattern = '^' + alf_regex(REL_PATH_SPEC).pattern
+    parsed = pd.Series(np.asarray(rel_paths, dtype=object), dtype=object).str.extract(pattern)
+    valid = parsed['object'].notna()
+    parsed.loc[valid] = parsed.loc[valid].fillna('')
+    return pd.DataFrame({
+        part: pd.Categorical(parsed[part], categories=sorted({''}.union(parsed[part].dropna())))
+        for part in ALF_PARTS
+    })
+
+
+def _cache_parsed_parts(categories, parts) -> pd.DataFrame:
+    """Keep the parsed ALF parts of some rel_path categories for as long as the categories exist"""
+    key = id(categories)
+    ref = weakref.ref(categories, lambda _: _parsed_parts.pop(key, None))
+    _parsed_parts[key] = (ref, parts)
+    return parts
+
+
+def _set_dataset_parts(rel_path, parts) -> bool:
+    """
+    Store the known ALF parts of a categorical rel_path series so that dataset_parts needn't
+    parse them, e.g. the parts saved with an Arrow cache table.
+
+    Parameters
+    ----------
+    rel_path : pandas.Series
+        A categorical series of relative dataset paths.
+    parts : pandas.DataFrame
+        The categorical ALF parts of each row of `rel_path`, as returned by dataset_parts.
+
+    Returns
+    -------
+    bool
+        False if the parts of some categories are unknown, in which case they are parsed upon
+        the first call to dataset_parts.
+    """
+    categories = rel_path.cat.categories
+    codes = rel_path.cat.codes.values
+    rows = np.full(len(categories), -1)
+    valid, = np.nonzero(codes >= 0)
+    rows[codes[valid]] = valid  # The position of a row of each category
+    if (rows < 0).any():
+        return False
+    _cache_parsed_parts(categories, parts[list(ALF_PARTS)].iloc[rows].reset_index(drop=True))
+    return True
+
+
+def dataset_parts(datasets) -> pd.DataFrame:
+    """
+    Return the ALF parts of each dataset relative path.
+
+    Each unique relative path is parsed only once.  When the 'rel_path' column is categorical (as
+    it is in the loaded cache tables), the parsed categories are kept for as long as the column
+    categories exist, so that calls on the same table, or any slice of it, only map the codes.
+
+    Parameters
+    ----------
+    datasets : pandas.DataFrame, pandas.Series
+        A datasets cache table or a series of relative dataset paths
+
+    Returns
+    -------
+    pandas.DataFrame
+        A table of categorical ALF parts with the same index as the input, with the columns
+        ('collection', 'revision', 'namespace', 'object', 'attribute', 'timescale', 'extra',
+        'extension').  Absent optional parts are empty strings; all parts of invalid ALF paths
+        are null.
+
+    Examples
+    --------
+    >>> collections = dataset_parts(one._cache['datasets'])['collection'].unique()
+    """
+    rel_path = datasets['rel_path'] if isinstance(datasets, pd.DataFrame) else datasets
+    if isinstance(rel_path.dtype, pd.CategoricalDtype):
+        categories = rel_path.cat.categories
+        key = id(categories)
+        ref, parts = _parsed_parts.get(key, (None, None))
+        if ref is None or ref() is not categories:
+            parts = _cache_parsed_parts(categories, _parse_rel_paths(categories))
+        codes = rel_path.cat.codes.values
+    else:
+        codes, uniques = pd.factorize(rel_path.values)
+        parts = _parse_rel_paths(uniques)
+
+    def _take(part):
+        part_codes = np.append(part.cat.codes.values, -1)  # Null paths (code -1) map to null
+        return pd.Categorical.from_codes(part_codes[codes], dtype=part.dtype)
+    return pd.DataFrame({k: _take(parts[k]) for k in ALF_PARTS}, index=rel_path.index)
+
+
+def _to_regex(value, wildcards=False) -> List[str]:
+    """Return a list of regular expressions from a pattern or list of patterns"""
+    return [fnmatch.translate(x) if wildcards else x for x in ensure_list(value)]
+
+
+def _match_part(part, patterns) -> np.ndarray:
+    """
+    Return a boolean array of the values of a categorical ALF part that fully match any of the
+    given regular expressions.  Each category is matched only once and null values never match.
+    """
+    pattern = re.compile('|'.join(f'(?:{x})' for x in patterns))
+    hits = [pattern.fullmatch(x) is not None for x in part.cat.categories]
+    return np.array(hits + [False], dtype=bool)[part.cat.codes.values]
+
+
+def _filename_filters(filename, wildcards=False) -> Optional[List[dict]]:
+    """
+    Decompose a filename filter into ALF file part regular expressions.
+
+    Parameters
+    ----------
+    filename : str, list, dict
+        A filename, list of filenames or dict of ALF file parts
+    wildcards : bool
+        If true, filename patterns are unix shell style patterns instead of regular expressions
+
+    Returns
+    -------
+    list of dict, None
+        A list of filters, one per filename, mapping ALF file parts to regular expressions.  None
+        is returned if any filename is a pattern that can't be matched part by part.
+    """
+    if isinstance(filename, dict):
+        if not set(filename.keys()) <= set(_FILE_PARTS):
+            return None
+        return [{k: _to_regex(v, wildcards) for k, v in filename.items() if v is not None}]
+    filters = []
+    for name in ensure_list(filename):
+        # Only filenames without any wildcard or regex special characters (except '.') are
+        # decomposed, otherwise a pattern may match across parts
+        if wildcards:
+            literal = not any(x in name for x in '*?[]')
+        else:
+            literal = re.fullmatch(r'[\w.-]+', name) is not None
+        parts = filename_parts(name, as_dict=True, assert_valid=False) if literal else {}
+        if not parts.get('object'):
+            return None
+        escape = re.escape if wildcards else str
+        filters.append({k: [escape(v or '')] for k, v in parts.items()})
+    return filters
+
+
 def filter_datasets(all_datasets, filename=None, collection=None, revision=None,
                     revision_last_before=True, assert_unique=True, wildcards=False):
     """
@@ -330,6 +583,7 @@ def filter_datasets(all_datasets, filename=None, collection=None, revision=None,
     """
     # Create a regular expression string to match relative path against
     filename = filename or {}
+    filename_filters = _filename_filters(filename, wildcards)
     regex_args = {'collection': collection}
     spec_str = _collection_spec(collection, None if revision_last_before else revision)
 
@@ -356,13 +610,34 @@ def filter_datasets(all_datasets, filename=None, collection=None, revision=None,
 
     # Build regex string
     pattern = alf_regex('^' + spec_str, **regex_args)
-    match = all_datasets[all_datasets['rel_path'].str.match(pattern)]
+    if filename_filters is None:  # Match the full relative path against the regex
+        matches = all_datasets['rel_path'].str.match(pattern).fillna(False).values.astype(bool)
+    else:  # Match the parsed ALF parts, falling back to the regex for invalid ALF paths
+        parts = dataset_parts(all_datasets)
+        matches = parts['object'].notna().values
+        invalid = np.flatnonzero(~matches)
+        part_filters = {'collection': collection}
+        if not revision_last_before:
+            part_filters['revision'] = revision
+        for k, v in part_filters.items():
+            if v is not None:
+                matches &= _match_part(parts[k], _to_regex(v, wildcards))
+        if any(filename_filters):
+            matches &= np.logical_or.reduce([
+                np.logical_and.reduce([_match_part(parts[k], v) for k, v in f.items()])
+                for f in filename_filters
+            ])
+        if invalid.size > 0:
+            invalid_paths = all_datasets['rel_path'].iloc[invalid]
+            matches[invalid] = invalid_paths.str.match(pattern).fillna(False).values
+    match = all_datasets[matches]
     if len(match) == 0 or not (revision_last_before or assert_unique):
         return match
 
-    revisions = [rel_path_parts(x)[1] or '' for x in match.rel_path.values]
+    parts = dataset_parts(match)
+    revisions = parts['revision'].fillna('').tolist()
     if assert_unique:
-        collections = set(rel_path_parts(x)[0] or '' for x in match.rel_path.values)
+        collections = set(parts['collection'].fillna(''))
         if len(collections) > 1:
             _list = '"' + '", "'.join(collections) + '"'
             raise alferr.ALFMultipleCollectionsFound(_list)
@@ -424,7 +699,7 @@ def filter_revision_last_before(datasets, revision=None, assert_unique=True):
         return df.iloc[slice(0, 0) if idx is None else [idx], :]
 
     with pd.option_context('mode.chained_assignment', None):  # FIXME Explicitly copy?
-        datasets['revision'] = [rel_path_parts(x)[1] or '' for x in datasets.rel_path]
+        datasets['revision'] = dataset_parts(datasets)['revision'].fillna('').astype(str).values
     groups = datasets.rel_path.str.replace('#.*#/', '', regex=True).values
     grouped = datasets.groupby(groups, group_keys=False)
     return grouped.apply(_last_before)
@@ -460,6 +735,41 @@ def index_last_before(revisions: List[str], revision: Optional[str]) -> Optional
     return revisions.index(revisions_sorted[lt.argmax()]) if any(lt) else None
 
 
+def _verify_specifiers(specifiers, n_datasets) -> list:
+    """Ensure collection and revision specifier lists match the number of datasets"""
+    out = []
+    for spec in specifiers:
+        if not spec or isinstance(spec, str):
+            out.append([spec] * n_datasets)
+        elif len(spec) != n_datasets:
+            raise ValueError('Collection and revision specifiers must match number of datasets')
+        else:
+            out.append(spec)
+    return out
+
+
+def datasets_eids(datasets) -> np.ndarray:
+    """
+    Return the session ID string of each row of a datasets cache table.
+
+    Parameters
+    ----------
+    datasets : pandas.DataFrame
+        A datasets cache table with either 'eid' or 'eid_0' and 'eid_1' columns
+
+    Returns
+    -------
+    numpy.array
+        An array of experiment UUID strings, one per dataset
+    """
+    if 'eid' in datasets.columns:
+        return datasets['eid'].astype(str).values
+    if len(datasets) == 0:
+        return np.array([], dtype=object)
+    eids = ensure_list(parquet.np2str(datasets[['eid_0', 'eid_1']].values.astype(np.int64)))
+    return np.array(eids, dtype=object)
+
+
 def autocomplete(term, search_terms) -> str:
     """
     Validate search term and return complete name, e.g. autocomplete('subj') == 'subject'
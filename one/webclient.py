@@ -33,10 +33,14 @@ import logging
 import math
 import os
 import re
+import copy
+import codecs
+import time
+import zlib
 import functools
-import urllib.request
 from urllib.error import HTTPError
 import urllib.parse
+from collections import Counter
 from collections.abc import Mapping
 from typing import Optional
 from datetime import datetime, timedelta
@@ -45,25 +49,286 @@ import warnings
 import hashlib
 import zipfile
 import tempfile
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, Future
 from getpass import getpass
 from contextlib import contextmanager
 
 import requests
+import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from tqdm import tqdm
 
 from pprint import pprint
 import one.params
 from iblutil.io import hashfile
 from one.util import ensure_list
+from one.caching import sqlite_connect
+from one.alf.cache import merge_cache_tables
+import one.alf.exceptions as alferr
 
 _logger = logging.getLogger(__name__)
 
+POOL_SIZE = 16
+"""int: The default maximum number of connections kept alive to the Alyx and file servers"""
+
+N_RETRIES = 3
+"""int: The default number of times a failed connection or request is retried"""
+
+PREFETCH_PAGES = 4
+"""int: The default number of pages of a paginated REST response to request concurrently"""
+
+BATCH_SIZE = 100
+"""int: The default maximum number of values per list query of AlyxClient.list_in"""
+
+MAX_QUERY_LENGTH = 2000
+"""int: The maximum length of the URL-encoded django filter of a list query of list_in"""
+
+N_BATCH_THREADS = 4
+"""int: The default maximum number of list queries of AlyxClient.list_in made concurrently"""
+
+STREAM_CHUNK_SIZE = 2 ** 16
+"""int: The number of bytes read at a time from streamed REST responses"""
+
+DOWNLOAD_CHUNK_SIZE = 2 ** 22
+"""int: The number of bytes read at a time from downloaded files, between saving the progress"""
+
+PARALLEL_DOWNLOAD_SIZE = 2 ** 26
+"""int: The default minimum size in bytes of files downloaded in several byte ranges at once"""
+
+N_DOWNLOAD_RANGES = 4
+"""int: The default number of byte ranges of a large file downloaded concurrently"""
+
+REST_CACHE_FILE = 'responses.sqlite'
+"""str: The name of the REST response cache database file"""
+
+REST_CACHE_MAX_BYTES = 2 ** 28
+"""int: The default maximum total size of the compressed cached REST responses"""
+
+REST_CACHE_FLUSH_INTERVAL = 60
+"""float: The maximum time in seconds between saving the access times of cached responses"""
+
+REST_CACHE_FLUSH_SIZE = 256
+"""int: The maximum number of cached response access times held before saving them"""
+
+
+class RestCache:
+    """
+    A size-capped store of REST responses in a single SQLite database file.
+
+    Responses are stored as compressed JSON, keyed by URL, along with their expiry date, last
+    access time and the ETag and Last-Modified validators with which an expired response may be
+    revalidated.  When the total size exceeds the cap, expired and then least recently used
+    responses are evicted.  The database is opened for each operation in write-ahead logging
+    mode, so the store may be safely shared between threads and processes.
+
+    Reading a response doesn't write to the database: the access times are held in memory and
+    saved in batches, upon the next write, or once REST_CACHE_FLUSH_SIZE are held or
+    REST_CACHE_FLUSH_INTERVAL seconds have passed.
+
+    Responses cached as one JSON file per URL by previous versions are imported upon first
+    access.
+
+    Examples
+    --------
+    >>> cache = RestCache(one.params.get_rest_dir(alyx.base_url))
+    >>> cache.put('/sessions?subject=foo', response, datetime.now() + timedelta(days=1))
+    >>> response, expires, validators = cache.get('/sessions?subject=foo')
+    """
+    _schema = """
+        CREATE TABLE IF NOT EXISTS responses (
+            url TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            expires TEXT NOT NULL,
+            accessed REAL NOT NULL,
+            size INTEGER NOT NULL,
+            etag TEXT,
+            modified TEXT
+        );
+        CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+        CREATE TABLE IF NOT EXISTS stats (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            nbytes INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO stats VALUES (0, 0);
+        CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses
+            BEGIN UPDATE stats SET nbytes = nbytes + new.size; END;
+        CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses
+            BEGIN UPDATE stats SET nbytes = nbytes - old.size; END;
+    """
+
+    def __init__(self, rest_dir, max_bytes=REST_CACHE_MAX_BYTES):
+        """
+        Parameters
+        ----------
+        rest_dir : str, pathlib.Path
+            The REST cache directory of an Alyx database, see one.params.get_rest_dir
+        max_bytes : int
+            The maximum total size of the compressed responses
+        """
+        self.rest_dir = Path(rest_dir)
+        self.max_bytes = max_bytes
+        self._accessed = {}  # Map of URL to access time not yet saved
+        self._flushed = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        """pathlib.Path: The database file path"""
+        return self.rest_dir / REST_CACHE_FILE
+
+    def _connect(self):
+        return sqlite_connect(self.path, self._schema)
+
+    def _save_accessed(self, conn):
+        """Save the access times held in memory within a write transaction"""
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+            self._flushed = time.monotonic()
+        if accessed:
+            conn.executemany('UPDATE responses SET accessed = ? WHERE url = ?',
+                             [(t, url) for url, t in accessed.items()])
+
+    def flush(self):
+        """Save the access times of the responses read since last saved"""
+        if self._accessed and self.path.exists():
+            with self._connect() as conn:
+                self._save_accessed(conn)
+
+    def _legacy_file(self, url) -> Path:
+        return self.rest_dir / hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def get(self, url):
+        """
+        Return a cached response, its expiry date and validators.
+
+        Parameters
+        ----------
+        url : str
+            The REST query URL
+
+        Returns
+        -------
+        (any, datetime.datetime, dict), None
+            The response, the date it expires and a map of the response's 'ETag' and
+            'Last-Modified' headers, if any, or None if the URL is not in the cache
+        """
+        legacy_file = self._legacy_file(url)
+        if legacy_file.exists():  # Import response cached by a previous version
+            try:
+                with open(legacy_file, 'r') as f:
+                    response, when = json.load(f)
+                self.put(url, response, datetime.fromisoformat(when))
+            except (ValueError, OSError):
+                _logger.debug('failed to import cached response %s', legacy_file)
+            legacy_file.unlink()
+        if not self.path.exists():
+            return
+        with self._connect() as conn:
+            row = conn.execute('SELECT value, expires, etag, modified FROM responses '
+                               'WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return
+        with self._lock:
+            self._accessed[url] = time.time()
+            flush = (len(self._accessed) >= REST_CACHE_FLUSH_SIZE or
+                     time.monotonic() - self._flushed > REST_CACHE_FLUSH_INTERVAL)
+        if flush:
+            self.flush()
+        value, expires, *validators = row
+        validators = {k: v for k, v in zip(('ETag', 'Last-Modified'), validators) if v}
+        return json.loads(zlib.decompress(value)), datetime.fromisoformat(expires), validators
+
+    def put(self, url, response, expires, validators=None):
+        """
+        Cache a response, evicting old responses if the size cap is exceeded.
+
+        Parameters
+        ----------
+        url : str
+            The REST query URL
+        response : any
+            The JSON serializable response
+        expires : datetime.datetime
+            The date after which the response is out of date
+        validators : dict
+            The response's 'ETag' and 'Last-Modified' headers
+        """
+        validators = validators or {}
+        value = zlib.compress(json.dumps(response).encode('utf-8'))
+        if len(value) > self.max_bytes:
+            return
+        with self._connect() as conn:
+            self._save_accessed(conn)  # Evict based on the latest access times
+            conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+            conn.execute('INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (url, value, expires.isoformat(), time.time(), len(value),
+                          validators.get('ETag'), validators.get('Last-Modified')))
+            nbytes, = conn.execute('SELECT nbytes FROM stats').fetchone()
+            if nbytes > self.max_bytes:
+                # Evict expired, then least recently used responses
+                rows = conn.execute('SELECT url, size FROM responses '
+                                    'ORDER BY expires > ?, accessed',
+                                    (datetime.now().isoformat(),))
+                evict = []
+                for old_url, size in rows:
+                    evict.append((old_url,))
+                    nbytes -= size
+                    if nbytes <= self.max_bytes:
+                        break
+                conn.executemany('DELETE FROM responses WHERE url = ?', evict)
+
+    def refresh(self, url, expires):
+        """
+        Update the expiry date of a cached response, e.g. once revalidated with the server.
+
+        Parameters
+        ----------
+        url : str
+            The REST query URL
+        expires : datetime.datetime
+            The date after which the response is out of date
+        """
+        with self._connect() as conn:
+            self._save_accessed(conn)
+            conn.execute('UPDATE responses SET expires = ?, accessed = ? WHERE url = ?',
+                         (expires.isoformat(), time.time(), url))
+
+    def clear(self):
+        """Remove all cached responses"""
+        for file in self.rest_dir.glob('*'):
+            if re.fullmatch('[0-9a-f]{40}', file.name):  # Previous version cache file
+                file.unlink()
+        with self._lock:
+            self._accessed.clear()
+        if self.path.exists():
+            with self._connect() as conn:
+                conn.execute('DELETE FROM responses')
+
+    @property
+    def nbytes(self) -> int:
+        """int: The total size of the compressed responses"""
+        if not self.path.exists():
+            return 0
+        with self._connect() as conn:
+            return conn.execute('SELECT nbytes FROM stats').fetchone()[0]
+
+    def __len__(self):
+        if not self.path.exists():
+            return 0
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
 
 def _cache_response(method):
     """Decorator for the generic request method
 
     Caches the result of the query and on subsequent calls, returns cache instead of hitting the
-    database
+    database.  Expired GET responses with an ETag or Last-Modified validator are revalidated with
+    a conditional request; if the server responds 304 (Not Modified), the cached response is
+    returned and its expiry is renewed.
 
     Parameters
     ----------
@@ -105,39 +370,137 @@ def _cache_response(method):
         if args[0].__name__ != mode and mode != '*':
             return method(alyx_client, *args, **kwargs)
         # Check cache
-        rest_cache = one.params.get_rest_dir(alyx_client.base_url)
-        sha1 = hashlib.sha1()
-        sha1.update(bytes(args[1], 'utf-8'))
-        name = sha1.hexdigest()
-        # Reversible but length may exceed 255 chars
-        # name = base64.urlsafe_b64encode(args[2].encode('UTF-8')).decode('UTF-8')
-        files = list(rest_cache.glob(name))
+        rest_cache = alyx_client.rest_cache
         cached = None
-        if len(files) == 1 and not clobber:
+        validators = {}
+        entry = None if clobber else rest_cache.get(args[1])
+        if entry is not None:
             _logger.debug('loading REST response from cache')
-            with open(files[0], 'r') as f:
-                cached, when = json.load(f)
-            if datetime.fromisoformat(when) > datetime.now():
+            cached, when, validators = entry
+            if when > datetime.now():
                 return cached
+        reqfunction, rep = _conditional_request(args[0], validators)
         try:
-            response = method(alyx_client, *args, **kwargs)
+            response = method(alyx_client, reqfunction, *args[1:], **kwargs)
         except requests.exceptions.ConnectionError as ex:
             if cached and not clobber:
                 warnings.warn('Failed to connect, returning cached response', RuntimeWarning)
                 return cached
             raise ex  # No cache and can't connect to database; re-raise
 
+        expiry_datetime = datetime.now() + (timedelta() if expires is True else expires)
+        if entry is not None and getattr(rep.get('response'), 'status_code', None) == 304:
+            _logger.debug('cached REST response not modified; renewing expiry')
+            rest_cache.refresh(args[1], expiry_datetime)
+            return cached
         # Save response into cache
-        rest_cache.mkdir(exist_ok=True, parents=True)
         _logger.debug('caching REST response')
-        expiry_datetime = datetime.now() + (timedelta() if expires is True else expires)
-        with open(rest_cache / name, 'w') as f:
-            json.dump((response, expiry_datetime.isoformat()), f)
+        headers = getattr(rep.get('response'), 'headers', {})
+        validators = {k: headers[k] for k in ('ETag', 'Last-Modified') if k in headers}
+        rest_cache.put(args[1], response, expiry_datetime, validators)
         return response
 
     return wrapper_decorator
 
 
+def _conditional_request(reqfunction, validators):
+    """
+    Wrap a request function to make a conditional GET request and record the response.
+
+    Parameters
+    ----------
+    reqfunction : function
+        The request function, e.g. requests.Session.get
+    validators : dict
+        The 'ETag' and 'Last-Modified' headers of the cached response, if any
+
+    Returns
+    -------
+    function
+        The wrapped request function
+    dict
+        A map in which the requests.Response object is stored under the key 'response'
+    """
+    if reqfunction.__name__ != 'get':
+        return reqfunction, {}
+    conditions = {'If-None-Match': validators.get('ETag'),
+                  'If-Modified-Since': validators.get('Last-Modified')}
+    conditions = {k: v for k, v in conditions.items() if v}
+    rep = {}
+
+    @functools.wraps(reqfunction)
+    def wrapper(url, headers=None, **kwargs):
+        rep['response'] = reqfunction(url, headers={**(headers or {}), **conditions}, **kwargs)
+        return rep['response']
+    return wrapper, rep
+
+
+def _coalesce_requests(method):
+    """Decorator for the generic request method
+
+    Concurrent identical GET requests share a single request: the first call makes the request
+    and the calls made before it completes wait for and return a copy of its response.
+
+    Parameters
+    ----------
+    method : function
+        Function to wrap (i.e. AlyxClient._generic_request)
+
+    Returns
+    -------
+    function
+        Handle to wrapped method
+    """
+
+    @functools.wraps(method)
+    def wrapper_decorator(alyx_client, *args, **kwargs):
+        """
+        Request coalescing wrapper
+
+        Parameters
+        ----------
+        alyx_client : AlyxClient
+            An instance of the AlyxClient class
+        args : any
+            Positional arguments for applying to wrapped function
+        kwargs : any
+            Keyword arguments for applying to wrapped function
+
+        Returns
+        -------
+        dict
+            The REST response JSON, either from this request or an identical concurrent one
+        """
+        reqfunction, rest_query, *other = args
+        if (not alyx_client.coalesce or reqfunction.__name__ != 'get' or other
+                or kwargs.get('data') is not None or kwargs.get('files') is not None):
+            return method(alyx_client, *args, **kwargs)
+        # Requests with different cache arguments are not shared
+        rest_query = '/' + rest_query.replace(alyx_client.base_url, '').lstrip('/')
+        key = (rest_query, kwargs.get('expires'), kwargs.get('clobber', False))
+        with alyx_client._flights_lock:
+            flight = alyx_client._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = alyx_client._flights[key] = Future()
+            alyx_client.coalesce_counts['requests' if leader else 'coalesced'] += 1
+        if not leader:
+            _logger.debug('waiting for identical request in flight: %s', rest_query)
+            return copy.deepcopy(flight.result())
+        try:
+            response = method(alyx_client, *args, **kwargs)
+            flight.set_result(response)
+            return response
+        except BaseException as ex:
+            flight.set_exception(ex)
+            raise
+        finally:
+            with alyx_client._flights_lock:
+                del alyx_client._flights[key]
+
+    return wrapper_decorator
+
+
 @contextmanager
 def no_cache(ac=None):
     """Temporarily turn off the REST cache for a given Alyx instance.
@@ -174,12 +537,20 @@ class _PaginatedResponse(Mapping):
     This class allows to emulate a list from a paginated response.
     Provides cache functionality.
 
+    Pages are requested as they are indexed, and the next few pages are prefetched in background
+    threads while the current page is being consumed.  The threads are stopped once all pages
+    are loaded, or when the response is garbage collected.
+
     Examples
     --------
     >>> r = _PaginatedResponse(client, response)
+
+    Fetch all remaining pages concurrently
+
+    >>> records = r.to_list()
     """
 
-    def __init__(self, alyx, rep, cache_args=None):
+    def __init__(self, alyx, rep, cache_args=None, prefetch=PREFETCH_PAGES):
         """
         A paginated response cache object
 
@@ -191,10 +562,14 @@ class _PaginatedResponse(Mapping):
             A paginated REST response JSON dictionary
         cache_args : dict
             A dict of kwargs to pass to _cache_response decorator upon subsequent requests
+        prefetch : int
+            The maximum number of pages to request concurrently ahead of the page being accessed.
+            If 0, pages are requested one at a time, upon access.
         """
         self.alyx = alyx
         self.count = rep['count']
         self.limit = len(rep['results'])
+        self.prefetch = prefetch
         self._cache_args = cache_args or {}
         # store URL without pagination query params
         self.query = rep['next']
@@ -203,32 +578,261 @@ class _PaginatedResponse(Mapping):
         # fill the cache with results of the query
         for i in range(self.limit):
             self._cache[i] = rep['results'][i]
+        self._loaded = {0}  # The indices of the pages in the cache
+        self._pending = {}  # Map of page index to future of pages being requested
+        self._executor = None
+        self._finalizer = None  # Shuts down the executor if the response is garbage collected
+        self._lock = threading.Lock()
 
     def __len__(self):
         return self.count
 
+    @property
+    def n_pages(self) -> int:
+        """int: The total number of pages"""
+        return math.ceil(self.count / self.limit) if self.limit else 0
+
     def __getitem__(self, item):
         if isinstance(item, slice):
-            while None in self._cache[item]:
-                self.populate(self._cache[item].index(None))
-        elif self._cache[item] is None:
-            self.populate(item)
+            indices = range(*item.indices(self.count))
+            if indices:
+                self._load(range(min(indices) // self.limit, max(indices) // self.limit + 1))
+        else:
+            index = item + self.count if isinstance(item, int) and item < 0 else item
+            if 0 <= index < self.count and self._cache[index] is None:
+                self.populate(index)
         return self._cache[item]
 
-    def populate(self, idx):
-        offset = self.limit * math.floor(idx / self.limit)
+    def _fetch(self, page):
+        """Request a page of results"""
+        offset = self.limit * page
         query = update_url_params(self.query, {'limit': self.limit, 'offset': offset})
-        res = self.alyx._generic_request(requests.get, query, **self._cache_args)
+        res = self.alyx._generic_request(self.alyx.session.get, query, **self._cache_args)
         if self.count != res['count']:
             warnings.warn(
                 f'remote results for {urllib.parse.urlsplit(query).path} endpoint changed; '
                 f'results may be inconsistent', RuntimeWarning)
-        for i, r in enumerate(res['results'][:self.count - offset]):
-            self._cache[i + offset] = res['results'][i]
+        return res['results'][:self.count - offset]
+
+    def _load(self, pages):
+        """
+        Load pages into the cache, requesting them and the pages that follow concurrently.
+
+        Parameters
+        ----------
+        pages : range
+            The consecutive pages to load
+        """
+        futures = {}
+        if self.prefetch > 0:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.prefetch)
+                    self._finalizer = weakref.finalize(
+                        self, self._executor.shutdown, wait=False)
+                for page in range(pages[0], min(pages[-1] + self.prefetch + 1, self.n_pages)):
+                    if page not in self._loaded and page not in self._pending:
+                        self._pending[page] = self._executor.submit(self._fetch, page)
+                futures = {k: self._pending[k] for k in pages if k in self._pending}
+        for page in pages:
+            if page in self._loaded:
+                continue
+            try:
+                results = futures[page].result() if page in futures else self._fetch(page)
+            except Exception:
+                with self._lock:  # Request the page again upon next access
+                    self._pending.pop(page, None)
+                raise
+            offset = self.limit * page
+            with self._lock:
+                self._cache[offset:offset + len(results)] = results
+                self._loaded.add(page)
+                self._pending.pop(page, None)
+                if len(self._loaded) == self.n_pages and self._executor:
+                    self._finalizer()  # Shut down the executor
+                    self._executor = None
+
+    def populate(self, idx):
+        """Load the page of results containing a given index"""
+        page = idx // self.limit
+        self._load(range(page, page + 1))
 
     def __iter__(self):
-        for i in range(self.count):
-            yield self.__getitem__(i)
+        for page in range(self.n_pages):
+            self._load(range(page, page + 1))
+            yield from self._cache[self.limit * page:self.limit * (page + 1)]
+
+    def to_list(self) -> list:
+        """
+        Return all results, requesting the remaining pages concurrently.
+
+        Returns
+        -------
+        list
+            The full list of results
+        """
+        if self.n_pages:
+            self._load(range(self.n_pages))
+        return list(self._cache)
+
+    def to_frame(self, **kwargs) -> pd.DataFrame:
+        """
+        Return all results as a table, requesting the remaining pages concurrently.
+
+        Parameters
+        ----------
+        kwargs
+            Optional keyword arguments to pass to pandas.DataFrame.from_records
+
+        Returns
+        -------
+        pandas.DataFrame
+            A table of results, one row per record
+        """
+        return pd.DataFrame.from_records(self.to_list(), **kwargs)
+
+
+def _iter_json(chunks, key='results', members=None):
+    """
+    Decode a JSON document incrementally, yielding the elements of an array as they are decoded.
+
+    Only the array elements are yielded, so the full document and decoded object tree are never
+    held in memory at once.
+
+    Parameters
+    ----------
+    chunks : iterable of str
+        The JSON document text in chunks of any size, e.g. from a streamed HTTP response
+    key : str
+        If the document is an object, the name of the member whose array elements to yield.  If
+        the document is an array, its elements are yielded.
+    members : dict
+        An optional dict to which the other members of a document object are added as they are
+        decoded.  Members that follow the array are only added once the generator is exhausted.
+
+    Yields
+    ------
+    any
+        The decoded array elements
+
+    Examples
+    --------
+    >>> members = {}
+    >>> chunks = ['{"count": 2, "results": [{"a"', ': 1}, 2]}']
+    >>> records = list(_iter_json(chunks, 'results', members))
+    >>> records, members
+    ([{'a': 1}, 2], {'count': 2})
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    members = {} if members is None else members
+    buffer, pos = '', 0
+    exhausted = False
+
+    def more(min_chars=1):
+        """Read at least min_chars more characters, returning false if the text is exhausted"""
+        nonlocal buffer, pos, exhausted
+        parts, n = [buffer[pos:]], 0
+        for chunk in chunks:
+            parts.append(chunk)
+            n += len(chunk)
+            if n >= min_chars:
+                break
+        else:
+            exhausted = True
+        buffer, pos = ''.join(parts), 0
+        return n > 0
+
+    def next_char():
+        """Return the next non-whitespace character without consuming it"""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if exhausted or not more():
+                raise json.JSONDecodeError('Unexpected end of document', buffer, pos)
+
+    def expect(*chars):
+        """Consume the next non-whitespace character, which must be one of chars"""
+        nonlocal pos
+        char = next_char()
+        if char not in chars:
+            raise json.JSONDecodeError(f'Expected one of {chars}', buffer, pos)
+        pos += 1
+        return char
+
+    def value():
+        """Decode the next value, reading more text until it is complete"""
+        nonlocal pos
+        next_char()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+                # A number at the end of the text read so far may continue in the next chunk
+                if end < len(buffer) or exhausted:
+                    pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+            # Read at least as much again so that large values are decoded in linear time
+            more(max(len(buffer) - pos, 1))
+
+    def elements():
+        """Yield the elements of the array at the current position"""
+        nonlocal pos
+        expect('[')
+        if next_char() == ']':
+            pos += 1
+            return
+        while True:
+            yield value()
+            if expect(',', ']') == ']':
+                return
+
+    if next_char() == '[':
+        yield from elements()
+    else:
+        expect('{')
+        if next_char() == '}':
+            pos += 1
+            return
+        while True:
+            name = value()
+            expect(':')
+            if name == key and next_char() == '[':
+                yield from elements()
+            else:
+                members[name] = value()
+            if expect(',', '}') == '}':
+                break
+
+
+def _iter_text(response, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the decoded text of a streamed response in chunks"""
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+    for chunk in response.iter_content(chunk_size):  # Decompresses gzip encoded content
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def _record_id(record) -> str:
+    """Return the UUID of a REST record from its 'id' field or URL"""
+    return record.get('id') or record['url'].rstrip('/').split('/')[-1]
+
+
+def _http_error(r, rest_query) -> requests.HTTPError:
+    """Return an HTTPError for a failed request, with the error details from the response"""
+    _logger.debug('Response text: ' + r.text)
+    try:
+        message = json.loads(r.text)
+        message.pop('status_code', None)  # Get status code from response object instead
+        message = message.get('detail') or message  # Get details if available
+    except json.decoder.JSONDecodeError:
+        message = r.text
+    return requests.HTTPError(r.status_code, rest_query, message, response=r)
 
 
 def update_url_params(url: str, params: dict) -> str:
@@ -290,11 +894,250 @@ def http_download_file_list(links_to_file_list, **kwargs):
     return file_names_list
 
 
+class _DownloadJournal:
+    """
+    The progress of a partial download, saved next to the partial file so that it may be resumed.
+
+    The journal records the number of bytes written to the partial file, their MD5 hash and the
+    validator (ETag or Last-Modified) of the remote file.  As the state of a running MD5 hash can't
+    be saved, it is restored by hashing the partial file upon resuming, and the result is checked
+    against the journal.
+
+    A file downloaded as several byte ranges concurrently is written to a preallocated partial
+    file, and the journal records the remaining bytes of each range instead of the MD5 hash.
+    """
+    def __init__(self, part_file, url):
+        """
+        Parameters
+        ----------
+        part_file : str, pathlib.Path
+            The partial file path
+        url : str
+            The URL of the file being downloaded
+        """
+        self.part_file = Path(part_file)
+        self.file = Path(f'{part_file}.json')
+        self.url = url
+        self.reset()
+
+    def reset(self):
+        """Restart the download from the first byte"""
+        self.offset = 0  # The number of bytes written to the partial file
+        self.md5 = hashlib.md5()  # The hash of the bytes written
+        self.size = None  # The total number of bytes to download, if known
+        self.validator = None  # The ETag or Last-Modified header of the remote file
+        self.ranges = None  # The [next byte, stop byte) of each range, if downloaded in parallel
+
+    def split(self, size, n_ranges):
+        """Download a file of a given size as several byte ranges"""
+        self.size = size
+        bounds = [size * i // n_ranges for i in range(n_ranges + 1)]
+        self.ranges = [[start, stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    def load(self) -> bool:
+        """
+        Restore the progress of a previous attempt.
+
+        Any bytes written to the partial file after the last saved offset are discarded.
+
+        Returns
+        -------
+        bool
+            True if the download may be resumed, otherwise the download is restarted
+        """
+        self.reset()
+        try:
+            journal = json.loads(self.file.read_text())
+            if journal['url'] != self.url:
+                return False
+            if journal.get('ranges') is not None:  # The partial file is preallocated
+                if self.part_file.stat().st_size != journal['size']:
+                    return False
+                self.offset, self.size, self.validator, self.ranges = (
+                    journal['offset'], journal['size'], journal['validator'], journal['ranges'])
+                return True
+            if self.part_file.stat().st_size < journal['offset']:
+                return False
+            with open(self.part_file, 'r+b') as f:
+                f.truncate(journal['offset'])
+                for buffer in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                    self.md5.update(buffer)
+        except (OSError, ValueError, KeyError, TypeError):
+            self.reset()
+            return False
+        if self.md5.hexdigest() != journal['md5']:
+            self.reset()
+            return False
+        self.offset, self.size, self.validator = (journal['offset'], journal['size'],
+                                                  journal['validator'])
+        return True
+
+    def save(self):
+        """Save the progress of the download; the partial file should be flushed beforehand"""
+        journal = {'url': self.url, 'offset': self.offset, 'md5': self.md5.hexdigest(),
+                   'size': self.size, 'validator': self.validator, 'ranges': self.ranges}
+        tmp = self.file.with_name(self.file.name + '.tmp')
+        tmp.write_text(json.dumps(journal))
+        os.replace(tmp, self.file)  # Atomic so that the journal is never partially written
+
+    def remove(self):
+        """Remove the journal"""
+        if self.file.exists():
+            self.file.unlink()
+
+
+def _download_part(journal, url, chunks, get, headers, pbar) -> bool:
+    """
+    Request the remainder of a partial download and append it to the partial file.
+
+    Parameters
+    ----------
+    journal : _DownloadJournal
+        The progress of the download, updated as the bytes are written
+    url : str
+        The URL of the file
+    chunks : tuple of ints
+        The first byte and number of bytes to download, or None for the whole file
+    get : function
+        A function for making the GET request, e.g. requests.get
+    headers : dict
+        The request headers
+    pbar : tqdm.tqdm
+        A progress bar to update with the number of bytes received
+
+    Returns
+    -------
+    bool
+        True if the download is complete, or false if it should be restarted from the first byte
+    """
+    first_byte, n_bytes = chunks or (0, None)
+    start = first_byte + journal.offset
+    headers = dict(headers)
+    if start or n_bytes is not None:
+        stop = '' if n_bytes is None else first_byte + n_bytes - 1
+        headers['Range'] = f'bytes={start}-{stop}'
+        if journal.offset and journal.validator:
+            headers['If-Range'] = journal.validator  # Respond with the whole file if changed
+    with get(url, headers=headers, stream=True) as r:
+        if r.status_code == 416 and journal.offset:  # Offset beyond the end of a changed file
+            journal.reset()
+            return False
+        if r.status_code >= 400:
+            _logger.error(f'HTTP Error {r.status_code}: {r.reason} {url}')
+            raise HTTPError(url, r.status_code, r.reason, r.headers, None)
+        length = int(r.headers.get('Content-Length', 0)) or None
+        skip = 0  # The number of bytes to discard from the start of the response
+        if r.status_code != 206:  # Range not supported or the file changed since the last attempt
+            journal.reset()
+            skip = first_byte
+            if length is not None:
+                length = max(length - first_byte, 0)
+        if n_bytes is not None:
+            length = min(length or n_bytes, n_bytes - journal.offset)
+        if not journal.offset:
+            journal.size = length
+            journal.validator = r.headers.get('ETag') or r.headers.get('Last-Modified')
+        with open(journal.part_file, 'ab' if journal.offset else 'wb') as f:
+            for buffer in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if skip:
+                    buffer, skip = buffer[skip:], max(skip - len(buffer), 0)
+                if journal.size is not None:
+                    buffer = buffer[:journal.size - journal.offset]
+                f.write(buffer)
+                f.flush()
+                journal.md5.update(buffer)
+                journal.offset += len(buffer)
+                pbar.update(len(buffer))
+                if journal.offset == journal.size:  # Any remaining bytes are outside the range
+                    break
+                journal.save()  # Not needed once complete, e.g. for files of a single chunk
+    return True
+
+
+def _download_ranges(journal, url, get, headers, pbar) -> bool:
+    """
+    Download the remaining byte ranges of a file concurrently into the preallocated partial file.
+
+    Parameters
+    ----------
+    journal : _DownloadJournal
+        The progress of the download, with the remaining byte ranges, updated as bytes are written
+    url : str
+        The URL of the file
+    get : function
+        A function for making the GET request, e.g. requests.get
+    headers : dict
+        The request headers
+    pbar : tqdm.tqdm
+        A progress bar to update with the number of bytes received
+
+    Returns
+    -------
+    bool
+        True if the download is complete, or false if it should be restarted as a single stream,
+        e.g. because the server ignores the Range header, or the file changed
+    """
+    with open(journal.part_file, 'ab') as f:
+        f.truncate(journal.size)
+    lock = threading.Lock()
+
+    def fetch(rng):
+        start, stop = rng
+        h = dict(headers, Range=f'bytes={start}-{stop - 1}')
+        if journal.validator:
+            h['If-Range'] = journal.validator  # Respond with the whole file if changed
+        with get(url, headers=h, stream=True) as r:
+            if r.status_code >= 400:
+                _logger.error(f'HTTP Error {r.status_code}: {r.reason} {url}')
+                raise HTTPError(url, r.status_code, r.reason, r.headers, None)
+            total = r.headers.get('Content-Range', '').split('/')[-1]
+            validator = r.headers.get('ETag') or r.headers.get('Last-Modified')
+            with lock:
+                journal.validator = journal.validator or validator
+                if (r.status_code != 206 or total != str(journal.size)
+                        or validator != journal.validator):
+                    return False
+            with open(journal.part_file, 'r+b') as f:
+                f.seek(start)
+                for buffer in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    buffer = buffer[:stop - start]
+                    f.write(buffer)
+                    f.flush()
+                    start += len(buffer)
+                    with lock:
+                        rng[0] = start
+                        journal.offset += len(buffer)
+                        journal.save()
+                    pbar.update(len(buffer))
+                    if start == stop:
+                        break
+        return True
+
+    pending = [rng for rng in journal.ranges if rng[0] < rng[1]]
+    with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+        futures = [executor.submit(fetch, rng) for rng in pending]
+    if all(future.result() for future in futures):
+        return True
+    _logger.warning(f'Byte ranges not supported for {url}; downloading as a single stream')
+    journal.reset()
+    return False
+
+
 def http_download_file(full_link_to_file, chunks=None, *, clobber=False, silent=False,
-                       username='', password='', cache_dir='', return_md5=False, headers=None):
+                       username='', password='', cache_dir='', return_md5=False, headers=None,
+                       session=None, pbar=None, file_size=None, hash=None, retries=N_RETRIES,
+                       n_ranges=1, parallel_size=PARALLEL_DOWNLOAD_SIZE):
     """
     Download a file from a remote HTTP server.
 
+    The file is downloaded to a partial file ('.part' extension), which is moved to the file name
+    once complete and checked.  The progress is saved so that a failed or interrupted download is
+    resumed from the last byte received, with a Range request, by the next attempt.
+
+    Files of a known size of at least `parallel_size` bytes may be downloaded as several byte
+    ranges concurrently, which are written in place to a preallocated file.  If the server
+    doesn't support Range requests, the file is downloaded as a single stream.
+
     Parameters
     ----------
     full_link_to_file : str
@@ -315,11 +1158,35 @@ def http_download_file(full_link_to_file, chunks=None, *, clobber=False, silent=
         If True an MD5 hash of the file is additionally returned
     headers : list of dicts
         Additional headers to add to the request (auth tokens etc.)
+    session : requests.Session
+        A session through which to make the request, e.g. to reuse its pooled connections.  If
+        None, a new connection is opened.
+    pbar : tqdm.tqdm
+        A progress bar to update with the number of bytes received, e.g. one shared by
+        concurrent downloads.  If None, a progress bar is displayed for this file unless silent
+    file_size : int
+        The expected file size in bytes
+    hash : str
+        The expected MD5 hash of the file
+    retries : int
+        The number of times a download is resumed after a connection error
+    n_ranges : int
+        The number of byte ranges to download concurrently; the expected file_size must be given
+    parallel_size : int
+        The minimum file size in bytes for which the file is downloaded in n_ranges byte ranges
 
     Returns
     -------
     pathlib.Path
         The full file path of the downloaded file
+
+    Raises
+    ------
+    urllib.error.HTTPError
+        The server responded with an error status
+    one.alf.exceptions.ALFIntegrityError
+        The downloaded file size or hash does not match the expected file size or hash.  The
+        partial file is removed.
     """
     if not full_link_to_file:
         return ''
@@ -332,67 +1199,66 @@ def http_download_file(full_link_to_file, chunks=None, *, clobber=False, silent=
     if not cache_dir:
         cache_dir = str(Path.home().joinpath('Downloads'))
 
-    # This is the local file name
-    file_name = str(cache_dir) + os.sep + os.path.basename(full_link_to_file)
+    # This is the local file name (excluding any query string)
+    file_name = str(cache_dir) + os.sep + os.path.basename(urllib.parse.quote(surl.path))
 
     # do not overwrite an existing file unless specified
     if not clobber and os.path.exists(file_name):
         return (file_name, hashfile.md5(file_name)) if return_md5 else file_name
 
-    # This should be the base url you wanted to access.
-    baseurl = os.path.split(str(full_link_to_file))[0]
-
-    # Create a password manager
-    manager = urllib.request.HTTPPasswordMgrWithDefaultRealm()
-    if username and password:
-        manager.add_password(None, baseurl, username, password)
-
-    # Create an authentication handler using the password manager
-    auth = urllib.request.HTTPBasicAuthHandler(manager)
-
-    # Create an opener that will replace the default urlopen method on further calls
-    opener = urllib.request.build_opener(auth)
-    urllib.request.install_opener(opener)
-
-    # Support for partial download.
-    req = urllib.request.Request(full_link_to_file)
-    if chunks is not None:
-        first_byte, n_bytes = chunks
-        req.add_header('Range', 'bytes=%d-%d' % (first_byte, first_byte + n_bytes - 1))
-
-    # add additional headers
-    if headers is not None:
-        for k in headers:
-            req.add_header(k, headers[k])
-
-    # Open the url and get the length
-    try:
-        u = urllib.request.urlopen(req)
-    except HTTPError as e:
-        _logger.error(f'{str(e)} {full_link_to_file}')
-        raise e
-
-    file_size = int(u.getheader('Content-length'))
-    if not silent:
-        print(f'Downloading: {file_name} Bytes: {file_size}')
-    file_size_dl = 0
-    block_sz = 8192 * 64 * 8
-
-    md5 = hashlib.md5()
-    f = open(file_name, 'wb')
-    with tqdm(total=file_size, disable=silent) as pbar:
-        while True:
-            buffer = u.read(block_sz)
-            if not buffer:
-                break
-            file_size_dl += len(buffer)
-            f.write(buffer)
-            if return_md5:
-                md5.update(buffer)
-            pbar.update(file_size_dl)
-    f.close()
-
-    return (file_name, md5.hexdigest()) if return_md5 else file_name
+    # The auth and headers are passed with each request, leaving the session unchanged so that
+    # it may be shared by concurrent downloads.  The file is requested unencoded so that the
+    # bytes received are those of the file.
+    req_headers = {'Accept-Encoding': 'identity', **(headers or {})}
+    auth = (username, password) if username and password else None
+    get = functools.partial((session or requests).get, auth=auth)
+
+    journal = _DownloadJournal(file_name + '.part', full_link_to_file)
+    if journal.load():
+        _logger.info(f'Resuming download of {file_name} from byte {journal.offset}')
+    elif n_ranges > 1 and chunks is None and (file_size or 0) >= max(parallel_size, n_ranges):
+        journal.split(file_size, n_ranges)
+    if not silent and pbar is None:
+        print(f'Downloading: {file_name} Bytes: {file_size or journal.size}')
+    with tqdm(total=file_size or journal.size, initial=journal.offset,
+              disable=silent or pbar is not None) as own_pbar:
+        attempt = 0
+        while journal.size is None or journal.offset < journal.size:
+            offset = journal.offset
+            try:
+                if journal.ranges is not None:
+                    if not _download_ranges(journal, full_link_to_file, get, req_headers,
+                                            pbar or own_pbar):
+                        continue  # Restart as a single stream
+                elif not _download_part(journal, full_link_to_file, chunks, get, req_headers,
+                                        pbar or own_pbar):
+                    continue  # Restart from the first byte
+                if journal.size is None:
+                    break  # Complete, with the file size unknown until now
+                if journal.offset == offset:
+                    raise requests.exceptions.ConnectionError(
+                        f'no bytes received after byte {offset}')
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError) as ex:
+                if attempt == retries:
+                    raise ex
+                attempt += 1
+                _logger.warning(f'{ex}: resuming download of {file_name} from byte '
+                                f'{journal.offset} (attempt {attempt} of {retries})')
+
+    # Check the file before moving it into place
+    md5 = journal.md5.hexdigest() if journal.ranges is None else hashfile.md5(journal.part_file)
+    mismatch = (file_size and journal.offset != file_size, hash and md5 != hash)
+    if any(mismatch):
+        journal.part_file.unlink()
+        journal.remove()
+        raise alferr.ALFIntegrityError(
+            f'{full_link_to_file} ' + ('size' if mismatch[0] else 'MD5 hash') +
+            ' does not match the dataset record', terse=True)
+    os.replace(journal.part_file, file_name)
+    journal.remove()
+
+    return (file_name, md5) if return_md5 else file_name
 
 
 def file_record_to_url(file_records) -> list:
@@ -450,8 +1316,9 @@ class AlyxClient():
     """str: The Alyx database URL"""
     base_url = None
 
-    def __init__(self, base_url=None, username=None, password=None,
-                 cache_dir=None, silent=False, cache_rest='GET', stay_logged_in=True):
+    def __init__(self, base_url=None, username=None, password=None, cache_dir=None,
+                 silent=False, cache_rest='GET', stay_logged_in=True, pool_size=POOL_SIZE,
+                 retries=N_RETRIES):
         """
         Create a client instance that allows to GET and POST to the Alyx server.
         For One, constructor attempts to authenticate with credentials in params.py.
@@ -473,8 +1340,23 @@ class AlyxClient():
             Which type of http method to apply cache to; if '*', all requests are cached
         stay_logged_in : bool
             If true, auth token is cached
+        pool_size : int
+            The maximum number of connections to the Alyx server, and to the file server, kept
+            alive for reuse; should be at least the number of threads making concurrent requests
+        retries : int
+            The number of times a request is retried upon connection errors and 502, 503 or 504
+            responses, with exponential backoff.  Only idempotent requests are retried after the
+            request was sent.
         """
         self.silent = silent
+        # A connection pool shared by all REST requests and file downloads, including those from
+        # other threads.  Connections to both the Alyx server and the file server are kept.
+        retry = Retry(total=retries, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                      raise_on_status=False)
+        self._adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size,
+                                    max_retries=retry)
+        self._local = threading.local()
+        self._rest_cache = None  # Created upon first access
         self._par = one.params.get(client=base_url, silent=self.silent)
         self.base_url = base_url or self._par.ALYX_URL
         self._par = self._par.set('CACHE_DIR', cache_dir or self._par.CACHE_DIR)
@@ -488,6 +1370,17 @@ class AlyxClient():
         # turned off.
         self.default_expiry = timedelta(days=1)
         self.cache_mode = cache_rest
+        self.rest_cache_size = REST_CACHE_MAX_BYTES  # The maximum size of cached responses
+        self.prefetch_pages = PREFETCH_PAGES  # The number of pages to request concurrently
+        # Files of at least this many bytes are downloaded as several byte ranges concurrently
+        self.parallel_download_size = PARALLEL_DOWNLOAD_SIZE
+        self.download_ranges = N_DOWNLOAD_RANGES  # The number of byte ranges of large files
+        # If true, concurrent identical GET requests share a single request
+        self.coalesce = True
+        # The number of GET requests made and of those that shared an identical request
+        self.coalesce_counts = Counter(requests=0, coalesced=0)
+        self._flights = {}  # Map of GET requests in flight to their future response
+        self._flights_lock = threading.Lock()
         self._obj_id = id(self)
 
     @property
@@ -503,6 +1396,48 @@ class AlyxClient():
         """pathlib.Path: The location of the downloaded file cache"""
         return Path(self._par.CACHE_DIR)
 
+    @property
+    def rest_cache(self):
+        """RestCache: The REST response cache for the Alyx database"""
+        rest_dir = one.params.get_rest_dir(self.base_url)
+        if self._rest_cache is None or self._rest_cache.rest_dir != rest_dir:
+            if self._rest_cache is not None:
+                self._rest_cache.flush()
+            self._rest_cache = RestCache(rest_dir, self.rest_cache_size)
+        self._rest_cache.max_bytes = self.rest_cache_size
+        return self._rest_cache
+
+    @property
+    def session(self):
+        """requests.Session: The HTTP session of the current thread
+
+        Each thread has its own session, as sessions are not thread safe, however all sessions
+        share the client's connection pool so that connections are kept alive and reused.
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            # Reading the proxy and CA bundle settings from the environment upon each request is
+            # slow, so they are read once for the Alyx and file servers
+            for url in filter(None, {self.base_url, self._par.HTTP_DATA_SERVER}):
+                env = session.merge_environment_settings(url, {}, None, None, None)
+                proxy = requests.utils.select_proxy(url, env['proxies'])
+                if proxy:
+                    parts = urllib.parse.urlsplit(url)
+                    session.proxies[f'{parts.scheme}://{parts.hostname}'] = proxy
+                session.verify = env['verify']
+            session.trust_env = False
+            self._local.session = session
+        return session
+
+    def close(self):
+        """Close all pooled connections to the Alyx server and file server"""
+        self._adapter.close()
+        if self._rest_cache is not None:
+            self._rest_cache.flush()
+
     @property
     def is_logged_in(self):
         """bool: Check if user logged into Alyx database; True if user is authenticated"""
@@ -519,6 +1454,7 @@ class AlyxClient():
         EXCLUDE = ('_type', '_meta', '', 'auth-token')
         return sorted(x for x in self.rest_schemes.keys() if x not in EXCLUDE)
 
+    @_coalesce_requests
     @_cache_response
     def _generic_request(self, reqfunction, rest_query, data=None, files=None):
         if not self._token and (not self._headers or 'Authorization' not in self._headers):
@@ -535,21 +1471,13 @@ class AlyxClient():
         if rest_query.startswith('/docs'):
             # the mixed accept application may cause errors sometimes, only necessary for the docs
             headers['Accept'] = 'application/coreapi+json'
-        r = reqfunction(self.base_url + rest_query, stream=True, headers=headers,
-                        data=data, files=files)
+        r = reqfunction(self.base_url + rest_query, headers=headers, data=data, files=files)
         if r and r.status_code in (200, 201):
             return json.loads(r.text)
-        elif r and r.status_code == 204:
+        elif r and r.status_code in (204, 304):  # No content or not modified
             return
         else:
-            _logger.debug('Response text: ' + r.text)
-            try:
-                message = json.loads(r.text)
-                message.pop('status_code', None)  # Get status code from response object instead
-                message = message.get('detail') or message  # Get details if available
-            except json.decoder.JSONDecodeError:
-                message = r.text
-            raise requests.HTTPError(r.status_code, rest_query, message, response=r)
+            raise _http_error(r, rest_query)
 
     def authenticate(self, username=None, password=None, cache_token=True, force=False):
         """
@@ -667,12 +1595,17 @@ class AlyxClient():
         >>> AlyxClient.delete(
         ...     'https://alyx.example.com/endpoint/c617562d-c107-432e-a8ee-682c17f9e698')
         """
-        return self._generic_request(requests.delete, rest_query)
+        return self._generic_request(self.session.delete, rest_query)
 
     def download_file(self, url, **kwargs):
         """
         Downloads a file on the Alyx server from a file record REST field URL
 
+        Files are downloaded through the client's pooled connections, so this method may be
+        called concurrently from several threads.  Files of a known size of at least
+        `parallel_download_size` bytes are downloaded as `download_ranges` byte ranges
+        concurrently.
+
         Parameters
         ----------
         url : str, list
@@ -693,8 +1626,11 @@ class AlyxClient():
         pars = dict(
             silent=kwargs.pop('silent', self.silent),
             cache_dir=kwargs.pop('cache_dir', self._par.CACHE_DIR),
+            n_ranges=kwargs.pop('n_ranges', self.download_ranges),
+            parallel_size=kwargs.pop('parallel_size', self.parallel_download_size),
             username=self._par.HTTP_DATA_SERVER_LOGIN,
             password=self._par.HTTP_DATA_SERVER_PWD,
+            session=self.session,
             **kwargs
         )
         try:
@@ -706,26 +1642,51 @@ class AlyxClient():
             raise ex
         return files
 
-    def download_cache_tables(self):
+    def download_cache_tables(self, since=None):
         """Downloads the Alyx cache tables to the local data cache directory
 
+        Parameters
+        ----------
+        since : str, datetime.datetime
+            If provided, only the table rows inserted, updated or deleted after this date are
+            downloaded (from the 'cache/delta.zip' endpoint) and merged into the existing cache
+            tables.  This should be the date the local tables were created.
+
         Returns
         -------
             List of parquet table file paths
+
+        Raises
+        ------
+        urllib.error.HTTPError
+            The cache could not be downloaded, e.g. the delta endpoint isn't supported (404)
+        FileNotFoundError
+            The local cache tables to merge a delta into do not exist
+        ValueError
+            The delta tables do not match the local cache tables
         """
         # query the database for the latest cache; expires=None overrides cached response
         self.cache_dir.mkdir(exist_ok=True)
         if not self.is_logged_in:
             self.authenticate()
+        if since is None:
+            url = f'{self.base_url}/cache.zip'
+        else:
+            since = since.isoformat() if isinstance(since, datetime) else since
+            url = f'{self.base_url}/cache/delta.zip?since={urllib.parse.quote(since)}'
         with tempfile.TemporaryDirectory(dir=self.cache_dir) as tmp:
-            file = http_download_file(f'{self.base_url}/cache.zip',
+            file = http_download_file(url,
                                       headers=self._headers,
+                                      session=self.session,
                                       silent=self.silent,
                                       cache_dir=tmp,
                                       clobber=True)
             with zipfile.ZipFile(file, 'r') as zipped:
                 files = zipped.namelist()
-                zipped.extractall(self.cache_dir)
+                zipped.extractall(self.cache_dir if since is None else tmp)
+            if since is not None:
+                tables = tuple(Path(x).stem for x in files if x.endswith('.pqt'))
+                return merge_cache_tables(self.cache_dir, tmp, tables=tables)
         return [Path(self.cache_dir, table) for table in files]
 
     def _validate_file_url(self, url):
@@ -792,15 +1753,158 @@ class AlyxClient():
         -------
         JSON interpreted dictionary from response
         """
-        rep = self._generic_request(requests.get, rest_query, **kwargs)
+        rep = self._generic_request(self.session.get, rest_query, **kwargs)
         if isinstance(rep, dict) and list(rep.keys()) == ['count', 'next', 'previous', 'results']:
             if len(rep['results']) < rep['count']:
                 cache_args = {k: v for k, v in kwargs.items() if k in ('clobber', 'expires')}
-                rep = _PaginatedResponse(self, rep, cache_args)
+                rep = _PaginatedResponse(self, rep, cache_args, self.prefetch_pages)
             else:
                 rep = rep['results']
         return rep
 
+    def stream(self, rest_query, key='results'):
+        """
+        Sends a GET request to the Alyx server, decoding the JSON response as it is received.
+
+        The elements of the response array are decoded and yielded one at a time, so that large
+        responses may be processed without holding the full response text and decoded list in
+        memory.  The pages of a paginated list are requested in turn.  Gzip-encoded responses are
+        decoded.  Unlike AlyxClient.get, responses are not cached.
+
+        Parameters
+        ----------
+        rest_query : str
+            A REST URL path, e.g. '/datasets?session=<eid>'
+        key : str
+            If the response is an object, the name of the member whose array elements to yield,
+            e.g. 'data_dataset_session_related' for a sessions read.  If the response is an
+            array, its elements are yielded.
+
+        Returns
+        -------
+        dict
+            The response.  The `key` value is a generator of the array elements.  The other
+            members are added as they are decoded, so the members that follow the array are only
+            available once the generator is exhausted.
+
+        Examples
+        --------
+        Build a datasets table as the records are received
+
+        >>> rep = alyx.stream('/datasets?subject=foobar')
+        >>> datasets = one.util.datasets2records(rep['results'])
+
+        Stream the datasets of a session
+
+        >>> ses = alyx.stream(f'/sessions/{eid}', key='data_dataset_session_related')
+        >>> session, datasets = one.util.ses2records(ses)
+        """
+        rep = {}
+        rep[key] = self._stream_pages(rest_query, key, rep)
+        return rep
+
+    def list_in(self, endpoint, field, values, chunk_size=BATCH_SIZE, **kwargs) -> list:
+        """
+        Fetch the records of a REST endpoint whose field matches any of many values, in batches.
+
+        The values are split into chunks that are each requested with a single '<field>__in'
+        django list query.  The chunks are requested concurrently.  The number of values per
+        chunk is limited so that the URL-encoded query doesn't exceed MAX_QUERY_LENGTH
+        characters, as long URLs may be rejected by servers and proxies.
+
+        Parameters
+        ----------
+        endpoint : str
+            A REST endpoint, e.g. 'sessions' or 'datasets'
+        field : str
+            The record field to filter by, e.g. 'id' or 'session'
+        values : iterable of str
+            The field values, e.g. UUIDs
+        chunk_size : int
+            The maximum number of values per request.  Fewer values are requested at once if the
+            query would otherwise exceed MAX_QUERY_LENGTH.
+        kwargs
+            Other filters and keyword arguments to pass to AlyxClient.rest
+
+        Returns
+        -------
+        list
+            The matching records, in the order of the chunks requested
+
+        Examples
+        --------
+        >>> datasets = alyx.list_in('datasets', 'session', eids)
+        """
+        unique = list(dict.fromkeys(str(x) for x in values))
+        if not unique:
+            return []
+        django = kwargs.pop('django', None)
+        prefix = f'{django},{field}__in,' if django else f'{field}__in,'
+        # Each value takes its URL-encoded length plus an encoded comma, i.e. '%2C'
+        quote = functools.partial(urllib.parse.quote, safe='')
+        value_length = max(map(len, map(quote, unique))) + 3
+        max_values = (MAX_QUERY_LENGTH - len(quote(prefix + '[]')) + 3) // value_length
+        chunk_size = max(1, min(chunk_size, max_values))
+        chunks = [unique[i:i + chunk_size] for i in range(0, len(unique), chunk_size)]
+
+        def fetch(chunk):
+            query = prefix + '[' + ','.join(chunk) + ']'
+            rep = self.rest(endpoint, 'list', django=query, **kwargs)
+            return rep.to_list() if isinstance(rep, _PaginatedResponse) else rep
+
+        self.rest_schemes  # Fetch the endpoint schemes once, before the threads need them
+        with ThreadPoolExecutor(max_workers=min(N_BATCH_THREADS, len(chunks))) as executor:
+            return [r for chunk in executor.map(fetch, chunks) for r in chunk]
+
+    def list_by_id(self, endpoint, ids, chunk_size=BATCH_SIZE, **kwargs):
+        """
+        Fetch the records of many IDs from a REST endpoint in batches.
+
+        The IDs are requested in chunks with 'id__in' django list queries (see
+        AlyxClient.list_in), rather than one read request per ID.
+
+        Parameters
+        ----------
+        endpoint : str
+            A REST endpoint, e.g. 'sessions' or 'datasets'
+        ids : iterable of str
+            The record UUIDs
+        chunk_size : int
+            The maximum number of IDs per request.  Fewer IDs are requested at once if the query
+            would otherwise exceed MAX_QUERY_LENGTH.
+        kwargs
+            Other filters and keyword arguments to pass to AlyxClient.rest
+
+        Returns
+        -------
+        list
+            The records in the order of the input IDs, with None for IDs that were not found
+
+        Examples
+        --------
+        >>> sessions = alyx.list_by_id('sessions', eids)
+        >>> datasets = alyx.list_by_id('datasets', dataset_ids, exists=True)
+        """
+        ids = [str(x) for x in ids]
+        records = self.list_in(endpoint, 'id', ids, chunk_size, **kwargs)
+        records = {_record_id(r): r for r in records}
+        return [records.get(x) for x in ids]
+
+    def _stream_pages(self, rest_query, key, members):
+        """Yield the array elements of a response, and those of any subsequent pages"""
+        if not self._token and (not self._headers or 'Authorization' not in self._headers):
+            self.authenticate(username=self.user)
+        while rest_query:
+            rest_query = '/' + rest_query.replace(self.base_url, '').lstrip('/')
+            _logger.debug(f'streaming {self.base_url + rest_query}')
+            r = self.session.get(self.base_url + rest_query, headers=self._headers, stream=True)
+            with r:  # Release the connection if the generator is closed early
+                if r.status_code != 200:
+                    raise _http_error(r, rest_query)
+                members.pop('next', None)
+                yield from _iter_json(_iter_text(r), key, members)
+            rest_query = members.get('next') if key == 'results' else None
+
     def patch(self, rest_query, data=None, files=None):
         """
         Sends a PATCH request to the Alyx server.
@@ -820,7 +1924,7 @@ class AlyxClient():
         -------
         Response object
         """
-        return self._generic_request(requests.patch, rest_query, data=data, files=files)
+        return self._generic_request(self.session.patch, rest_query, data=data, files=files)
 
     def post(self, rest_query, data=None, files=None):
         """
@@ -841,7 +1945,7 @@ class AlyxClient():
         -------
         Response object
         """
-        return self._generic_request(requests.post, rest_query, data=data, files=files)
+        return self._generic_request(self.session.post, rest_query, data=data, files=files)
 
     def put(self, rest_query, data=None, files=None):
         """
@@ -863,7 +1967,7 @@ class AlyxClient():
         requests.Response
             Response object
         """
-        return self._generic_request(requests.put, rest_query, data=data, files=files)
+        return self._generic_request(self.session.put, rest_query, data=data, files=files)
 
     def rest(self, url=None, action=None, id=None, data=None, files=None,
              no_cache=False, **kwargs):
@@ -1139,6 +2243,5 @@ class AlyxClient():
         return _[field_name]
 
     def clear_rest_cache(self):
-        """Clear all REST response cache files for the base url"""
-        for file in one.params.get_rest_dir(self.base_url).glob('*'):
-            file.unlink()
+        """Clear all cached REST responses for the base url"""
+        self.rest_cache.clear()